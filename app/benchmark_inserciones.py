@@ -0,0 +1,98 @@
+"""
+Script para medir el rendimiento de escritura de las inserciones individuales de cámaras.
+
+Compara la forma anterior de insertar (SELECT de duplicados, INSERT ... RETURNING y UPDATE de las
+propiedades para agregar objectid: 3 viajes a la base de datos y una tupla muerta por inserción)
+con la sentencia única actual de db_access (un solo viaje, sin UPDATE). Ambas estrategias usan la
+misma conexión y confirman cada inserción por separado, como lo hace la API.
+
+Uso:
+    python -m app.benchmark_inserciones [cantidad]
+
+Las inserciones se hacen en una tabla de trabajo creada con la estructura de camaras (columnas,
+valores por defecto e índices, pero sin sus triggers) y con su propia secuencia, que se elimina al
+terminar: la tabla camaras no se modifica, no se registran eliminados ni se envían notificaciones.
+"""
+
+import json
+import sys
+import time
+import uuid
+
+from app.database import get_connection
+from app.db_access import insertar_filas_db
+
+
+def _props_prueba(id_texto):
+    return {"type": "Benchmark", "id_texto": id_texto, "ubicacion": "Prueba de rendimiento"}
+
+
+def crear_tabla_trabajo(conn, tabla):
+    """Crea una copia vacía de camaras, sin triggers y con una secuencia propia para los ids"""
+    with conn.cursor() as cur:
+        cur.execute(f"CREATE TABLE {tabla} (LIKE camaras INCLUDING ALL)")
+        cur.execute(f"CREATE SEQUENCE {tabla}_id_seq OWNED BY {tabla}.id")
+        cur.execute(f"ALTER TABLE {tabla} ALTER COLUMN id SET DEFAULT nextval('{tabla}_id_seq')")
+    conn.commit()
+
+
+def insertar_anterior(conn, tabla, id_texto, wkt):
+    """Inserción con el esquema anterior: 3 sentencias por cámara"""
+    with conn.cursor() as cur:
+        cur.execute(f"SELECT id FROM {tabla} WHERE propiedades->>'id_texto' = %s", (id_texto,))
+        if cur.fetchone():
+            raise ValueError(f"id_texto duplicado: {id_texto}")
+        props = _props_prueba(id_texto)
+        cur.execute(
+            f"""
+            INSERT INTO {tabla} (geom, propiedades, created_by, updated_by, estado, is_initial_load)
+            VALUES (ST_GeomFromText(%s, 4326), %s::jsonb, %s, %s, 'pendiente', false)
+            RETURNING id
+            """,
+            (wkt, json.dumps(props), "benchmark", "benchmark")
+        )
+        generated_id = cur.fetchone()[0]
+        props["objectid"] = generated_id
+        cur.execute(f"UPDATE {tabla} SET propiedades = %s::jsonb WHERE id = %s", (json.dumps(props), generated_id))
+    conn.commit()
+
+
+def insertar_actual(conn, tabla, id_texto, wkt):
+    """Inserción con la sentencia única de db_access"""
+    with conn.cursor() as cur:
+        insertar_filas_db(cur, "camaras", [(0, wkt, json.dumps(_props_prueba(id_texto)), "benchmark")], tabla=tabla)
+    conn.commit()
+
+
+def medir(conn, tabla, estrategia, cantidad, prefijo):
+    inicio = time.perf_counter()
+    for i in range(cantidad):
+        wkt = f"POINT({-74.1 + i * 1e-5} {4.6 + i * 1e-5})"
+        estrategia(conn, tabla, f"{prefijo}-{i}", wkt)
+    return time.perf_counter() - inicio
+
+
+def main():
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    ejecucion = uuid.uuid4().hex[:8]
+    tabla = f"bench_camaras_{ejecucion}"
+    conn = get_connection()
+    try:
+        crear_tabla_trabajo(conn, tabla)
+        print(f"Insertando {cantidad} cámaras con cada estrategia...")
+        t_anterior = medir(conn, tabla, insertar_anterior, cantidad, f"BENCH-{ejecucion}-A")
+        t_actual = medir(conn, tabla, insertar_actual, cantidad, f"BENCH-{ejecucion}-B")
+
+        print(f"Anterior (SELECT + INSERT + UPDATE): {t_anterior:.2f} s, {cantidad / t_anterior:.1f} inserciones/s")
+        print(f"Actual (una sola sentencia):         {t_actual:.2f} s, {cantidad / t_actual:.1f} inserciones/s")
+        print(f"Mejora: {t_anterior / t_actual:.2f}x")
+    finally:
+        conn.rollback()
+        with conn.cursor() as cur:
+            cur.execute(f"DROP TABLE IF EXISTS {tabla}")
+        conn.commit()
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
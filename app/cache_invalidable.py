@@ -0,0 +1,85 @@
+"""
+Cachés en memoria que se invalidan con las notificaciones de la base de datos (app/notificaciones.py).
+
+Las solicitudes leen y llenan la caché desde sus hilos y el hilo de escucha la invalida al mismo
+tiempo, así que todo acceso a la TTLCache se hace con un mismo bloqueo. Además, cada grupo de
+entradas (el primer elemento de la clave: una tabla, la red...) tiene un número de generación que
+la invalidación incrementa: una
+solicitud que leyó la base de datos antes de un cambio y termina después de la notificación no
+guarda su resultado, porque la generación ya no es la que vio al empezar. Sin eso, un resultado
+viejo quedaría en la caché durante todo su tiempo de vida.
+"""
+import functools
+import threading
+from collections import Counter
+
+import cachetools
+
+
+class CacheInvalidable:
+    def __init__(self, maxsize, ttl):
+        self.cache = cachetools.TTLCache(maxsize=maxsize, ttl=ttl)
+        self.bloqueo = threading.RLock()
+        self._generaciones = Counter()
+        self._generacion_global = 0
+
+    def _generacion(self, clave):
+        grupo = clave[0] if isinstance(clave, tuple) else None
+        return self._generacion_global, self._generaciones[grupo]
+
+    def cached(self, key):
+        """
+        Decorador equivalente a cachetools.cached(cache, key=key, lock=bloqueo), que además no guarda
+        el resultado si el grupo de la clave se invalidó mientras se calculaba.
+        """
+        def decorador(funcion):
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                clave = key(*args, **kwargs)
+                valor, generacion = self.obtener(clave)
+                if valor is not None:
+                    return valor
+                valor = funcion(*args, **kwargs)
+                self.guardar(clave, valor, generacion)
+                return valor
+            return envoltura
+        return decorador
+
+    def obtener(self, clave):
+        """Valor guardado (o None) y generación actual del grupo de la clave, para usar luego en guardar"""
+        with self.bloqueo:
+            return self.cache.get(clave), self._generacion(clave)
+
+    def guardar(self, clave, valor, generacion):
+        """
+        Guarda un valor si el grupo de la clave no se invalidó desde que se tomó la generación.
+
+        Returns:
+            True si se guardó
+        """
+        with self.bloqueo:
+            if valor is None or self._generacion(clave) != generacion:
+                return False
+            try:
+                self.cache[clave] = valor
+            except ValueError:
+                # Valor más grande que la caché
+                return False
+            return True
+
+    def invalidar(self, grupo, claves=None):
+        """
+        Descarta las entradas de un grupo: las claves indicadas o, si no se indican, todas las del grupo.
+        """
+        with self.bloqueo:
+            self._generaciones[grupo] += 1
+            if claves is None:
+                claves = [clave for clave in list(self.cache.keys()) if isinstance(clave, tuple) and clave[0] == grupo]
+            for clave in claves:
+                self.cache.pop(clave, None)
+
+    def invalidar_todo(self):
+        """Descarta todas las entradas (por ejemplo, al reconectarse la escucha de notificaciones)"""
+        with self.bloqueo:
+            self._generacion_global += 1
+            self.cache.clear()
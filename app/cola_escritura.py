@@ -0,0 +1,151 @@
+"""
+Cola de escritura con confirmación agrupada (group commit) para las inserciones individuales.
+
+Con ESCRITURA_AGRUPADA activada en la configuración, cada inserción individual de la API se encola
+y un hilo en segundo plano las escribe por lotes: espera como máximo ESCRITURA_AGRUPADA_ESPERA_MS
+milisegundos para juntar elementos y los inserta con insertar_lote_db en una sola transacción, con
+un solo commit. Cada solicitud sigue recibiendo su propio id o su propio error.
+
+La cola es acotada: si está llena, la solicitud espera un momento y, si sigue llena, recibe 503.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future, TimeoutError
+
+from fastapi import HTTPException
+
+from . import config
+from .db_access import insertar_lote_db
+
+# Tiempo que una solicitud espera lugar en la cola antes de responder 503 (segundos)
+ESPERA_ENCOLAR_S = 1.0
+# Tiempo máximo que una solicitud espera el resultado de su lote (segundos)
+ESPERA_RESULTADO_S = 30.0
+
+
+class ColaEscritura:
+    def __init__(self, espera_ms, max_lote, max_cola):
+        self.espera_ms = espera_ms
+        self.max_lote = max_lote
+        self._cola = queue.Queue(maxsize=max_cola)
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._procesar, name="cola-escritura", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout=10):
+        """Deja de aceptar elementos y espera a que se escriban los que ya están en la cola"""
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def insertar(self, capa, elemento, username, upsert=False):
+        """
+        Encola un elemento y espera el resultado de su lote.
+
+        Returns:
+            Una tupla (id, insertado), igual que la inserción directa
+
+        Raises:
+            HTTPException con el error del elemento (409, 500...) o 503 si la cola está llena
+        """
+        if self._detener.is_set():
+            raise HTTPException(status_code=503, detail="La cola de escritura se está deteniendo; intente de nuevo")
+        futuro = Future()
+        try:
+            self._cola.put((capa, elemento, username, upsert, futuro), timeout=ESPERA_ENCOLAR_S)
+        except queue.Full:
+            raise HTTPException(status_code=503, detail="La cola de escritura está llena; intente de nuevo en unos segundos")
+        try:
+            return futuro.result(timeout=ESPERA_RESULTADO_S)
+        except TimeoutError:
+            raise HTTPException(status_code=503, detail="Tiempo de espera agotado en la cola de escritura")
+
+    def _procesar(self):
+        while not self._detener.is_set() or not self._cola.empty():
+            try:
+                pendientes = [self._cola.get(timeout=0.2)]
+            except queue.Empty:
+                continue
+
+            # Juntar lo que llegue durante la ventana de espera, hasta el tamaño máximo del lote
+            limite = time.monotonic() + self.espera_ms / 1000.0
+            while len(pendientes) < self.max_lote:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    pendientes.append(self._cola.get(timeout=restante))
+                except queue.Empty:
+                    break
+
+            # Un mismo id_texto no puede ir dos veces en una sentencia: las repeticiones pasan a la
+            # ronda siguiente, de modo que se resuelven igual que dos solicitudes consecutivas
+            while pendientes:
+                ronda, siguientes, claves = [], [], set()
+                for pendiente in pendientes:
+                    clave = (pendiente[0], getattr(pendiente[1], "id_texto", None))
+                    if clave[1] and clave in claves:
+                        siguientes.append(pendiente)
+                        continue
+                    claves.add(clave)
+                    ronda.append(pendiente)
+                self._escribir(ronda)
+                pendientes = siguientes
+
+    def _escribir(self, pendientes):
+        grupos = {}
+        for pendiente in pendientes:
+            capa, _, username, upsert, _ = pendiente
+            grupos.setdefault((capa, username, upsert), []).append(pendiente)
+
+        for (capa, username, upsert), grupo in grupos.items():
+            try:
+                ids, actualizados, errores = insertar_lote_db(
+                    capa, [(indice, pendiente[1]) for indice, pendiente in enumerate(grupo)], username, upsert
+                )
+            except Exception as e:
+                error = e if isinstance(e, HTTPException) else HTTPException(status_code=500, detail=str(e))
+                for pendiente in grupo:
+                    pendiente[4].set_exception(error)
+                continue
+
+            errores_por_indice = {error["indice"]: error for error in errores}
+            for indice, pendiente in enumerate(grupo):
+                if indice in ids:
+                    pendiente[4].set_result((ids[indice], indice not in actualizados))
+                else:
+                    error = errores_por_indice.get(indice, {"status": 500, "message": "No se pudo insertar el elemento"})
+                    pendiente[4].set_exception(HTTPException(status_code=error["status"], detail=error["message"]))
+
+
+_cola = None
+_bloqueo = threading.Lock()
+
+
+def obtener_cola():
+    """Cola compartida del proceso si la escritura agrupada está activada; si no, None"""
+    global _cola
+    if not config.ESCRITURA_AGRUPADA:
+        return None
+    with _bloqueo:
+        if _cola is None:
+            _cola = ColaEscritura(
+                config.ESCRITURA_AGRUPADA_ESPERA_MS,
+                config.ESCRITURA_AGRUPADA_MAX_LOTE,
+                config.ESCRITURA_AGRUPADA_MAX_COLA
+            )
+            _cola.iniciar()
+    return _cola
+
+
+def detener_cola():
+    """Escribe lo pendiente y detiene el hilo de la cola (al apagar la aplicación)"""
+    global _cola
+    with _bloqueo:
+        if _cola is not None:
+            _cola.detener()
+            _cola = None
@@ -13,4 +13,16 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 API_USERNAME = os.getenv("API_USERNAME", "u7Qw9z!2pL4vXr6s")
 API_PASSWORD = os.getenv("API_PASSWORD", "A3$k8z!mQ2@vXr7pL4w9Zb6sT1#nJ5eR")
 
-DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
\ No newline at end of file
+DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+# Escritura agrupada (group commit) de las inserciones individuales, ver app/cola_escritura.py.
+# Desactivada por defecto: cada inserción se confirma por separado.
+ESCRITURA_AGRUPADA = os.getenv("ESCRITURA_AGRUPADA", "false").lower() in ("1", "true", "si", "sí")
+ESCRITURA_AGRUPADA_ESPERA_MS = int(os.getenv("ESCRITURA_AGRUPADA_ESPERA_MS", "5"))      # Espera máxima para juntar un lote
+ESCRITURA_AGRUPADA_MAX_LOTE = int(os.getenv("ESCRITURA_AGRUPADA_MAX_LOTE", "500"))      # Elementos por transacción
+ESCRITURA_AGRUPADA_MAX_COLA = int(os.getenv("ESCRITURA_AGRUPADA_MAX_COLA", "5000"))     # Elementos en espera antes de responder 503
+
+# Tiempo de vida de las cachés de consultas (segundos). Con las notificaciones activadas las cachés se
+# invalidan cuando cambian los datos (ver app/notificaciones.py), por lo que puede ser mucho mayor.
+CACHE_TTL_S = int(os.getenv("CACHE_TTL_S", "21600"))                                   # 6 horas por defecto
+NOTIFICACIONES = os.getenv("NOTIFICACIONES", "true").lower() in ("1", "true", "si", "sí")  # Escuchar LISTEN/NOTIFY al iniciar
@@ -1,33 +1,77 @@
 from fastapi import HTTPException
 from .database import get_connection
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import psycopg2
+from psycopg2 import sql
 import geojson
 
 RADIUS_ERROR_MESSAGE = "El radio interno no puede ser mayor al radio externo"
 
-def get_camaras_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None):
+# Parámetros para el cálculo de matrices de distancias sobre la red
+MATRIZ_ORIGENES_POR_BLOQUE = 25   # Vértices de origen resueltos en cada llamada a pgr_dijkstraCost
+MATRIZ_CELDAS_PARALELO = 2500     # A partir de este tamaño (origenes x destinos) se calculan bloques en paralelo
+MATRIZ_MAX_TRABAJADORES = 4       # Conexiones concurrentes usadas para una misma matriz
+
+def _sql_propiedades(conn, campos=None, sin_propiedades=False):
+    """
+    Expresión SQL de las propiedades a devolver: el JSONB completo, solo las claves pedidas en campos
+    (armadas con jsonb_build_object en el servidor) o ninguna con sin_propiedades.
+    """
+    if sin_propiedades:
+        return "NULL::jsonb"
+    if not campos:
+        return "propiedades"
+    return sql.SQL("jsonb_build_object({})").format(sql.SQL(", ").join(
+        sql.SQL("{clave}, propiedades -> {clave}").format(clave=sql.Literal(campo)) for campo in campos
+    )).as_string(conn)
+
+def _pagina_sql(despues_de_id=None, limite=None):
+    """
+    Condición y orden de una página por clave (keyset) sobre id: los registros con id mayor que
+    despues_de_id, ordenados por id. Sin OFFSET, cada página cuesta lo mismo con el índice de la clave primaria.
+    """
+    condicion = f"AND id > {int(despues_de_id)}" if despues_de_id is not None else ""
+    orden = f"ORDER BY id LIMIT {int(limite)}" if limite is not None else ""
+    return condicion, orden
+
+def _con_siguiente(coleccion, limite):
+    """Agrega a la respuesta el cursor de la página siguiente si la página está completa"""
+    features = coleccion["features"]
+    if limite is not None and len(features) == limite:
+        coleccion["siguiente_despues_de_id"] = features[-1]["properties"]["id"]
+    return coleccion
+
+def get_camaras_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None, limite=None, despues_de_id=None, campos=None, sin_propiedades=False):
+    condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite)
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
             if lat is not None and lon is not None and radio_interno is not None and radio_externo is not None:
                 # Validate that inner radius is not greater than outer radius
                 if radio_interno > radio_externo:
                     raise HTTPException(status_code=400, detail=RADIUS_ERROR_MESSAGE)
 
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry,
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry,
                            ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distancia
                     FROM camaras
                     WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
                     AND ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
-                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s;
+                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s
+                    {condicion_pagina}
+                    {orden_pagina};
                 """, (lon, lat, lon, lat, radio_externo, lon, lat, radio_interno))
             else:
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+                # Sin coordenadas se devuelve una página de 100 registros por defecto
+                condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite or 100)
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                     FROM camaras
-                    WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
-                            limit 100;
+                    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+                    {condicion_pagina}
+                    {orden_pagina};
                 """)
+                limite = limite or 100
             
             features = []
             for row in cur.fetchall():
@@ -42,13 +86,14 @@ def get_camaras_from_db(lat=None, lon=None, radio_interno=None, radio_externo=No
                 
                 feature = geojson.Feature(geometry=geom, properties=props)
                 features.append(feature)
-            return geojson.FeatureCollection(features)
+            return _con_siguiente(geojson.FeatureCollection(features), limite)
 
-def get_all_camaras_from_db():
+def get_all_camaras_from_db(campos=None, sin_propiedades=False):
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+            cur.execute(f"""
+                SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                 FROM camaras
                 WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
             """)
@@ -137,369 +182,432 @@ def get_camaras_en_falla_db(lon, lat, distancia, desviacion, camaras_en_radio_id
             
     return camaras_en_radio, camaras_cercanas
 
-def insertar_camara_db(camara, username="sistema"):
+def wkt_punto(elemento):
+    """
+    Geometría WKT de un elemento puntual: la geometría recibida si se proporciona,
+    si no, el punto construido a partir de longitud/latitud
+    """
+    if elemento.geometry:
+        return elemento.geometry
+    return f"POINT({elemento.longitud} {elemento.latitud})"
+
+def wkt_cable_corporativo(cable):
+    """
+    Geometría WKT de un cable: la geometría recibida si se proporciona,
+    si no, el LINESTRING construido a partir de la lista de puntos
+    """
+    if cable.geometry:
+        return cable.geometry
+    if len(cable.puntos) < 2:
+        raise HTTPException(status_code=400, detail="Se requieren al menos 2 puntos para crear un cable (linestring)")
+    coords = [f"{punto.longitud} {punto.latitud}" for punto in cable.puntos]
+    return f"LINESTRING({', '.join(coords)})"
+
+def props_camara(camara):
+    """Propiedades JSONB de una cámara, con los nombres de campo de la capa original"""
+    return {
+        "type": camara.type,
+        "apertura": camara.apertura,
+        "id_texto": camara.id_texto,
+        "ubicacion": camara.ubicacion,
+        "constructi": camara.constructi,
+        "estado_cam": camara.estado_cam,
+        "nombre_esp": camara.nombre_esp, 
+        "propietari": camara.propietari,
+        "cÓdigo_etb": camara.codigo_etb
+    }
+
+def props_cable_corporativo(cable):
+    """Propiedades JSONB de un cable corporativo, con los nombres de campo de la capa original"""
+    return {
+        "id_text": cable.id_texto,
+        "name": cable.name,
+        "nombre_ant": cable.nombre_ant,
+        "nombre_esp": cable.nombre_esp, 
+        "colocacion": cable.colocacion,
+        "constructi": cable.constructi,
+        "perdida_db": cable.perdida_db,
+        "contratist": cable.contratist,
+        "segmento": cable.segmento,
+        "pr": cable.pr,
+        "calculat1": cable.calculat1,
+        "calculat2": cable.calculat2,
+        "calculated": cable.calculated,
+        "id_especif": cable.id_especificacion,
+        "measured_l": cable.measured_l
+    }
+
+def props_central(central):
+    """Propiedades JSONB de una central"""
+    return {
+        "id_texto": central.id_texto,
+        "nombre": central.nombre,
+        "codigo": central.codigo,
+        "direccion": central.direccion,
+        "tipo": central.tipo
+    }
+
+def props_empalme(empalme):
+    """Propiedades JSONB de un empalme, con los nombres de campo de la capa original"""
+    return {
+        "id_texto": empalme.id_texto,
+        "name": empalme.name,
+        "type": empalme.type,
+        "x": empalme.x,
+        "y": empalme.y,
+        "sangria_": empalme.sangria,
+        "segmento": empalme.segmento,
+        "location_x": empalme.location_x,
+        "location_y": empalme.location_y,
+        "propietario": empalme.propietario,
+        "splice_type": empalme.splice_type,
+        "count_mayorista": empalme.count_mayorista,
+        "mayorista_gather": empalme.mayorista_gather,
+        "symbol_annotation": empalme.symbol_annotation,
+        "symbol_location_x": empalme.symbol_location_x,
+        "symbol_location_y": empalme.symbol_location_y,
+        "id_especificación": empalme.id_specification,
+        "construction_status": empalme.construction_status,
+        "nombre_especificación": empalme.nombre_especificacion,
+        "ubicación_empalmes_camara_x": empalme.ubicacion_empalmes_camara_x,
+        "ubicación_empalmes_camara_y": empalme.ubicacion_empalmes_camara_y,
+        "ubicación_empalmes_postes_x": empalme.ubicacion_empalmes_postes_x,
+        "ubicación_empalmes_postes_y": empalme.ubicacion_empalmes_postes_y,
+        "ubicación_empalmes_edificio_x": empalme.ubicacion_empalmes_edificio_x,
+        "ubicación_empalmes_edificio_y": empalme.ubicacion_empalmes_edificio_y,
+        "ubicación_empalmes_punto_de_acceso_x": empalme.ubicacion_empalmes_punto_de_acceso_x,
+        "ubicación_empalmes_punto_de_acceso_y": empalme.ubicacion_empalmes_punto_de_acceso_y
+    }
+
+def props_reserva(reserva):
+    """Propiedades JSONB de una reserva"""
+    return {
+        "id_texto": reserva.id_texto,
+        "nombre": reserva.nombre,
+        "tipo": reserva.tipo,
+        "capacidad": reserva.capacidad,
+        "ubicacion": reserva.ubicacion
+    }
+
+# Configuración de escritura por capa, compartida por las inserciones individuales y por lotes.
+# campo_unico es la clave de propiedades con índice único, sobre su columna generada (sql/create_indices_id_texto.sql).
+CAPAS_ESCRITURA = {
+    "camaras": {
+        "tabla": "camaras", "props": props_camara, "wkt": wkt_punto,
+        "objectid": True, "campo_unico": "id_texto", "nombre": "una cámara"
+    },
+    "cable_corporativo": {
+        "tabla": "cable_corporativo", "props": props_cable_corporativo, "wkt": wkt_cable_corporativo,
+        "objectid": True, "campo_unico": None, "nombre": "un cable"
+    },
+    "centrales": {
+        "tabla": "centrales", "props": props_central, "wkt": wkt_punto,
+        "objectid": False, "campo_unico": "id_texto", "nombre": "una central"
+    },
+    "empalmes": {
+        "tabla": "empalmes", "props": props_empalme, "wkt": wkt_punto,
+        "objectid": True, "campo_unico": "id_texto", "nombre": "un empalme"
+    },
+    "reservas": {
+        "tabla": "reservas", "props": props_reserva, "wkt": wkt_punto,
+        "objectid": False, "campo_unico": "id_texto", "nombre": "una reserva"
+    }
+}
+
+def _sql_insertar_lote(capa, upsert=False, tabla=None):
+    """
+    Sentencia de inserción de una capa para execute_values, usada tanto para un elemento como para un lote.
+    Los ids se toman de la secuencia de la tabla en el mismo CTE, de modo que objectid (y shape_length,
+    geodésico, para cables) quedan en las propiedades sin un UPDATE posterior, y cada id se devuelve
+    junto a la posición del elemento en el lote y a si se insertó (true) o se actualizó (false).
+
+    Si la capa tiene campo único, los conflictos se resuelven con ON CONFLICT sobre su índice: sin upsert
+    el elemento no se inserta (y no se devuelve); con upsert se actualiza el registro existente,
+    conservando su id y su objectid.
+
+    tabla permite escribir en otra tabla con la misma estructura que la de la capa.
+    """
+    config = CAPAS_ESCRITURA[capa]
+    tabla = tabla or config["tabla"]
+    if capa == "cable_corporativo":
+        columnas_extra = ", distancia_metros"
+        valores_extra = ", n.distancia_metros"
+        calculo_extra = ", ST_Length(n.geom::geography)::float AS distancia_metros"
+        props_extra = ", 'shape_length', n.distancia_metros"
+    else:
+        columnas_extra = valores_extra = calculo_extra = props_extra = ""
+    if config["objectid"]:
+        propiedades = f"n.props || jsonb_build_object('objectid', n.id{props_extra})"
+    else:
+        propiedades = "n.props"
+
+    campo_unico = config["campo_unico"]
+    if campo_unico:
+        clave = campo_unico
+        if upsert:
+            if config["objectid"]:
+                propiedades_actualizadas = f"EXCLUDED.propiedades || jsonb_build_object('objectid', {tabla}.id)"
+            else:
+                propiedades_actualizadas = "EXCLUDED.propiedades"
+            conflicto = f"""
+            ON CONFLICT ({clave}) DO UPDATE
+            SET geom = EXCLUDED.geom,
+                propiedades = {propiedades_actualizadas},
+                updated_by = EXCLUDED.updated_by,
+                updated_at = now(),
+                estado = 'pendiente',
+                is_initial_load = false,
+                hash_origen = NULL"""
+        else:
+            conflicto = f"""
+            ON CONFLICT ({clave}) DO NOTHING"""
+        retorno = f"RETURNING id, {clave} AS clave, (xmax = 0) AS insertado"
+        union = f"i.id = n.id OR i.clave = n.props->>'{campo_unico}'"
+    else:
+        conflicto = ""
+        retorno = "RETURNING id, true AS insertado"
+        union = "i.id = n.id"
+
+    return f"""
+        WITH datos (orden, wkt, props, usuario) AS (VALUES %s),
+        nuevos AS (
+            SELECT d.orden, nextval(pg_get_serial_sequence('{tabla}', 'id')) AS id,
+                   ST_GeomFromText(d.wkt, 4326) AS geom, d.props::jsonb AS props, d.usuario
+            FROM datos d
+        ),
+        calculados AS (
+            SELECT n.*{calculo_extra} FROM nuevos n
+        ),
+        insertados AS (
+            INSERT INTO {tabla} (id, geom, propiedades, created_by, updated_by, estado, is_initial_load{columnas_extra})
+            SELECT n.id, n.geom, {propiedades}, n.usuario, n.usuario, 'pendiente', false{valores_extra}
+            FROM calculados n
+            ORDER BY n.orden{conflicto}
+            {retorno}
+        )
+        SELECT n.orden, i.id, i.insertado FROM nuevos n JOIN insertados i ON {union}
+    """
+
+def insertar_filas_db(cur, capa, filas, upsert=False, tabla=None):
+    """
+    Ejecuta la sentencia de inserción de una capa con un cursor ya abierto, sin confirmar la transacción.
+
+    Args:
+        cur: Cursor de psycopg2; la transacción la confirma (o revierte) quien lo abrió
+        capa: Clave de CAPAS_ESCRITURA
+        filas: Lista de tuplas (orden, wkt, propiedades en JSON, usuario)
+        upsert: Igual que en insertar_lote_db
+        tabla: Tabla con la misma estructura que la de la capa donde escribir (por defecto, la de la capa)
+
+    Returns:
+        Lista de tuplas (orden, id, insertado) de las filas escritas
+    """
+    from psycopg2.extras import execute_values
+
+    return execute_values(
+        cur, _sql_insertar_lote(capa, upsert, tabla), filas, page_size=max(len(filas), 1), fetch=True
+    )
+
+def _insertar_elemento_db(capa, elemento, username, upsert=False):
+    """
+    Inserta (o con upsert, actualiza por id_texto) un elemento con una sola sentencia: un solo viaje
+    a la base de datos, sin UPDATE posterior.
+
+    Returns:
+        Una tupla (id, insertado), donde insertado es False si se actualizó un registro existente
+
+    Raises:
+        HTTPException 409 si, sin upsert, ya existe un elemento con el mismo valor del campo único de la capa
+    """
+    import json
+    from psycopg2.extras import execute_values
+    from .cola_escritura import obtener_cola
+
+    # Con la escritura agrupada activada, el elemento se escribe en el próximo lote de la cola
+    cola = obtener_cola()
+    if cola is not None:
+        return cola.insertar(capa, elemento, username, upsert)
+
+    config = CAPAS_ESCRITURA[capa]
+    props = config["props"](elemento)
+    fila = (0, config["wkt"](elemento), json.dumps(props), username)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            resultado = execute_values(cur, _sql_insertar_lote(capa, upsert), [fila], fetch=True)
+            conn.commit()
+    if not resultado:
+        campo_unico = config["campo_unico"]
+        raise HTTPException(
+            status_code=409,
+            detail=f"Ya existe {config['nombre']} con {campo_unico} '{props[campo_unico]}'"
+        )
+    return resultado[0][1], resultado[0][2]
+
+def insertar_camara_db(camara, username="sistema", upsert=False):
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Convert properties to JSONB
-                props = {
-                    "type": camara.type,
-                    "apertura": camara.apertura,
-                    "id_texto": camara.id_texto,
-                    "ubicacion": camara.ubicacion,
-                    "constructi": camara.constructi,
-                    "estado_cam": camara.estado_cam,
-                    "nombre_esp": camara.nombre_esp, 
-                    "propietari": camara.propietari,
-                    "cÓdigo_etb": camara.codigo_etb
-                }
-                
-                # Si se proporciona geometry directamente, usarlo
-                # Si no, construir el punto a partir de longitud/latitud
-                if camara.geometry:
-                    wkt_geometry = camara.geometry
-                else:
-                    wkt_geometry = f"POINT({camara.longitud} {camara.latitud})"
-
-                # Convertir el diccionario props a JSON string para evitar el error "can't adapt type 'dict'"
-                import json
-                props_json = json.dumps(props)
-
-                # Verificar si ya existe alguna cámara con estas coordenadas o id_texto para evitar duplicados
-                if camara.id_texto:
-                    cur.execute(
-                        "SELECT id FROM camaras WHERE propiedades->>'id_texto' = %s",
-                        (camara.id_texto,)
-                    )
-                    existing = cur.fetchone()
-                    if existing:
-                        raise HTTPException(
-                            status_code=409, 
-                            detail=f"Ya existe una cámara con id_texto '{camara.id_texto}'"
-                        )
-                
-                # Usamos la secuencia de la tabla para generar el ID automáticamente
-                cur.execute(
-                    """
-                    INSERT INTO camaras (geom, propiedades, created_by, updated_by, estado, is_initial_load)
-                    VALUES (ST_GeomFromText(%s, 4326), %s::jsonb, %s, %s, 'pendiente', false)
-                    RETURNING id
-                    """,
-                    (wkt_geometry, props_json, username, username)
-                )
-                
-                # Obtener el ID generado
-                generated_id = cur.fetchone()[0]
-                
-                # Actualizar las propiedades con el objectid igual al id generado
-                props["objectid"] = generated_id
-                props_json = json.dumps(props)
-                
-                # Actualizar el registro con las propiedades actualizadas
-                cur.execute(
-                    """
-                    UPDATE camaras 
-                    SET propiedades = %s::jsonb 
-                    WHERE id = %s
-                    """,
-                    (props_json, generated_id)
-                )
-                
-                conn.commit()
-                
+        generated_id, insertado = _insertar_elemento_db("camaras", camara, username, upsert)
         return {
-            "message": "Cámara insertada correctamente", 
+            "message": "Cámara insertada correctamente" if insertado else "Cámara actualizada correctamente", 
             "id": generated_id, 
             "objectid": generated_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 def insertar_cable_corporativo_db(cable, username="sistema"):
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Convert properties to JSONB
-                props = {
-                    "id_text": cable.id_texto,
-                    "name": cable.name,
-                    "nombre_ant": cable.nombre_ant,
-                    "nombre_esp": cable.nombre_esp, 
-                    "colocacion": cable.colocacion,
-                    "constructi": cable.constructi,
-                    "perdida_db": cable.perdida_db,
-                    "contratist": cable.contratist,
-                    "segmento": cable.segmento,
-                    "pr": cable.pr,
-                    "calculat1": cable.calculat1,
-                    "calculat2": cable.calculat2,
-                    "calculated": cable.calculated,
-                    "id_especif": cable.id_especificacion,
-                    "measured_l": cable.measured_l
-                }
-                
-                # Si se proporciona geometry directamente, usarlo
-                # Si no, construir el linestring a partir de los puntos
-                if cable.geometry:
-                    wkt_geometry = cable.geometry
-                else:
-                    if len(cable.puntos) < 2:
-                        raise HTTPException(status_code=400, detail="Se requieren al menos 2 puntos para crear un cable (linestring)")
-                    
-                    # Construir el WKT para un LINESTRING
-                    coords = []
-                    for punto in cable.puntos:
-                        coords.append(f"{punto.longitud} {punto.latitud}")
-                    
-                    wkt_geometry = f"LINESTRING({', '.join(coords)})"                # Convertir el diccionario props a JSON string
-                import json
-                props_json = json.dumps(props)
-
-                cur.execute(
-                    """
-                    INSERT INTO cable_corporativo (geom, propiedades, created_by, updated_by, estado, distancia_metros, is_initial_load)
-                    VALUES (
-                        ST_GeomFromText(%s, 4326), 
-                        %s::jsonb, 
-                        %s, 
-                        %s, 
-                        'pendiente',
-                        ST_Length(ST_Transform(ST_GeomFromText(%s, 4326), 3857))::float,
-                        false
-                    )
-                    RETURNING id
-                    """,
-                    (wkt_geometry, props_json, username, username, wkt_geometry)
-                )
-                  # Obtener el ID generado
-                generated_id = cur.fetchone()[0]
-                
-                # Consultar el valor de distancia_metros calculado
-                cur.execute(
-                    """
-                    SELECT distancia_metros 
-                    FROM cable_corporativo 
-                    WHERE id = %s
-                    """,
-                    (generated_id,)
-                )
-                distancia_metros = cur.fetchone()[0]
-                
-                # Actualizar las propiedades con el objectid igual al id generado y shape_length
-                props["objectid"] = generated_id
-                props["shape_length"] = distancia_metros
-                props_json = json.dumps(props)
-                
-                # Actualizar el registro con las propiedades actualizadas
-                cur.execute(
-                    """
-                    UPDATE cable_corporativo 
-                    SET propiedades = %s::jsonb 
-                    WHERE id = %s
-                    """,
-                    (props_json, generated_id)
-                )
-                
-                conn.commit()
-                
+        generated_id, _ = _insertar_elemento_db("cable_corporativo", cable, username)
         return {
             "message": "Cable corporativo insertado correctamente",
             "id": generated_id,
             "objectid": generated_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def insertar_central_db(central, username="sistema"):
+def insertar_central_db(central, username="sistema", upsert=False):
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Convert properties to JSONB
-                props = {
-                    "id_texto": central.id_texto,
-                    "nombre": central.nombre,
-                    "codigo": central.codigo,
-                    "direccion": central.direccion,
-                    "tipo": central.tipo
-                }
-                
-                # Si se proporciona geometry directamente, usarlo
-                # Si no, construir el punto a partir de longitud/latitud
-                if central.geometry:
-                    wkt_geometry = central.geometry
-                else:
-                    wkt_geometry = f"POINT({central.longitud} {central.latitud})"
-
-                # Convertir el diccionario props a JSON string
-                import json
-                props_json = json.dumps(props)
-
-                cur.execute(
-                    """
-                    INSERT INTO centrales (geom, propiedades, created_by, updated_by, estado, is_initial_load)
-                    VALUES (ST_GeomFromText(%s, 4326), %s::jsonb, %s, %s, 'pendiente', false)
-                    RETURNING id
-                    """,
-                    (wkt_geometry, props_json, username, username)
-                )
-                
-                # Obtener el ID generado
-                generated_id = cur.fetchone()[0]
-                conn.commit()
-                
+        generated_id, insertado = _insertar_elemento_db("centrales", central, username, upsert)
         return {
-            "message": "Central insertada correctamente",
+            "message": "Central insertada correctamente" if insertado else "Central actualizada correctamente",
             "id": generated_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def insertar_empalme_db(empalme, username="sistema"):
+def insertar_empalme_db(empalme, username="sistema", upsert=False):
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Convert properties to JSONB
-                props = {
-                    "id_texto": empalme.id_texto,
-                    "name": empalme.name,
-                    "type": empalme.type,
-                    "x": empalme.x,
-                    "y": empalme.y,
-                    "sangria_": empalme.sangria,
-                    "segmento": empalme.segmento,
-                    "location_x": empalme.location_x,
-                    "location_y": empalme.location_y,
-                    "propietario": empalme.propietario,
-                    "splice_type": empalme.splice_type,
-                    "count_mayorista": empalme.count_mayorista,
-                    "mayorista_gather": empalme.mayorista_gather,
-                    "symbol_annotation": empalme.symbol_annotation,
-                    "symbol_location_x": empalme.symbol_location_x,
-                    "symbol_location_y": empalme.symbol_location_y,
-                    "id_especificación": empalme.id_specification,
-                    "construction_status": empalme.construction_status,
-                    "nombre_especificación": empalme.nombre_especificacion,
-                    "ubicación_empalmes_camara_x": empalme.ubicacion_empalmes_camara_x,
-                    "ubicación_empalmes_camara_y": empalme.ubicacion_empalmes_camara_y,
-                    "ubicación_empalmes_postes_x": empalme.ubicacion_empalmes_postes_x,
-                    "ubicación_empalmes_postes_y": empalme.ubicacion_empalmes_postes_y,
-                    "ubicación_empalmes_edificio_x": empalme.ubicacion_empalmes_edificio_x,
-                    "ubicación_empalmes_edificio_y": empalme.ubicacion_empalmes_edificio_y,
-                    "ubicación_empalmes_punto_de_acceso_x": empalme.ubicacion_empalmes_punto_de_acceso_x,
-                    "ubicación_empalmes_punto_de_acceso_y": empalme.ubicacion_empalmes_punto_de_acceso_y
-                }
-                
-                # Si se proporciona geometry directamente, usarlo
-                # Si no, construir el punto a partir de longitud/latitud
-                if empalme.geometry:
-                    wkt_geometry = empalme.geometry
-                else:
-                    wkt_geometry = f"POINT({empalme.longitud} {empalme.latitud})"
-
-                # Convertir el diccionario props a JSON string
-                import json
-                props_json = json.dumps(props)
-
-                # Verificar si ya existe algun empalme con estas coordenadas o id_texto para evitar duplicados
-                if empalme.id_texto:
-                    cur.execute(
-                        "SELECT id FROM empalmes WHERE propiedades->>'id_texto' = %s",
-                        (empalme.id_texto,)
-                    )
-                    existing = cur.fetchone()
-                    if existing:
-                        raise HTTPException(
-                            status_code=409, 
-                            detail=f"Ya existe un empalme con id_texto '{empalme.id_texto}'"
-                        )
-
-                cur.execute(
-                    """
-                    INSERT INTO empalmes (geom, propiedades, created_by, updated_by, estado, is_initial_load)
-                    VALUES (ST_GeomFromText(%s, 4326), %s::jsonb, %s, %s, 'pendiente', false)
-                    RETURNING id
-                    """,
-                    (wkt_geometry, props_json, username, username)
-                )
-                
-                # Obtener el ID generado
-                generated_id = cur.fetchone()[0]
-                
-                # Actualizar las propiedades con el objectid igual al id generado
-                props["objectid"] = generated_id
-                props_json = json.dumps(props)
-                
-                # Actualizar el registro con las propiedades actualizadas
-                cur.execute(
-                    """
-                    UPDATE empalmes 
-                    SET propiedades = %s::jsonb 
-                    WHERE id = %s
-                    """,
-                    (props_json, generated_id)
-                )
-                
-                conn.commit()
+        generated_id, insertado = _insertar_elemento_db("empalmes", empalme, username, upsert)
         return {
-            "message": "Empalme insertado correctamente",
+            "message": "Empalme insertado correctamente" if insertado else "Empalme actualizado correctamente",
             "id": generated_id,
             "objectid": generated_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def insertar_reserva_db(reserva, username="sistema"):
+def insertar_reserva_db(reserva, username="sistema", upsert=False):
     try:
-        with get_connection() as conn:
-            with conn.cursor() as cur:
-                # Convert properties to JSONB
-                props = {
-                    "id_texto": reserva.id_texto,
-                    "nombre": reserva.nombre,
-                    "tipo": reserva.tipo,
-                    "capacidad": reserva.capacidad,
-                    "ubicacion": reserva.ubicacion
-                }
-                
-                # Si se proporciona geometry directamente, usarlo
-                # Si no, construir el punto a partir de longitud/latitud
-                if reserva.geometry:
-                    wkt_geometry = reserva.geometry
-                else:
-                    wkt_geometry = f"POINT({reserva.longitud} {reserva.latitud})"
-
-                # Convertir el diccionario props a JSON string
-                import json
-                props_json = json.dumps(props)
-
-                cur.execute(
-                    """
-                    INSERT INTO reservas (geom, propiedades, created_by, updated_by, estado, is_initial_load)
-                    VALUES (ST_GeomFromText(%s, 4326), %s::jsonb, %s, %s, 'pendiente', false)
-                    RETURNING id
-                    """,
-                    (wkt_geometry, props_json, username, username)
-                )
-                
-                # Obtener el ID generado
-                generated_id = cur.fetchone()[0]
-                conn.commit()
-                
+        generated_id, insertado = _insertar_elemento_db("reservas", reserva, username, upsert)
         return {
-            "message": "Reserva insertada correctamente",
+            "message": "Reserva insertada correctamente" if insertado else "Reserva actualizada correctamente",
             "id": generated_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def get_cables_corporativos_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None):
+def insertar_lote_db(capa, elementos, username="sistema", upsert=False):
+    """
+    Inserta varios elementos de una capa en una sola transacción.
+
+    Las filas se envían con execute_values en una sola sentencia. Si el lote completo falla
+    (por ejemplo, por una geometría inválida), se reintenta elemento por elemento con un
+    savepoint por fila para que un error no cancele el resto del lote.
+
+    Args:
+        capa: Clave de CAPAS_ESCRITURA
+        elementos: Lista de tuplas (indice, modelo) ya validadas, donde indice es la posición en la solicitud
+        username: Usuario para created_by / updated_by
+        upsert: Si es True, los elementos cuyo id_texto ya existe actualizan el registro existente
+
+    Returns:
+        Una tupla (ids, actualizados, errores): ids es un diccionario indice -> id, actualizados el
+        conjunto de índices que actualizaron un registro existente y errores una lista de
+        diccionarios con indice, status y message
+    """
+    import json
+    from psycopg2.extras import execute_values
+
+    config = CAPAS_ESCRITURA[capa]
+    campo_unico = config["campo_unico"]
+    errores = []
+    filas = []
+    vistos = set()
+    for indice, elemento in elementos:
+        try:
+            props = config["props"](elemento)
+            fila = (indice, config["wkt"](elemento), json.dumps(props), username)
+        except HTTPException as e:
+            errores.append({"indice": indice, "status": e.status_code, "message": e.detail})
+            continue
+        # Un mismo id_texto solo puede aparecer una vez por sentencia (ON CONFLICT no admite repetidos)
+        valor = props.get(campo_unico) if campo_unico else None
+        if valor:
+            if valor in vistos:
+                errores.append({
+                    "indice": indice,
+                    "status": 409,
+                    "message": f"El {campo_unico} '{valor}' está repetido en el lote"
+                })
+                continue
+            vistos.add(valor)
+        filas.append(fila)
+
+    ids = {}
+    actualizados = set()
+
+    def registrar(resultado):
+        for orden, id_generado, insertado in resultado:
+            ids[orden] = id_generado
+            if not insertado:
+                actualizados.add(orden)
+
+    if filas:
+        sql = _sql_insertar_lote(capa, upsert)
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                try:
+                    registrar(execute_values(cur, sql, filas, page_size=len(filas), fetch=True))
+                    conn.commit()
+                except psycopg2.Error:
+                    conn.rollback()
+                    for fila in filas:
+                        cur.execute("SAVEPOINT fila_lote")
+                        try:
+                            registrar(execute_values(cur, sql, [fila], fetch=True))
+                            cur.execute("RELEASE SAVEPOINT fila_lote")
+                        except psycopg2.Error as e:
+                            cur.execute("ROLLBACK TO SAVEPOINT fila_lote")
+                            errores.append({
+                                "indice": fila[0],
+                                "status": 500,
+                                "message": (e.pgerror or str(e)).strip()
+                            })
+                    conn.commit()
+
+        # Filas que ON CONFLICT DO NOTHING descartó porque el id_texto ya existe
+        con_error = {error["indice"] for error in errores}
+        for fila in filas:
+            if fila[0] not in ids and fila[0] not in con_error:
+                errores.append({
+                    "indice": fila[0],
+                    "status": 409,
+                    "message": f"Ya existe {config['nombre']} con {campo_unico} '{json.loads(fila[2]).get(campo_unico)}'"
+                })
+
+    errores.sort(key=lambda error: error["indice"])
+    return ids, actualizados, errores
+
+def get_cables_corporativos_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None, limite=None, despues_de_id=None, campos=None, sin_propiedades=False):
+    condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite)
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
             if lat is not None and lon is not None and radio_interno is not None and radio_externo is not None:
                 # Validate that inner radius is not greater than outer radius
                 if radio_interno > radio_externo:
                     raise HTTPException(status_code=400, detail=RADIUS_ERROR_MESSAGE)# Para LineStrings, necesitamos verificar si algún punto del cable está dentro de los radios
-                cur.execute("""
+                cur.execute(f"""
                     WITH puntos_cable AS (
                         SELECT id, 
                                propiedades, 
@@ -507,11 +615,12 @@ def get_cables_corporativos_from_db(lat=None, lon=None, radio_interno=None, radi
                                (ST_DumpPoints(geom)).geom as punto,
                                distancia_metros
                         FROM cable_corporativo
-                        WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
+                        WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+                        {condicion_pagina}
                     )
                     SELECT DISTINCT ON (id) 
                            id, 
-                           propiedades, 
+                           {columna_propiedades} AS propiedades, 
                            ST_AsGeoJSON(geom) as geometry,
                            distancia_metros,
                            LEAST(
@@ -525,15 +634,20 @@ def get_cables_corporativos_from_db(lat=None, lon=None, radio_interno=None, radi
                         WHERE pc2.id = puntos_cable.id
                         AND ST_DWithin(pc2.punto::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
                         AND ST_Distance(pc2.punto::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s
-                    );
+                    )
+                    {orden_pagina};
                 """, (lon, lat, lon, lat, radio_externo, lon, lat, radio_interno))
             else:
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry, distancia_metros
+                # Sin coordenadas se devuelve una página de 100 registros por defecto
+                condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite or 100)
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry, distancia_metros
                     FROM cable_corporativo
-                    WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
-                    LIMIT 100;
+                    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+                    {condicion_pagina}
+                    {orden_pagina};
                 """)
+                limite = limite or 100
             
             features = []
             for row in cur.fetchall():
@@ -548,30 +662,21 @@ def get_cables_corporativos_from_db(lat=None, lon=None, radio_interno=None, radi
                 
                 feature = geojson.Feature(geometry=geom, properties=props)
                 features.append(feature)
-            return geojson.FeatureCollection(features)
+            return _con_siguiente(geojson.FeatureCollection(features), limite)
 
-def get_all_cables_corporativos_from_db():
+def get_all_cables_corporativos_from_db(campos=None, sin_propiedades=False):
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
-            cur.execute("""
-                WITH props_grouped AS (
-                    SELECT 
-                        propiedades,
-                        array_agg(id) as ids,
-                        ST_AsGeoJSON(ST_Collect(geom)) as geometry,
-                        SUM(distancia_metros) as distancia_total,
-                        COUNT(*) as cantidad_tramos
-                    FROM cable_corporativo
-                    WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
-                    GROUP BY propiedades
-                )
+            # Cables ya agrupados por propiedades (sql/create_cable_corporativo_agregado.sql)
+            cur.execute(f"""
                 SELECT 
-                    propiedades,
-                    geometry,
+                    {columna_propiedades} AS propiedades,
+                    ST_AsGeoJSON(geom) as geometry,
                     ids,
                     distancia_total,
                     cantidad_tramos
-                FROM props_grouped;
+                FROM cable_corporativo_agregado;
             """)
             features = []
             for row in cur.fetchall():
@@ -587,29 +692,37 @@ def get_all_cables_corporativos_from_db():
                 features.append(feature)
             return geojson.FeatureCollection(features)
 
-def get_centrales_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None):
+def get_centrales_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None, limite=None, despues_de_id=None, campos=None, sin_propiedades=False):
+    condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite)
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
             if lat is not None and lon is not None and radio_interno is not None and radio_externo is not None:
                 # Validate that inner radius is not greater than outer radius
                 if radio_interno > radio_externo:
                     raise HTTPException(status_code=400, detail=RADIUS_ERROR_MESSAGE)
 
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry,
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry,
                            ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distancia
                     FROM centrales
                     WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
                     AND ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
-                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s;
+                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s
+                    {condicion_pagina}
+                    {orden_pagina};
                 """, (lon, lat, lon, lat, radio_externo, lon, lat, radio_interno))
             else:
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+                # Sin coordenadas se devuelve una página de 100 registros por defecto
+                condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite or 100)
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                     FROM centrales
-                    WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
-                    LIMIT 100;
+                    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+                    {condicion_pagina}
+                    {orden_pagina};
                 """)
+                limite = limite or 100
             
             features = []
             for row in cur.fetchall():
@@ -627,13 +740,14 @@ def get_centrales_from_db(lat=None, lon=None, radio_interno=None, radio_externo=
                     properties=props
                 )
                 features.append(feature)
-            return geojson.FeatureCollection(features)
+            return _con_siguiente(geojson.FeatureCollection(features), limite)
 
-def get_all_centrales_from_db():
+def get_all_centrales_from_db(campos=None, sin_propiedades=False):
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+            cur.execute(f"""
+                SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                 FROM centrales
                 WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
             """)
@@ -652,29 +766,37 @@ def get_all_centrales_from_db():
                 features.append(feature)
             return geojson.FeatureCollection(features)
 
-def get_empalmes_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None):
+def get_empalmes_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None, limite=None, despues_de_id=None, campos=None, sin_propiedades=False):
+    condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite)
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
             if lat is not None and lon is not None and radio_interno is not None and radio_externo is not None:
                 # Validate that inner radius is not greater than outer radius
                 if radio_interno > radio_externo:
                     raise HTTPException(status_code=400, detail=RADIUS_ERROR_MESSAGE)
 
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry,
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry,
                            ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distancia
                     FROM empalmes
                     WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
                     AND ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
-                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s;
+                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s
+                    {condicion_pagina}
+                    {orden_pagina};
                 """, (lon, lat, lon, lat, radio_externo, lon, lat, radio_interno))
             else:
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+                # Sin coordenadas se devuelve una página de 100 registros por defecto
+                condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite or 100)
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                     FROM empalmes
-                    WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
-                    LIMIT 100;
+                    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+                    {condicion_pagina}
+                    {orden_pagina};
                 """)
+                limite = limite or 100
             
             features = []
             for row in cur.fetchall():
@@ -692,13 +814,14 @@ def get_empalmes_from_db(lat=None, lon=None, radio_interno=None, radio_externo=N
                     properties=props
                 )
                 features.append(feature)
-            return geojson.FeatureCollection(features)
+            return _con_siguiente(geojson.FeatureCollection(features), limite)
 
-def get_all_empalmes_from_db():
+def get_all_empalmes_from_db(campos=None, sin_propiedades=False):
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+            cur.execute(f"""
+                SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                 FROM empalmes
                 WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
             """)
@@ -717,29 +840,37 @@ def get_all_empalmes_from_db():
                 features.append(feature)
             return geojson.FeatureCollection(features)
 
-def get_reservas_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None):
+def get_reservas_from_db(lat=None, lon=None, radio_interno=None, radio_externo=None, limite=None, despues_de_id=None, campos=None, sin_propiedades=False):
+    condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite)
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
             if lat is not None and lon is not None and radio_interno is not None and radio_externo is not None:
                 # Validate that inner radius is not greater than outer radius
                 if radio_interno > radio_externo:
                     raise HTTPException(status_code=400, detail=RADIUS_ERROR_MESSAGE)
 
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry,
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry,
                            ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) AS distancia
                     FROM reservas
                     WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
                     AND ST_DWithin(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography, %s)
-                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s;
+                    AND ST_Distance(geom::geography, ST_SetSRID(ST_MakePoint(%s, %s), 4326)::geography) >= %s
+                    {condicion_pagina}
+                    {orden_pagina};
                 """, (lon, lat, lon, lat, radio_externo, lon, lat, radio_interno))
             else:
-                cur.execute("""
-                    SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+                # Sin coordenadas se devuelve una página de 100 registros por defecto
+                condicion_pagina, orden_pagina = _pagina_sql(despues_de_id, limite or 100)
+                cur.execute(f"""
+                    SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                     FROM reservas
-                    WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
-                    LIMIT 100;
+                    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+                    {condicion_pagina}
+                    {orden_pagina};
                 """)
+                limite = limite or 100
             
             features = []
             for row in cur.fetchall():
@@ -757,13 +888,14 @@ def get_reservas_from_db(lat=None, lon=None, radio_interno=None, radio_externo=N
                     properties=props
                 )
                 features.append(feature)
-            return geojson.FeatureCollection(features)
+            return _con_siguiente(geojson.FeatureCollection(features), limite)
 
-def get_all_reservas_from_db():
+def get_all_reservas_from_db(campos=None, sin_propiedades=False):
     with get_connection() as conn:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
         with conn.cursor() as cur:
-            cur.execute("""
-                SELECT id, propiedades, ST_AsGeoJSON(geom) as geometry
+            cur.execute(f"""
+                SELECT id, {columna_propiedades} AS propiedades, ST_AsGeoJSON(geom) as geometry
                 FROM reservas
                 WHERE estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado'
             """)
@@ -782,6 +914,92 @@ def get_all_reservas_from_db():
                 features.append(feature)
             return geojson.FeatureCollection(features)
 
+def leer_cursor_cambios(desde):
+    """
+    Convierte el cursor del feed de cambios ('<xid>:<version>', o '0' para empezar desde el
+    principio) en la tupla (xid, version).
+
+    Raises:
+        ValueError si el cursor no tiene ese formato
+    """
+    if desde in (None, "", "0"):
+        return 0, 0
+    xid, separador, version = desde.partition(":")
+    if not separador or not xid.isdigit() or not version.isdigit():
+        raise ValueError(f"Cursor no válido: {desde}")
+    return int(xid), int(version)
+
+def get_cambios_db(tabla, desde="0", limite=1000):
+    """
+    Cambios de una capa posteriores al cursor desde, en el orden en que se confirmaron (ver sql/create_cambios.sql).
+
+    Los registros insertados o actualizados se devuelven como Features con su estado y su versión; los
+    eliminados y los rechazados se devuelven como marcas en 'eliminados', para que el cliente los quite
+    de su copia local. La paginación es por keyset sobre (version_xid, version): el cursor de la
+    respuesta es el último cambio incluido y se usa como desde en la siguiente solicitud.
+
+    Solo se entregan los cambios de las transacciones anteriores a la más antigua en curso: los de una
+    transacción abierta aparecen después del cursor cuando se confirma, nunca antes.
+    """
+    xid, version = leer_cursor_cambios(desde)
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"""
+                WITH horizonte AS (
+                    SELECT pg_snapshot_xmin(pg_current_snapshot()) AS xmin
+                )
+                (
+                    SELECT version_xid::text::bigint, version, id, estado::text, propiedades, ST_AsGeoJSON(geom), false AS eliminado
+                    FROM {tabla}
+                    WHERE (version_xid, version) > (%(xid)s::text::xid8, %(version)s)
+                    AND version_xid < (SELECT xmin FROM horizonte)
+                    ORDER BY version_xid, version
+                    LIMIT %(limite)s
+                )
+                UNION ALL
+                (
+                    SELECT version_xid::text::bigint, version, elemento_id, NULL, NULL, NULL, true AS eliminado
+                    FROM cambios_eliminados
+                    WHERE capa = %(capa)s
+                    AND (version_xid, version) > (%(xid)s::text::xid8, %(version)s)
+                    AND version_xid < (SELECT xmin FROM horizonte)
+                    ORDER BY version_xid, version
+                    LIMIT %(limite)s
+                )
+                ORDER BY 1, 2
+                LIMIT %(limite)s
+                """,
+                {"xid": xid, "version": version, "limite": limite + 1, "capa": tabla}
+            )
+            filas = cur.fetchall()
+
+    hay_mas = len(filas) > limite
+    filas = filas[:limite]
+    features = []
+    eliminados = []
+    for _, version_registro, id_registro, estado, propiedades, geometria, eliminado in filas:
+        if eliminado or estado == 'rechazado':
+            eliminados.append({
+                "id": id_registro,
+                "version": version_registro,
+                "motivo": "eliminado" if eliminado else "rechazado"
+            })
+            continue
+        props = propiedades if propiedades is not None else {}
+        props["id"] = id_registro
+        props["estado"] = estado
+        props["version"] = version_registro
+        features.append(geojson.Feature(geometry=geojson.loads(geometria) if geometria else None, properties=props))
+
+    return {
+        "type": "FeatureCollection",
+        "features": features,
+        "eliminados": eliminados,
+        "cursor": f"{filas[-1][0]}:{filas[-1][1]}" if filas else (desde or "0"),
+        "hay_mas": hay_mas
+    }
+
 def get_cables_cercanos_from_db(lon=None, lat=None, distancia=None, limite=100, incluir_troncales=False, nombre_cable=None, busqueda_exacta=True):
     """
     Obtiene cables cercanos a un punto usando la función SQL get_cables_cercanos o get_cables_cercanos_simple,
@@ -828,4 +1046,423 @@ def get_cables_cercanos_from_db(lon=None, lat=None, distancia=None, limite=100,
                     props["distancia_metros"] = row[3]
                 feature = geojson.Feature(geometry=geom, properties=props)
                 features.append(feature)
-            return geojson.FeatureCollection(features)
\ No newline at end of file
+            return geojson.FeatureCollection(features)
+def get_nodos_alcanzables_lote_db(origenes, margen_factor=0.999, solo_componente_principal=False):
+    """
+    Obtiene los nodos alcanzables para varios orígenes con una sola consulta a
+    fn_nodos_alcanzables_en_ruta_red_lote, que carga las aristas de la red una vez por lote.
+
+    Args:
+        origenes: Lista de objetos con los atributos lon, lat y distancia
+        margen_factor: Margen de error como factor decimal
+        solo_componente_principal: Ajustar los orígenes a la componente de mayor longitud de la red
+
+    Returns:
+        Una lista con un diccionario por origen, en el mismo orden de entrada
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT origen, ST_AsGeoJSON(geom) as geom_geojson, distancia_acumulada, es_mas_cercano, nombre_cable
+                FROM fn_nodos_alcanzables_en_ruta_red_lote(%s::float8[], %s::float8[], %s::float8[], %s, %s)
+                """,
+                (
+                    [o.lon for o in origenes],
+                    [o.lat for o in origenes],
+                    [o.distancia for o in origenes],
+                    margen_factor,
+                    solo_componente_principal
+                )
+            )
+            features_por_origen = {}
+            for row in cur.fetchall():
+                feature = {
+                    "type": "Feature",
+                    "geometry": geojson.loads(row[1]) if row[1] else None,
+                    "properties": {
+                        "distancia_acumulada": row[2],
+                        "es_mas_cercano": row[3],
+                        "nombre_cable": row[4]
+                    }
+                }
+                features_por_origen.setdefault(row[0], []).append(feature)
+
+    resultados = []
+    for posicion, origen in enumerate(origenes, start=1):
+        features = features_por_origen.get(posicion, [])
+        resultado = {
+            "origen": {"lon": origen.lon, "lat": origen.lat, "distancia": origen.distancia},
+            "status": "success" if features else "error",
+            "features": features
+        }
+        if not features:
+            resultado["message"] = "No se encontraron nodos alcanzables para la distancia dada"
+        resultados.append(resultado)
+    return resultados
+
+def get_vertices_cercanos_red_db(puntos, solo_componente_principal=False):
+    """
+    Ajusta una lista de puntos al vértice más cercano de red_vertices_pgr en una sola consulta.
+
+    Args:
+        puntos: Lista de tuplas (lon, lat)
+        solo_componente_principal: Ajustar solo a vértices de la componente de mayor longitud
+
+    Returns:
+        Una lista con un diccionario por punto (vertice, lon, lat, distancia_a_red, componente,
+        longitud_componente), en el mismo orden de entrada, o None para los puntos que no pudieron
+        ajustarse a la red
+    """
+    if not puntos:
+        return []
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT e.ord, v.id, ST_X(v.the_geom), ST_Y(v.the_geom),
+                       ST_Distance(v.the_geom::geography, ST_SetSRID(ST_MakePoint(e.lon, e.lat), 4326)::geography),
+                       v.componente, c.longitud_total
+                FROM unnest(%s::float8[], %s::float8[]) WITH ORDINALITY AS e(lon, lat, ord)
+                CROSS JOIN LATERAL (
+                    SELECT rv.id, rv.the_geom, rv.componente
+                    FROM red_vertices_pgr rv
+                    WHERE NOT %s OR rv.componente = fn_componente_principal_red()
+                    ORDER BY rv.the_geom <-> ST_SetSRID(ST_MakePoint(e.lon, e.lat), 4326)
+                    LIMIT 1
+                ) AS v
+                LEFT JOIN red_componentes c ON c.componente = v.componente
+                ORDER BY e.ord
+                """,
+                ([p[0] for p in puntos], [p[1] for p in puntos], solo_componente_principal)
+            )
+            vertices = [None] * len(puntos)
+            for row in cur.fetchall():
+                vertices[row[0] - 1] = {
+                    "vertice": row[1],
+                    "lon": row[2],
+                    "lat": row[3],
+                    "distancia_a_red": row[4],
+                    "componente": row[5],
+                    "longitud_componente": row[6]
+                }
+            return vertices
+
+def get_ruta_entre_vertices_db(origen, destino):
+    """
+    Calcula la ruta más corta entre dos vértices de la red usando fn_ruta_entre_vertices.
+
+    Returns:
+        Un diccionario con la geometría GeoJSON de la ruta, la distancia total en metros y los tramos
+        recorridos agrupados por cable, o None si los vértices no están conectados
+    """
+    if origen == destino:
+        return {"geometry": None, "distancia_metros": 0.0, "tramos": []}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT ST_AsGeoJSON(ST_LineMerge(ST_Collect(geom ORDER BY seq))) as geometry,
+                       array_agg(nombre_cable ORDER BY seq) as nombres,
+                       array_agg(costo ORDER BY seq) as costos
+                FROM fn_ruta_entre_vertices(%s, %s)
+                """,
+                (origen, destino)
+            )
+            row = cur.fetchone()
+    if not row or row[0] is None:
+        return None
+
+    # Agrupar aristas consecutivas del mismo cable en un solo tramo
+    tramos = []
+    for nombre, costo in zip(row[1], row[2]):
+        if tramos and tramos[-1]["nombre_cable"] == nombre:
+            tramos[-1]["distancia_metros"] += costo
+        else:
+            tramos.append({"nombre_cable": nombre, "distancia_metros": costo})
+    return {
+        "geometry": geojson.loads(row[0]),
+        "distancia_metros": sum(row[2]),
+        "tramos": tramos
+    }
+
+def get_costos_red_db(origenes, destinos, componente=None):
+    """
+    Calcula el costo (metros por la red) de todos los pares origen-destino con una llamada
+    muchos-a-muchos a pgr_dijkstraCost.
+
+    Args:
+        origenes: Lista de ids de vértices de origen
+        destinos: Lista de ids de vértices de destino
+        componente: Si se indica, solo se cargan las aristas de esa componente de la red
+
+    Returns:
+        Un diccionario {(origen, destino): metros}; los pares sin conexión no aparecen
+    """
+    costos = {}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT start_vid, end_vid, agg_cost
+                FROM pgr_dijkstraCost(
+                    CASE WHEN %s::bigint IS NULL
+                        THEN 'SELECT id, source, target, cost, reverse_cost FROM red'
+                        ELSE format('SELECT id, source, target, cost, reverse_cost FROM red WHERE componente = %%s', %s::bigint)
+                    END,
+                    %s::bigint[],
+                    %s::bigint[],
+                    directed := false
+                )
+                """,
+                (componente, componente, list(origenes), list(destinos))
+            )
+            for row in cur.fetchall():
+                costos[(row[0], row[1])] = row[2]
+    # pgr_dijkstraCost no devuelve los pares de un vértice consigo mismo
+    for origen in origenes:
+        if origen in destinos:
+            costos[(origen, origen)] = 0.0
+    return costos
+
+def iterar_matriz_distancias_red(origenes, destinos, solo_componente_principal=False):
+    """
+    Calcula la matriz de distancias por la red entre dos listas de puntos y la devuelve fila a fila.
+
+    Todos los puntos se ajustan a red_vertices_pgr en una sola consulta. Los pares que quedan en
+    componentes distintas de la red se devuelven sin conexión sin calcularlos; el resto se calcula
+    por componente y por bloques de vértices de origen, cargando solo las aristas de esa componente.
+    Para matrices grandes los bloques se calculan en paralelo con varias conexiones; cada fila se
+    entrega en cuanto termina su bloque, por lo que el orden de las filas puede no coincidir con el
+    de los orígenes.
+
+    Args:
+        origenes: Lista de tuplas (lon, lat)
+        destinos: Lista de tuplas (lon, lat)
+        solo_componente_principal: Ajustar los puntos a la componente de mayor longitud de la red
+
+    Yields:
+        Primero un diccionario con los vértices de destino y luego un diccionario por origen con
+        su índice, su vértice y la lista de distancias en metros (None si no hay conexión)
+    """
+    vertices = get_vertices_cercanos_red_db(list(origenes) + list(destinos), solo_componente_principal)
+    vertices_origen = vertices[:len(origenes)]
+    vertices_destino = vertices[len(origenes):]
+    yield {"tipo": "destinos", "destinos": vertices_destino}
+
+    # Vértices agrupados por componente (None si las componentes no están calculadas)
+    origen_por_componente = {}
+    for v in vertices_origen:
+        if v:
+            origen_por_componente.setdefault(v["componente"], set()).add(v["vertice"])
+    destino_por_componente = {}
+    for v in vertices_destino:
+        if v:
+            destino_por_componente.setdefault(v["componente"], set()).add(v["vertice"])
+
+    bloques = []
+    sin_destinos = []
+    for componente, ids_origen in origen_por_componente.items():
+        ids_origen = sorted(ids_origen)
+        ids_destino = sorted(destino_por_componente.get(componente, ()))
+        if not ids_destino:
+            sin_destinos.extend(ids_origen)
+            continue
+        for i in range(0, len(ids_origen), MATRIZ_ORIGENES_POR_BLOQUE):
+            bloques.append((ids_origen[i:i + MATRIZ_ORIGENES_POR_BLOQUE], ids_destino, componente))
+
+    filas_por_vertice = {}
+    for indice, vertice in enumerate(vertices_origen):
+        filas_por_vertice.setdefault(vertice["vertice"] if vertice else None, []).append(indice)
+
+    def filas(costos, bloque):
+        for vertice_origen in bloque:
+            for indice in filas_por_vertice[vertice_origen]:
+                yield {
+                    "tipo": "fila",
+                    "origen": indice,
+                    "vertice": vertices_origen[indice],
+                    "distancias": [
+                        costos.get((vertice_origen, d["vertice"])) if d else None
+                        for d in vertices_destino
+                    ]
+                }
+
+    # Orígenes que no se pudieron ajustar a la red o sin destinos en su componente
+    for indice in filas_por_vertice.get(None, []):
+        yield {"tipo": "fila", "origen": indice, "vertice": None, "distancias": [None] * len(destinos)}
+    yield from filas({}, sin_destinos)
+
+    if len(bloques) > 1 and len(origenes) * len(destinos) >= MATRIZ_CELDAS_PARALELO:
+        # El trabajo pesado ocurre en PostgreSQL, así que basta con hilos y una conexión por bloque
+        with ThreadPoolExecutor(max_workers=MATRIZ_MAX_TRABAJADORES) as executor:
+            futuros = {executor.submit(get_costos_red_db, *bloque): bloque[0] for bloque in bloques}
+            for futuro in as_completed(futuros):
+                yield from filas(futuro.result(), futuros[futuro])
+    else:
+        for bloque in bloques:
+            yield from filas(get_costos_red_db(*bloque), bloque[0])
+
+def get_candidatos_falla_otdr_db(central_id, distancia, n_cercanos=3):
+    """
+    Calcula los posibles puntos de corte a una distancia OTDR desde una central usando los árboles
+    de caminos mínimos precalculados (sql/create_arboles_centrales.sql). Si la central aún no tiene
+    árbol (por ejemplo, porque se insertó después del último cálculo), si se movió o si la red se
+    recreó después del cálculo, se recalcula solo el suyo.
+
+    Returns:
+        Un diccionario con el vértice de la red al que se ajusta la central, su distancia a la red y
+        la lista de candidatos, o None si la central no existe o no se puede ajustar a la red
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT fn_arbol_central_vigente(id) FROM centrales WHERE id = %s", (central_id,))
+            row = cur.fetchone()
+            if row is None:
+                return None
+
+            if not row[0]:
+                # Las solicitudes simultáneas de la misma central esperan al primer cálculo y lo reutilizan
+                cur.execute("SELECT pg_advisory_xact_lock(hashtext('red_arboles_centrales'), %s)", (central_id,))
+                cur.execute("SELECT fn_arbol_central_vigente(%s)", (central_id,))
+                if not cur.fetchone()[0]:
+                    cur.execute("SELECT fn_actualizar_arboles_centrales(ARRAY[%s]::integer[])", (central_id,))
+                conn.commit()
+
+            cur.execute(
+                "SELECT nodo, distancia_a_red FROM red_raices_centrales WHERE central_id = %s",
+                (central_id,)
+            )
+            raiz = cur.fetchone()
+            if raiz is None:
+                return None
+
+            cur.execute(
+                """
+                SELECT ST_AsGeoJSON(geom) as geometry, arista, nombre_cable, camaras, empalmes
+                FROM fn_localizar_falla_otdr(%s, %s, %s)
+                """,
+                (central_id, distancia, n_cercanos)
+            )
+            candidatos = []
+            for row in cur.fetchall():
+                candidatos.append({
+                    "geometry": geojson.loads(row[0]),
+                    "arista": row[1],
+                    "nombre_cable": row[2],
+                    "camaras_cercanas": row[3],
+                    "empalmes_cercanos": row[4]
+                })
+    return {
+        "vertice": raiz[0],
+        "distancia_a_red": raiz[1],
+        "candidatos": candidatos
+    }
+
+def get_indice_lineal_db(capa, elemento_id):
+    """
+    Obtiene el índice de referencia lineal de una arista de red o de un cable (sql/create_indice_lineal.sql).
+    Si el elemento aún no está en el índice (por ejemplo, un cable insertado después del último
+    cálculo), se calcula y se guarda en el momento.
+
+    Returns:
+        Una tupla (longitud_total, longitudes, coordenadas) con los arreglos empaquetados como bytes,
+        o None si el elemento no existe
+    """
+    tablas = {"red": "red", "cable_corporativo": "cable_corporativo"}
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT longitud_total, longitudes, coordenadas
+                FROM indice_lineal
+                WHERE capa = %s AND elemento_id = %s
+                """,
+                (capa, elemento_id)
+            )
+            row = cur.fetchone()
+            if row is None:
+                cur.execute(
+                    f"""
+                    INSERT INTO indice_lineal (capa, elemento_id, n_vertices, longitud_total, longitudes, coordenadas)
+                    SELECT %s, t.id, i.n_vertices, i.longitud_total, i.longitudes, i.coordenadas
+                    FROM {tablas[capa]} t
+                    CROSS JOIN LATERAL fn_indice_lineal_geom(t.geom) AS i
+                    WHERE t.id = %s AND ST_NPoints(t.geom) >= 2
+                    ON CONFLICT (capa, elemento_id) DO NOTHING
+                    RETURNING longitud_total, longitudes, coordenadas
+                    """,
+                    (capa, elemento_id)
+                )
+                row = cur.fetchone()
+                conn.commit()
+    if row is None:
+        return None
+    return row[0], bytes(row[1]), bytes(row[2])
+
+def get_cobertura_red_db(vertice, distancia, metodo="buffer"):
+    """
+    Calcula el polígono de cobertura de la red desde un vértice con fn_cobertura_red.
+
+    Returns:
+        Un diccionario con la geometría GeoJSON de la cobertura y su área en km², o None si no se alcanza ninguna arista
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT ST_AsGeoJSON(c.geom) as geometry, ST_Area(c.geom::geography) / 1000000.0 as area_km2
+                FROM (SELECT fn_cobertura_red(%s, %s, %s) AS geom) AS c
+                WHERE c.geom IS NOT NULL
+                """,
+                (vertice, distancia, metodo)
+            )
+            row = cur.fetchone()
+    if row is None:
+        return None
+    return {"geometry": geojson.loads(row[0]), "area_km2": row[1]}
+
+def get_cobertura_centrales_db(distancia, metodo="buffer", central_id=None):
+    """
+    Obtiene las coberturas precalculadas de las centrales (tabla red_cobertura_centrales) para una distancia.
+    Las calculadas sobre otra topología de la red o antes de mover la central no se devuelven.
+
+    Returns:
+        GeoJSON FeatureCollection con un polígono por central
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT c.central_id, ce.propiedades, ST_AsGeoJSON(c.geom) as geometry, c.area_km2
+                FROM red_cobertura_centrales c
+                JOIN centrales ce ON ce.id = c.central_id
+                WHERE c.distancia_m = %s AND c.metodo = %s AND c.geom IS NOT NULL
+                  AND (%s IS NULL OR c.central_id = %s)
+                  AND c.version_red = fn_version_red() AND ST_OrderingEquals(c.geom_central, ce.geom)
+                ORDER BY c.central_id
+                """,
+                (distancia, metodo, central_id, central_id)
+            )
+            features = []
+            for row in cur.fetchall():
+                props = row[1] if row[1] is not None else {}
+                props["id"] = row[0]
+                props["distancia"] = distancia
+                props["area_km2"] = row[3]
+                features.append(geojson.Feature(geometry=geojson.loads(row[2]), properties=props))
+            return geojson.FeatureCollection(features)
+
+def get_distancias_cobertura_centrales_db(metodo="buffer"):
+    """Distancias para las que hay coberturas de centrales precalculadas sobre la topología actual"""
+    with get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute(
+                """
+                SELECT DISTINCT distancia_m FROM red_cobertura_centrales
+                WHERE metodo = %s AND version_red = fn_version_red()
+                ORDER BY distancia_m
+                """,
+                (metodo,)
+            )
+            return [row[0] for row in cur.fetchall()]
@@ -3,7 +3,10 @@ from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker
 from app.config import DATABASE_URL
 from app.models import Base, EstadoRegistro
-import subprocess
+from app.database import get_connection
+from app.importar_geojson import abrir_geojson, importar_geojson, sincronizar_geojson
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import sys
 
 def init_db():
     print("Conectando a la base de datos...\n")
@@ -51,171 +54,140 @@ def init_db():
     
     return engine
 
-def check_ogr2ogr():
-    """Verifica si ogr2ogr está instalado y accesible"""
-    try:
-        subprocess.run(['ogr2ogr', '--version'], 
-                              stdout=subprocess.DEVNULL,
-                              stderr=subprocess.PIPE,
-                              text=True)
-        return True
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("""
-ERROR: No se encuentra ogr2ogr. Por favor, sigue estos pasos para instalarlo:
+# Tablas de la carga inicial y sus archivos en data/
+ARCHIVOS_CARGA_INICIAL = {
+    'cable_corporativo.geojson': 'cable_corporativo',
+    'camaras.geojson': 'camaras',
+    'centrales.geojson': 'centrales',
+    'empalmes.geojson': 'empalmes',
+    'reservas.geojson': 'reservas'
+}
+TAMANO_LOTE_CARGA = 20000
 
-1. Descarga OSGeo4W Network Installer (32 o 64 bits) desde:
-   https://trac.osgeo.org/osgeo4w/
+def cargar_archivo_geojson(file_path, table_name):
+    """
+    Carga un archivo GeoJSON en su tabla como registros de la carga inicial. Se ejecuta en un proceso
+    aparte por tabla (ver load_geojson_to_postgres).
 
-2. Ejecuta el instalador y selecciona:
-   - Express Desktop Install
-   - GDAL
+    Los índices no únicos de la tabla (el GIST de geom y los índices de expresión) se eliminan antes
+    de la carga y se vuelven a crear al final, de modo que se construyen una sola vez sobre los datos
+    ya cargados en lugar de actualizarse fila por fila. Los índices únicos (como los de id_texto) se
+    mantienen, porque el ON CONFLICT de la carga los usa para descartar duplicados.
+    """
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT i.indexname, i.indexdef
+                FROM pg_indexes i
+                JOIN pg_class c ON c.relname = i.indexname AND c.relnamespace = to_regnamespace(i.schemaname)
+                JOIN pg_index x ON x.indexrelid = c.oid
+                WHERE i.schemaname = current_schema() AND i.tablename = %s
+                AND NOT x.indisunique
+                AND NOT EXISTS (SELECT 1 FROM pg_constraint k WHERE k.conname = i.indexname)
+            """, (table_name,))
+            indices = cur.fetchall()
+            for nombre, _ in indices:
+                cur.execute(f'DROP INDEX IF EXISTS "{nombre}"')
+        conn.commit()
 
-3. Una vez instalado, agrega la ruta al PATH del sistema:
-   - Busca "Variables de entorno" en Windows
-   - En Variables del sistema, edita "Path"
-   - Agrega: C:\\OSGeo4W64\\bin (o C:\\OSGeo4W\\bin para 32 bits)
-   
-4. Reinicia tu terminal/PowerShell
+        resumen = None
+        errores = []
+        try:
+            with abrir_geojson(file_path) as archivo:
+                for resumen in importar_geojson(archivo, table_name, tamano_lote=TAMANO_LOTE_CARGA, carga_inicial=True):
+                    pass
+        finally:
+            # Cada índice por separado: si uno falla, los demás se crean igual
+            for nombre, definicion in indices:
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(definicion)
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    errores.append(f"{nombre}: {str(e)}")
+            with conn.cursor() as cur:
+                cur.execute(f"ANALYZE {table_name}")
+            conn.commit()
+        if errores:
+            raise RuntimeError(f"No se pudieron volver a crear índices de {table_name}: {'; '.join(errores)}")
+        return resumen
+    finally:
+        conn.close()
 
-Después de completar estos pasos, ejecuta este script nuevamente.
-""")
-        return False
+def archivos_carga_inicial():
+    """Archivos de data/ que existen, con su tabla: {archivo: (ruta, tabla)}"""
+    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
+    archivos = {}
+    for geojson_file, table_name in ARCHIVOS_CARGA_INICIAL.items():
+        file_path = os.path.join(data_dir, geojson_file)
+        if not os.path.exists(file_path):
+            print(f"Advertencia: No se encuentra el archivo {geojson_file}")
+            continue
+        archivos[geojson_file] = (file_path, table_name)
+    return archivos
 
 def load_geojson_to_postgres():
+    """
+    Carga los archivos GeoJSON de data/ en sus tablas, las cinco en paralelo (un proceso por tabla).
+
+    Cada archivo se lee mapeado en memoria y por partes, y se escribe con COPY por lotes; las
+    geometrías se reproyectan a EPSG:4326 en PostGIS según el crs de cada archivo. Los nombres de
+    las propiedades quedan en minúsculas y los ids se toman de la posición del Feature en el archivo
+    ((posición * 1000) + parte para los cables), como en la carga anterior con ogr2ogr.
+    """
     print("\nIniciando carga de archivos GeoJSON...")
-    if not check_ogr2ogr():
-        print("Error: ogr2ogr no está instalado o no es accesible.")
+    archivos = archivos_carga_inicial()
+    if not archivos:
         return
 
-    data_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data')
-    file_table_mapping = {
-        'cable_corporativo.geojson': 'cable_corporativo',
-        'camaras.geojson': 'camaras',
-        'centrales.geojson': 'centrales',
-        'empalmes.geojson': 'empalmes',
-        'reservas.geojson': 'reservas'
-    }
-    
-    engine = create_engine(DATABASE_URL)
-    temp_tables = []
-    
-    try:
-        for geojson_file, table_name in file_table_mapping.items():
-            file_path = os.path.join(data_dir, geojson_file)
-            if not os.path.exists(file_path):
-                print(f"Advertencia: No se encuentra el archivo {geojson_file}")
-                continue
-                
-            print(f"\nProcesando {geojson_file}...")
-            # Para cable_corporativo permitimos MULTILINESTRING en la tabla temporal
-            geometry_type = 'MULTILINESTRING' if table_name == 'cable_corporativo' else 'POINT'
-            temp_table = f"{table_name}_temp"
-            temp_tables.append(temp_table)
-            
-            cmd = [
-                'ogr2ogr',
-                '-f', 'PostgreSQL',
-                f'PG:dbname={os.getenv("DB_NAME")} user={os.getenv("DB_USER")} password={os.getenv("DB_PASSWORD")} host={os.getenv("DB_HOST")} port={os.getenv("DB_PORT", "5432")}',
-                file_path,
-                '-nln', temp_table,
-                '-overwrite',
-                '-lco', 'GEOMETRY_NAME=geom',
-                '-lco', 'PRECISION=NO',
-                '-nlt', geometry_type,
-                '-t_srs', 'EPSG:4326'
-            ]
-            
+    print(f"Procesando {len(archivos)} archivos en paralelo...")
+    with ProcessPoolExecutor(max_workers=len(archivos)) as executor:
+        futuros = {
+            executor.submit(cargar_archivo_geojson, file_path, table_name): geojson_file
+            for geojson_file, (file_path, table_name) in archivos.items()
+        }
+        for futuro in as_completed(futuros):
+            geojson_file = futuros[futuro]
             try:
-                print("- Cargando datos en tabla temporal...")
-                result = subprocess.run(cmd, 
-                             stdout=subprocess.DEVNULL,
-                             stderr=subprocess.PIPE,
-                             text=True)
-                if result.returncode != 0:
-                    print(f"Error al ejecutar ogr2ogr: {result.stderr}")
-                    continue
-                print("- Datos cargados en tabla temporal.")
-                
-                with engine.connect() as connection:
-                    print("- Analizando estructura de datos...")
-                    json_columns_query = text("""
-                        SELECT column_name 
-                        FROM information_schema.columns 
-                        WHERE table_name = :table_name 
-                        AND column_name NOT IN ('id', 'geom', 'ogc_fid');
-                    """)
-                    
-                    result = connection.execute(json_columns_query, {"table_name": temp_table}).fetchall()
-                    columns = [row[0] for row in result]
-                    
-                    if not columns:
-                        print("  Advertencia: No se encontraron columnas para las propiedades")
-                        continue
-                        
-                    print(f"  Encontradas {len(columns)} columnas para propiedades")
-                    json_build_object = ", ".join([f"'{col}', {col}" for col in columns])
-                    
-                    print("- Transfiriendo datos a tabla final...")
-                    if table_name == 'cable_corporativo':
-                        # Para cable_corporativo, extraemos cada línea del MULTILINESTRING
-                        insert_query = text(f"""
-                            WITH RECURSIVE geometry_parts AS (
-                                SELECT 
-                                    ogc_fid,
-                                    (ST_Dump(geom)).path[1] as part_id,
-                                    (ST_Dump(geom)).geom as single_geom,
-                                    {', '.join(columns)}
-                                FROM {temp_table}
-                            )
-                            INSERT INTO {table_name} (id, geom, propiedades, created_by, updated_by, estado, is_initial_load, distancia_metros)
-                            SELECT 
-                                (ogc_fid * 1000) + part_id as id,
-                                single_geom as geom,
-                                jsonb_build_object({json_build_object}) as propiedades,
-                                'sistema' as created_by,
-                                'sistema' as updated_by,
-                                'inicial'::estadoregistro as estado,
-                                true as is_initial_load,
-                                ST_Length(ST_Transform(single_geom::geometry, 3857))::float as distancia_metros
-                            FROM geometry_parts;
-                        """)
-                    else:
-                        # Para otras tablas, inserción normal
-                        insert_query = text(f"""
-                            INSERT INTO {table_name} (id, geom, propiedades, created_by, updated_by, estado, is_initial_load)
-                            SELECT 
-                                ogc_fid as id,
-                                geom,
-                                jsonb_build_object({json_build_object}) as propiedades,
-                                'sistema' as created_by,
-                                'sistema' as updated_by,
-                                'inicial'::estadoregistro as estado,
-                                true as is_initial_load
-                            FROM {temp_table};
-                        """)
-                    
-                    connection.execute(insert_query)
-                    connection.commit()
-                    print(f"✓ {geojson_file} cargado exitosamente")
-                    
-            except subprocess.CalledProcessError as e:
-                print(f"Error al ejecutar ogr2ogr para {geojson_file}: {str(e)}")
+                resumen = futuro.result()
+                print(f"✓ {geojson_file} cargado exitosamente: {resumen['leidos']} features, "
+                      f"{resumen['insertados']} registros (SRID de origen {resumen['srid_origen']})")
             except Exception as e:
                 print(f"Error al procesar {geojson_file}: {str(e)}")
-                if 'connection' in locals():
-                    connection.rollback()
-                
-    finally:
-        print("\nLimpiando tablas temporales...")
-        with engine.connect() as connection:
-            for temp_table in temp_tables:
-                try:
-                    connection.execute(text(f"DROP TABLE IF EXISTS {temp_table};"))
-                    connection.commit()
-                    print(f"- Tabla temporal {temp_table} eliminada")
-                except Exception as e:
-                    print(f"Error al eliminar tabla temporal {temp_table}: {str(e)}")
-            print("Limpieza de tablas temporales completada")
+
+def sincronizar_archivo_geojson(file_path, table_name):
+    """Sincroniza una tabla con su archivo (se ejecuta en un proceso aparte por tabla)"""
+    with abrir_geojson(file_path) as archivo:
+        return sincronizar_geojson(archivo, table_name, tamano_lote=TAMANO_LOTE_CARGA)
+
+def sync_geojson_to_postgres():
+    """
+    Aplica una nueva entrega de los archivos de data/ sin borrar las tablas (python -m app.db_init --sync).
+
+    Solo se insertan, actualizan o eliminan los registros de la carga inicial cuyo Feature cambió
+    (comparando hash_origen, ver sincronizar_geojson); los registros creados desde la API se conservan.
+    """
+    print("\nSincronizando archivos GeoJSON...")
+    archivos = archivos_carga_inicial()
+    if not archivos:
+        return
+
+    with ProcessPoolExecutor(max_workers=len(archivos)) as executor:
+        futuros = {
+            executor.submit(sincronizar_archivo_geojson, file_path, table_name): geojson_file
+            for geojson_file, (file_path, table_name) in archivos.items()
+        }
+        for futuro in as_completed(futuros):
+            geojson_file = futuros[futuro]
+            try:
+                resumen = futuro.result()
+                print(f"✓ {geojson_file} sincronizado: {resumen['insertados']} nuevos, "
+                      f"{resumen['actualizados']} actualizados, {resumen['eliminados']} registros eliminados "
+                      f"({resumen['leidos']} features leídos, {resumen['omitidos']} omitidos)")
+            except Exception as e:
+                print(f"Error al sincronizar {geojson_file}: {str(e)}")
 
 def reset_sequences():
     """Actualiza todas las secuencias de las tablas para que comiencen desde el máximo ID + 1"""
@@ -248,9 +220,12 @@ def reset_sequences():
 
 if __name__ == "__main__":
     try:
-        init_db()
-        load_geojson_to_postgres()
-        reset_sequences()
+        if "--sync" in sys.argv:
+            sync_geojson_to_postgres()
+        else:
+            init_db()
+            load_geojson_to_postgres()
+            reset_sequences()
         print("\n¡Proceso completado exitosamente!")
     except Exception as e:
         print(f"\nError durante la ejecución: {str(e)}")
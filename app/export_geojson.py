@@ -1,55 +1,289 @@
+import argparse
+import json
 import os
-from app.config import DATABASE_URL
 import subprocess
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from app.database import get_connection, execute_single_query
+from app.db_access import _sql_propiedades
 
-def export_to_geojson(table_name, output_file):
-    """
-    Exporta una tabla a GeoJSON manteniendo todas las propiedades JSONB
-    """
-    # Construir la consulta SQL que combina la geometría y propiedades en formato GeoJSON
-    query = f"""
-    SELECT jsonb_build_object(
-        'type',     'FeatureCollection',
-        'features', jsonb_agg(feature)
-    )
-    FROM (
-        SELECT jsonb_build_object(
-            'type',       'Feature',
-            'geometry',   ST_AsGeoJSON(geom)::jsonb,
-            'properties', propiedades
-        ) AS feature
-        FROM {table_name}
-    ) AS features;
-    """
-    
-    # Construir el comando ogr2ogr para la exportación
+TABLAS_EXPORTACION = ['cable_corporativo', 'camaras', 'centrales', 'empalmes', 'reservas']
+
+# Formatos de salida: extensión del archivo y driver de ogr2ogr (None si se escribe directamente)
+FORMATOS_EXPORTACION = {
+    'geojson': {'extension': 'geojson', 'driver': None},
+    'geojsonseq': {'extension': 'geojsonl', 'driver': None},
+    'fgb': {'extension': 'fgb', 'driver': 'FlatGeobuf'},
+    'parquet': {'extension': 'parquet', 'driver': 'Parquet'}  # GeoParquet, requiere GDAL 3.5+ con Arrow
+}
+
+# Filas que el cursor del servidor envía en cada viaje
+FILAS_POR_VIAJE = 5000
+
+# Manifiesto de las exportaciones en exports/: marca de agua de la última, archivos e ids eliminados de cada una
+NOMBRE_MANIFIESTO = 'manifest.json'
+
+def iterar_features(table_name, condicion=None, params=None, id_en_propiedades=False, campos=None, sin_propiedades=False,
+                    columna_id="id", propiedades_extra=None):
+    """
+    Recorre los registros de una tabla como texto de GeoJSON Features, uno por registro, leyéndolos
+    con un cursor del lado del servidor: ni la base de datos ni Python arman la capa completa en memoria.
+
+    Args:
+        table_name: Tabla a exportar
+        condicion: Condición SQL opcional para filtrar los registros (WHERE)
+        params: Parámetros de la condición
+        id_en_propiedades: Agregar también el id del registro a las propiedades, como en las respuestas de la API
+        campos: Claves de las propiedades a exportar (todas si no se indican)
+        sin_propiedades: Exportar solo la geometría
+        columna_id: Expresión SQL del id de cada Feature (por ejemplo ids[1] en cable_corporativo_agregado)
+        propiedades_extra: Expresión SQL jsonb que se agrega a las propiedades de cada Feature
+    """
+    where = f"WHERE {condicion}" if condicion else ""
+    conn = get_connection()
+    try:
+        columna_propiedades = _sql_propiedades(conn, campos, sin_propiedades)
+        if id_en_propiedades:
+            columna_propiedades = f"COALESCE({columna_propiedades}, '{{}}'::jsonb) || jsonb_build_object('id', {columna_id})"
+        if propiedades_extra:
+            columna_propiedades = f"COALESCE({columna_propiedades}, '{{}}'::jsonb) || {propiedades_extra}"
+        with conn.cursor(name=f"exportar_{table_name}_{uuid.uuid4().hex[:8]}") as cur:
+            cur.itersize = FILAS_POR_VIAJE
+            cur.execute(f"""
+                SELECT {columna_id}, ST_AsGeoJSON(geom), ({columna_propiedades})::text
+                FROM {table_name}
+                {where}
+                ORDER BY 1
+            """, params or ())
+            for id_registro, geometria, propiedades in cur:
+                yield (
+                    f'{{"type": "Feature", "id": {id_registro}, "geometry": {geometria or "null"}, '
+                    f'"properties": {propiedades or "{}"}}}'
+                )
+    finally:
+        conn.close()
+
+def escribir_geojson(features, salida):
+    """Escribe los Features como un FeatureCollection en un archivo de texto abierto"""
+    salida.write('{"type": "FeatureCollection", "features": [\n')
+    separador = ""
+    for feature in features:
+        salida.write(separador)
+        salida.write(feature)
+        separador = ",\n"
+    salida.write('\n]}\n')
+
+def escribir_geojsonseq(features, salida):
+    """Escribe los Features como GeoJSONSeq (un Feature por línea) en un archivo de texto abierto"""
+    for feature in features:
+        salida.write(feature)
+        salida.write("\n")
+
+def convertir_con_ogr2ogr(features, driver, output_file, layer_name):
+    """
+    Escribe los Features en un formato binario (FlatGeobuf, Parquet...) pasándolos como GeoJSONSeq
+    por la entrada estándar de ogr2ogr, sin archivo intermedio.
+    """
     cmd = [
         "ogr2ogr",
-        "-f", "GeoJSON",
+        "-f", driver,
         output_file,
-        f"PG:dbname={os.getenv('DB_NAME')} user={os.getenv('DB_USER')} password={os.getenv('DB_PASSWORD')} host={os.getenv('DB_HOST')} port={os.getenv('DB_PORT', '5432')}",
-        "-sql", query
+        "-if", "GeoJSONSeq",
+        "/vsistdin/",
+        "-nln", layer_name
     ]
-    
-    subprocess.run(cmd, check=True)
+    # Los mensajes de ogr2ogr van a un archivo temporal para que no se bloquee escribiendo en un pipe lleno
+    with tempfile.TemporaryFile() as errores:
+        proceso = subprocess.Popen(cmd, stdin=subprocess.PIPE, stderr=errores)
+        try:
+            for feature in features:
+                proceso.stdin.write(feature.encode("utf-8"))
+                proceso.stdin.write(b"\n")
+        except BrokenPipeError:
+            pass
+        finally:
+            proceso.stdin.close()
+        if proceso.wait() != 0:
+            errores.seek(0)
+            raise subprocess.CalledProcessError(proceso.returncode, cmd, stderr=errores.read().decode(errors="replace"))
+
+def export_to_geojson(table_name, output_file, formato='geojson', condicion=None, params=None, id_en_propiedades=False,
+                      campos=None, sin_propiedades=False, columna_id="id", propiedades_extra=None):
+    """
+    Exporta una tabla a un archivo manteniendo todas las propiedades JSONB.
+
+    El archivo se escribe a medida que llegan los registros y se renombra al terminar, de modo que
+    un archivo existente solo se reemplaza cuando la exportación se completó.
+
+    Returns:
+        La cantidad de registros exportados
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato no válido: {formato}. Opciones: {', '.join(FORMATOS_EXPORTACION)}")
+
+    temporal = f"{output_file}.tmp"
+    registros = 0
 
-def export_all_tables():
+    def contar(features):
+        nonlocal registros
+        for feature in features:
+            registros += 1
+            yield feature
+
+    features = iterar_features(table_name, condicion, params, id_en_propiedades, campos, sin_propiedades,
+                               columna_id, propiedades_extra)
+    try:
+        driver = FORMATOS_EXPORTACION[formato]['driver']
+        if driver:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+            convertir_con_ogr2ogr(contar(features), driver, temporal, table_name)
+        else:
+            escribir = escribir_geojson if formato == 'geojson' else escribir_geojsonseq
+            with open(temporal, "w", encoding="utf-8") as salida:
+                escribir(contar(features), salida)
+        os.replace(temporal, output_file)
+        return registros
+    except Exception:
+        features.close()
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+
+def leer_manifiesto(output_dir):
+    """Manifiesto de exports/, o uno vacío si todavía no hay exportaciones"""
+    ruta = os.path.join(output_dir, NOMBRE_MANIFIESTO)
+    if not os.path.exists(ruta):
+        return {"marca_agua": None, "exportaciones": []}
+    with open(ruta, encoding="utf-8") as archivo:
+        return json.load(archivo)
+
+def escribir_manifiesto(output_dir, manifiesto):
+    ruta = os.path.join(output_dir, NOMBRE_MANIFIESTO)
+    with open(f"{ruta}.tmp", "w", encoding="utf-8") as archivo:
+        json.dump(manifiesto, archivo, ensure_ascii=False, indent=2)
+    os.replace(f"{ruta}.tmp", ruta)
+
+def leer_eliminados(table_name, condicion, params):
+    """Ids de los registros eliminados de una tabla según sus marcas en cambios_eliminados (sql/create_cambios.sql)"""
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(f"""
+                SELECT DISTINCT elemento_id
+                FROM cambios_eliminados
+                WHERE capa = %s AND {condicion}
+                ORDER BY elemento_id
+            """, (table_name, *params))
+            return [fila[0] for fila in cur.fetchall()]
+    finally:
+        conn.close()
+
+def exportar_tabla(table_name, output_file, formato, condicion=None, params=None, condicion_eliminados=None):
     """
-    Exporta todas las tablas a archivos GeoJSON
+    Exporta una tabla y, en las exportaciones incrementales, lee también sus registros eliminados.
+
+    Returns:
+        Una tupla (registros exportados, ids eliminados o None en las exportaciones completas)
+    """
+    registros = export_to_geojson(table_name, output_file, formato, condicion, params)
+    eliminados = leer_eliminados(table_name, condicion_eliminados, params) if condicion_eliminados else None
+    return registros, eliminados
+
+def export_all_tables(formato='geojson', desde=None, incremental=False):
+    """
+    Exporta todas las tablas a archivos en exports/, todas a la vez (un hilo por tabla).
+
+    Sin desde ni incremental se exportan las tablas completas. Con incremental se exportan solo los
+    registros escritos después de la marca de agua de la última exportación del manifiesto, y con
+    desde los creados o actualizados después de esa fecha, en archivos {tabla}_delta_{fecha}. Los ids
+    de los registros eliminados en el mismo intervalo (marcas de cambios_eliminados) se listan en el
+    manifiesto, para que los consumidores apliquen cada delta completo.
+
+    La marca de agua no es una hora sino el xid de la transacción más antigua en curso al empezar
+    (pg_snapshot_xmin, como el feed de /api/{capa}/cambios): cada delta contiene los cambios de las
+    transacciones entre la marca anterior y la nueva, todas ya terminadas, de modo que un cambio
+    confirmado tarde nunca queda antes de la marca. Requiere la columna version_xid de sql/create_cambios.sql.
+
+    Cada exportación se registra en exports/manifest.json con su intervalo, sus archivos, la
+    cantidad de registros de cada uno y los ids eliminados.
     """
-    tables = ['cable_corporativo', 'camaras', 'centrales', 'empalmes', 'reservas']
     output_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'exports')
-    
+    extension = FORMATOS_EXPORTACION[formato]['extension']
+
     # Crear directorio de exportación si no existe
     os.makedirs(output_dir, exist_ok=True)
-    
-    for table in tables:
-        output_file = os.path.join(output_dir, f"{table}_export.geojson")
-        try:
-            export_to_geojson(table, output_file)
-            print(f"Exportado exitosamente: {table} -> {output_file}")
-        except subprocess.CalledProcessError as e:
-            print(f"Error exportando {table}: {str(e)}")
+
+    manifiesto = leer_manifiesto(output_dir)
+    marca_anterior = None
+    if incremental and desde is None:
+        marca = manifiesto["marca_agua"]
+        if isinstance(marca, str):
+            # Manifiestos anteriores guardaban la marca de agua como fecha
+            desde = datetime.fromisoformat(marca)
+        elif marca is not None:
+            marca_anterior = marca
+        else:
+            print("No hay una exportación anterior en el manifiesto; se exportan las tablas completas")
+    horizonte, fecha = execute_single_query("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint, now()")
+
+    if marca_anterior is not None:
+        tipo = "incremental"
+        condicion = "version_xid >= %s::text::xid8 AND version_xid < %s::text::xid8"
+        condicion_eliminados = condicion
+        params = (marca_anterior, horizonte)
+    elif desde is not None:
+        tipo = "incremental"
+        condicion = "updated_at > %s AND version_xid < %s::text::xid8"
+        condicion_eliminados = "eliminado_at > %s AND version_xid < %s::text::xid8"
+        params = (desde, horizonte)
+    else:
+        tipo = "completa"
+        condicion = condicion_eliminados = params = None
+    sufijo = "export" if tipo == "completa" else f"delta_{fecha:%Y%m%dT%H%M%S}"
+
+    archivos = {}
+    with ThreadPoolExecutor(max_workers=len(TABLAS_EXPORTACION)) as executor:
+        futuros = {}
+        for table in TABLAS_EXPORTACION:
+            output_file = os.path.join(output_dir, f"{table}_{sufijo}.{extension}")
+            futuro = executor.submit(exportar_tabla, table, output_file, formato, condicion, params, condicion_eliminados)
+            futuros[futuro] = (table, output_file)
+
+        for futuro in as_completed(futuros):
+            table, output_file = futuros[futuro]
+            try:
+                registros, eliminados = futuro.result()
+                archivos[table] = {"archivo": os.path.basename(output_file), "registros": registros}
+                if eliminados is not None:
+                    archivos[table]["eliminados"] = eliminados
+                print(f"Exportado exitosamente: {table} -> {output_file} ({registros} registros)")
+            except Exception as e:
+                print(f"Error exportando {table}: {str(e)}")
+
+    # La marca de agua solo avanza si todas las tablas se exportaron
+    if len(archivos) == len(TABLAS_EXPORTACION):
+        manifiesto["marca_agua"] = horizonte
+    manifiesto["exportaciones"].append({
+        "tipo": tipo,
+        "desde": desde.isoformat() if isinstance(desde, datetime) else desde,
+        "desde_xid": marca_anterior,
+        "hasta_xid": horizonte,
+        "fecha": fecha.isoformat(),
+        "formato": formato,
+        "archivos": archivos
+    })
+    escribir_manifiesto(output_dir, manifiesto)
 
 if __name__ == "__main__":
-    export_all_tables()
+    parser = argparse.ArgumentParser(description="Exporta las tablas a archivos en exports/")
+    parser.add_argument("--formato", choices=list(FORMATOS_EXPORTACION), default='geojson',
+                        help="Formato de salida (por defecto, geojson)")
+    parser.add_argument("--since", dest="desde", type=datetime.fromisoformat, default=None,
+                        help="Exportar solo los registros creados o actualizados después de esta fecha (ISO 8601)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Exportar solo los cambios (y eliminaciones) desde la última exportación registrada en el manifiesto")
+    args = parser.parse_args()
+    export_all_tables(args.formato, args.desde, args.incremental)
@@ -0,0 +1,441 @@
+"""
+Importación de archivos GeoJSON grandes a las tablas de la base de datos, sin cargarlos completos en memoria.
+
+El FeatureCollection se lee por bloques y cada Feature se decodifica apenas está completo, de modo que
+la memoria usada depende del tamaño del lote y no del archivo. Los lotes se envían con COPY a una tabla
+temporal y desde ahí se insertan en la tabla final con una sola sentencia por lote, que convierte la
+geometría GeoJSON y la reproyecta a EPSG:4326 en PostGIS (por ejemplo, desde EPSG:3116 como en
+data/centrales.geojson, según el "crs" del archivo).
+
+Uso desde la línea de comandos:
+    python -m app.importar_geojson <archivo.geojson> <tabla> [--srid 3116] [--lote 5000] [--usuario nombre]
+"""
+import argparse
+import codecs
+import hashlib
+import io
+import json
+import mmap
+import re
+import sys
+from contextlib import contextmanager
+
+from .database import get_connection
+
+TABLAS_IMPORTABLES = ['cable_corporativo', 'camaras', 'centrales', 'empalmes', 'reservas']
+TAMANO_LOTE = 5000
+TAMANO_BLOQUE = 1024 * 1024  # Bytes leídos del archivo en cada lectura
+# Texto máximo pendiente de decodificar (la cabecera o un Feature): un archivo mal formado se rechaza al
+# superarlo, en lugar de acumularse en memoria hasta el final
+TAMANO_MAXIMO_PENDIENTE = 64 * 1024 * 1024
+
+_PATRON_FEATURES = re.compile(r'"features"\s*:\s*\[')
+_PATRON_CRS = re.compile(r'"crs"\s*:\s*')
+_PATRON_EPSG = re.compile(r'EPSG:+(\d+)', re.IGNORECASE)
+
+
+class LectorFeatureCollection:
+    """
+    Recorre los Features de un FeatureCollection leyendo el archivo por bloques.
+
+    El "crs" se toma de la cabecera (lo que aparece antes de "features"), que es donde lo escriben
+    ogr2ogr y la mayoría de las herramientas; el atributo srid queda en None si no hay crs.
+
+    Si la cabecera o un Feature superan tamano_maximo caracteres sin poder decodificarse, se lanza
+    ValueError sin seguir leyendo el archivo.
+    """
+
+    def __init__(self, archivo, tamano_bloque=TAMANO_BLOQUE, tamano_maximo=TAMANO_MAXIMO_PENDIENTE):
+        self._archivo = archivo
+        self._tamano_bloque = tamano_bloque
+        self._tamano_maximo = tamano_maximo
+        self._decodificador = codecs.getincrementaldecoder('utf-8-sig')()
+        self._json = json.JSONDecoder()
+        self._texto = ""
+        self._pos = 0
+        self._fin_archivo = False
+        self.srid = None
+        self._leer_cabecera()
+
+    def _leer_bloque(self):
+        if len(self._texto) - self._pos > self._tamano_maximo:
+            raise ValueError(
+                f"El archivo GeoJSON está mal formado o tiene un Feature de más de {self._tamano_maximo} caracteres"
+            )
+        bloque = self._archivo.read(self._tamano_bloque)
+        if isinstance(bloque, str):
+            bloque = bloque.encode('utf-8')
+        if not bloque:
+            self._fin_archivo = True
+            self._texto += self._decodificador.decode(b"", final=True)
+            return False
+        # Descartar lo ya procesado antes de agregar el bloque nuevo
+        self._texto = self._texto[self._pos:] + self._decodificador.decode(bloque)
+        self._pos = 0
+        return True
+
+    def _leer_cabecera(self):
+        while True:
+            coincidencia = _PATRON_FEATURES.search(self._texto)
+            if coincidencia:
+                break
+            if not self._leer_bloque():
+                raise ValueError("El archivo no es un GeoJSON FeatureCollection (no se encontró 'features')")
+        cabecera = self._texto[:coincidencia.start()]
+        crs = _PATRON_CRS.search(cabecera)
+        if crs:
+            try:
+                objeto_crs, _ = self._json.raw_decode(cabecera, crs.end())
+                epsg = _PATRON_EPSG.search(json.dumps(objeto_crs))
+                if epsg:
+                    self.srid = int(epsg.group(1))
+            except json.JSONDecodeError:
+                pass
+        self._pos = coincidencia.end()
+
+    def __iter__(self):
+        while True:
+            # Saltar espacios y separadores entre Features
+            while True:
+                while self._pos < len(self._texto) and self._texto[self._pos] in " \t\r\n,":
+                    self._pos += 1
+                if self._pos < len(self._texto) or not self._leer_bloque():
+                    break
+            if self._pos >= len(self._texto):
+                raise ValueError("El archivo GeoJSON está incompleto")
+            if self._texto[self._pos] == "]":
+                return
+            try:
+                feature, fin = self._json.raw_decode(self._texto, self._pos)
+            except json.JSONDecodeError:
+                # El Feature sigue en el próximo bloque
+                if not self._leer_bloque():
+                    raise
+                continue
+            self._pos = fin
+            yield feature
+
+
+@contextmanager
+def abrir_geojson(ruta):
+    """Abre un archivo GeoJSON para LectorFeatureCollection, mapeado en memoria si el sistema lo permite"""
+    with open(ruta, "rb") as archivo:
+        try:
+            mapa = mmap.mmap(archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Archivos vacíos o sistemas de archivos que no admiten mmap
+            yield archivo
+            return
+        with mapa:
+            yield mapa
+
+
+# Valor NULL en el formato de texto de COPY
+NULL_COPY = "\\N"
+
+
+def _valor_copy(texto):
+    """Escapa un valor para el formato de texto de COPY"""
+    return texto.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def hash_feature(geometria, propiedades, srid):
+    """
+    Hash del Feature tal como viene en el archivo (geometría, propiedades y SRID de origen), que se
+    guarda en hash_origen para saber en la sincronización si cambió desde la última entrega
+    """
+    contenido = json.dumps([geometria, propiedades, srid], sort_keys=True, ensure_ascii=False)
+    return hashlib.md5(contenido.encode("utf-8")).hexdigest()
+
+
+def _features_copy(lector, claves_minusculas, srid, tamano_lote, incluir_sin_geometria=False):
+    """
+    Convierte los Features en filas para COPY (orden, geometria, propiedades, hash_origen) y las agrupa
+    en lotes de tamano_lote filas. Devuelve tuplas (buffer, Features leídos hasta el final del lote).
+
+    Los Features sin geometría se descartan, salvo con incluir_sin_geometria, que los deja con la
+    geometría en NULL (la sincronización necesita sus claves).
+    """
+    buffer = io.StringIO()
+    en_lote = leidos = 0
+    for feature in lector:
+        leidos += 1
+        geometria = feature.get("geometry")
+        if not geometria and not incluir_sin_geometria:
+            continue
+        propiedades = feature.get("properties") or {}
+        if claves_minusculas:
+            propiedades = {clave.lower(): valor for clave, valor in propiedades.items()}
+        buffer.write(
+            f"{leidos}\t{_valor_copy(json.dumps(geometria)) if geometria else NULL_COPY}\t"
+            f"{_valor_copy(json.dumps(propiedades, ensure_ascii=False))}\t"
+            f"{hash_feature(geometria, propiedades, srid)}\n"
+        )
+        en_lote += 1
+        if en_lote >= tamano_lote:
+            buffer.seek(0)
+            yield buffer, leidos
+            buffer = io.StringIO()
+            en_lote = 0
+    buffer.seek(0)
+    yield buffer, leidos
+
+
+def _sql_insertar_importacion(tabla, carga_inicial):
+    """
+    Sentencia que pasa un lote de la tabla temporal a la tabla final. Los cables MULTILINESTRING se
+    separan en un registro por parte, porque la tabla guarda LINESTRING. En la carga inicial los ids
+    se toman de la posición del Feature en el archivo (y de la parte, para cables), como en la carga
+    anterior con ogr2ogr; en las importaciones normales los asigna la secuencia de la tabla.
+    """
+    if carga_inicial:
+        estado, carga = "'inicial'", "true"
+    else:
+        estado, carga = "'pendiente'", "false"
+    geometria = "ST_Transform(ST_SetSRID(ST_GeomFromGeoJSON(i.geometria), %(srid)s), 4326)"
+    if tabla == 'cable_corporativo':
+        id_columna, id_valor = ("id, ", "(p.orden * 1000) + p.parte, ") if carga_inicial else ("", "")
+        return f"""
+            INSERT INTO cable_corporativo ({id_columna}geom, propiedades, created_by, updated_by, estado, is_initial_load, distancia_metros, hash_origen)
+            SELECT {id_valor}p.geom, p.propiedades, %(usuario)s, %(usuario)s, {estado}, {carga},
+                   ST_Length(p.geom::geography)::float, p.hash_origen
+            FROM (
+                SELECT i.orden, d.path[1] AS parte, d.geom, i.propiedades, i.hash_origen
+                FROM _importacion i
+                CROSS JOIN LATERAL ST_Dump({geometria}) AS d
+                WHERE GeometryType(d.geom) = 'LINESTRING'
+            ) AS p
+            ON CONFLICT DO NOTHING
+        """
+    id_columna, id_valor = ("id, ", "i.orden, ") if carga_inicial else ("", "")
+    return f"""
+        INSERT INTO {tabla} ({id_columna}geom, propiedades, created_by, updated_by, estado, is_initial_load, hash_origen)
+        SELECT {id_valor}{geometria}, i.propiedades, %(usuario)s, %(usuario)s, {estado}, {carga}, i.hash_origen
+        FROM _importacion i
+        ON CONFLICT DO NOTHING
+    """
+
+
+def importar_geojson(archivo, tabla, username="sistema", srid=None, tamano_lote=TAMANO_LOTE,
+                     claves_minusculas=True, carga_inicial=False):
+    """
+    Importa un FeatureCollection a una tabla por lotes, informando el avance.
+
+    Args:
+        archivo: Archivo abierto (binario o de texto) con el FeatureCollection
+        tabla: Una de TABLAS_IMPORTABLES
+        username: Usuario para created_by / updated_by
+        srid: SRID de las coordenadas; por defecto el del "crs" del archivo, o 4326 si no tiene
+        tamano_lote: Features enviados en cada COPY
+        claves_minusculas: Pasar los nombres de las propiedades a minúsculas, como hace ogr2ogr
+            con PostgreSQL (id_texto, objectid...), para que coincidan con los datos existentes
+        carga_inicial: Registros de la carga inicial (estado 'inicial', ids según la posición en el archivo)
+
+    Yields:
+        Un diccionario inicial (tipo 'inicio') en cuanto se leyó la cabecera, antes de escribir nada;
+        uno de progreso por lote (tipo 'progreso') y uno final (tipo 'fin') con los Features leídos,
+        los registros insertados y los omitidos (geometría vacía o duplicados)
+    """
+    if tabla not in TABLAS_IMPORTABLES:
+        raise ValueError(f"Tabla no válida: {tabla}. Opciones: {', '.join(TABLAS_IMPORTABLES)}")
+
+    lector = LectorFeatureCollection(archivo)
+    srid = srid or lector.srid or 4326
+    sql = _sql_insertar_importacion(tabla, carga_inicial)
+    leidos = insertados = 0
+    # La cabecera ya es válida: se informa antes de escribir el primer lote
+    yield {"tipo": "inicio", "tabla": tabla, "srid_origen": srid}
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE IF NOT EXISTS _importacion (
+                    orden integer, geometria text, propiedades jsonb, hash_origen text
+                ) ON COMMIT DELETE ROWS
+            """)
+
+            for buffer, leidos in _features_copy(lector, claves_minusculas, srid, tamano_lote):
+                cur.copy_expert("COPY _importacion (orden, geometria, propiedades, hash_origen) FROM STDIN", buffer)
+                cur.execute(sql, {"srid": srid, "usuario": username})
+                insertados += cur.rowcount
+                conn.commit()
+                yield {"tipo": "progreso", "tabla": tabla, "leidos": leidos, "insertados": insertados}
+
+            yield {
+                "tipo": "fin",
+                "tabla": tabla,
+                "srid_origen": srid,
+                "leidos": leidos,
+                "insertados": insertados,
+                "omitidos": max(leidos - insertados, 0) if tabla != 'cable_corporativo' else None
+            }
+    finally:
+        conn.close()
+
+
+# Clave con la que se reconoce un Feature entre entregas del mismo archivo
+CLAVE_ORIGEN = "COALESCE(propiedades->>'id_texto', propiedades->>'objectid')"
+
+
+def sincronizar_geojson(archivo, tabla, srid=None, tamano_lote=TAMANO_LOTE, claves_minusculas=True):
+    """
+    Sincroniza los registros de la carga inicial de una tabla con una nueva entrega del archivo GeoJSON,
+    sin borrar ni recargar la tabla.
+
+    Cada Feature se reconoce por su id_texto (o su objectid si no tiene) y se compara por hash_origen
+    con el registro cargado: solo se insertan los Features nuevos, se actualizan los que cambiaron y se
+    eliminan los que ya no vienen en el archivo. Solo se tocan los registros de la carga inicial que
+    siguen en estado 'inicial'; los registros creados o editados desde la API ('pendiente', 'aprobado'...) se
+    conservan. Todo se aplica en una sola transacción.
+
+    Los Features sin clave, sin geometría (su registro se conserva sin cambios) y las repeticiones de
+    una clave se omiten. Los registros cargados antes de que existiera hash_origen se
+    actualizan una vez, en la primera sincronización.
+
+    Returns:
+        Un diccionario con los Features leídos y omitidos, los Features insertados y actualizados
+        y los registros eliminados
+    """
+    if tabla not in TABLAS_IMPORTABLES:
+        raise ValueError(f"Tabla no válida: {tabla}. Opciones: {', '.join(TABLAS_IMPORTABLES)}")
+
+    lector = LectorFeatureCollection(archivo)
+    srid = srid or lector.srid or 4326
+    geometria = "ST_Transform(ST_SetSRID(ST_GeomFromGeoJSON(e.geometria), %(srid)s), 4326)"
+    clave_tabla = CLAVE_ORIGEN.replace("propiedades", "t.propiedades")
+    leidos = 0
+
+    conn = get_connection()
+    try:
+        with conn.cursor() as cur:
+            cur.execute("""
+                CREATE TEMP TABLE _sincronizacion (
+                    orden integer, geometria text, propiedades jsonb, hash_origen text
+                ) ON COMMIT DROP
+            """)
+            for buffer, leidos in _features_copy(lector, claves_minusculas, srid, tamano_lote, incluir_sin_geometria=True):
+                cur.copy_expert("COPY _sincronizacion (orden, geometria, propiedades, hash_origen) FROM STDIN", buffer)
+
+            # Un Feature por clave (el primero del archivo con geometría, si lo hay) y las claves de los
+            # registros de la carga inicial. Los Features sin geometría conservan su clave, para que sus
+            # registros no se tomen como eliminados, pero no se insertan ni actualizan
+            cur.execute(f"""
+                CREATE TEMP TABLE _entrantes ON COMMIT DROP AS
+                SELECT DISTINCT ON (clave) *
+                FROM (SELECT {CLAVE_ORIGEN} AS clave, * FROM _sincronizacion) AS s
+                WHERE clave IS NOT NULL
+                ORDER BY clave, geometria IS NULL, orden;
+                CREATE INDEX ON _entrantes (clave);
+                ANALYZE _entrantes;
+
+                CREATE TEMP TABLE _existentes ON COMMIT DROP AS
+                SELECT t.id, {clave_tabla} AS clave, t.hash_origen
+                FROM {tabla} t
+                WHERE t.is_initial_load AND t.estado = 'inicial' AND {clave_tabla} IS NOT NULL;
+                CREATE INDEX ON _existentes (clave);
+                ANALYZE _existentes;
+            """)
+
+            cur.execute("SELECT COUNT(*) FROM _sincronizacion")
+            registrados = cur.fetchone()[0]
+
+            # Eliminados: claves que ya no vienen en el archivo
+            cur.execute(f"""
+                DELETE FROM {tabla} t
+                USING _existentes x
+                WHERE t.id = x.id
+                AND NOT EXISTS (SELECT 1 FROM _entrantes e WHERE e.clave = x.clave)
+            """)
+            eliminados = cur.rowcount
+
+            if tabla == 'cable_corporativo':
+                # Los cables cambiados se reemplazan completos, porque cada Feature puede tener varias partes
+                cur.execute("""
+                    DELETE FROM cable_corporativo t
+                    USING _existentes x, _entrantes e
+                    WHERE t.id = x.id AND e.clave = x.clave
+                    AND e.geometria IS NOT NULL
+                    AND x.hash_origen IS DISTINCT FROM e.hash_origen
+                    RETURNING x.clave
+                """)
+                actualizados = len({fila[0] for fila in cur.fetchall()})
+                cur.execute(f"""
+                    INSERT INTO cable_corporativo (geom, propiedades, created_by, updated_by, estado, is_initial_load, distancia_metros, hash_origen)
+                    SELECT d.geom, e.propiedades, 'sistema', 'sistema', 'inicial', true,
+                           ST_Length(d.geom::geography)::float, e.hash_origen
+                    FROM _entrantes e
+                    CROSS JOIN LATERAL ST_Dump({geometria}) AS d
+                    WHERE GeometryType(d.geom) = 'LINESTRING'
+                    AND e.geometria IS NOT NULL
+                    AND NOT EXISTS (
+                        SELECT 1 FROM _existentes x
+                        WHERE x.clave = e.clave AND x.hash_origen IS NOT DISTINCT FROM e.hash_origen
+                    )
+                    RETURNING {CLAVE_ORIGEN}
+                """, {"srid": srid})
+                insertados = len({fila[0] for fila in cur.fetchall()}) - actualizados
+            else:
+                cur.execute(f"""
+                    UPDATE {tabla} t
+                    SET geom = {geometria},
+                        propiedades = e.propiedades,
+                        hash_origen = e.hash_origen,
+                        updated_by = 'sistema',
+                        updated_at = now()
+                    FROM _existentes x
+                    JOIN _entrantes e ON e.clave = x.clave
+                    WHERE t.id = x.id
+                    AND e.geometria IS NOT NULL
+                    AND x.hash_origen IS DISTINCT FROM e.hash_origen
+                """, {"srid": srid})
+                actualizados = cur.rowcount
+                cur.execute(f"""
+                    INSERT INTO {tabla} (geom, propiedades, created_by, updated_by, estado, is_initial_load, hash_origen)
+                    SELECT {geometria}, e.propiedades, 'sistema', 'sistema', 'inicial', true, e.hash_origen
+                    FROM _entrantes e
+                    WHERE e.geometria IS NOT NULL
+                    AND NOT EXISTS (SELECT 1 FROM _existentes x WHERE x.clave = e.clave)
+                    ON CONFLICT DO NOTHING
+                """, {"srid": srid})
+                insertados = cur.rowcount
+
+            cur.execute("SELECT COUNT(*) FROM _entrantes WHERE geometria IS NOT NULL")
+            aplicables = cur.fetchone()[0]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+    return {
+        "tabla": tabla,
+        "srid_origen": srid,
+        "leidos": leidos,
+        "omitidos": registrados - aplicables,
+        "insertados": insertados,
+        "actualizados": actualizados,
+        "eliminados": eliminados
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Importa un archivo GeoJSON a una tabla por lotes")
+    parser.add_argument("archivo", help="Ruta del archivo GeoJSON (FeatureCollection)")
+    parser.add_argument("tabla", choices=TABLAS_IMPORTABLES, help="Tabla de destino")
+    parser.add_argument("--srid", type=int, default=None, help="SRID de las coordenadas (por defecto, el del crs del archivo)")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE, help="Features por lote")
+    parser.add_argument("--usuario", default="sistema", help="Usuario para created_by / updated_by")
+    args = parser.parse_args()
+
+    with abrir_geojson(args.archivo) as archivo:
+        for avance in importar_geojson(archivo, args.tabla, args.usuario, args.srid, args.lote):
+            if avance["tipo"] == "progreso":
+                print(f"- {avance['leidos']} features leídos, {avance['insertados']} registros insertados")
+            else:
+                print(f"✓ {args.archivo} importado en {avance['tabla']}: {avance['leidos']} features leídos, "
+                      f"{avance['insertados']} registros insertados (SRID de origen {avance['srid_origen']})")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
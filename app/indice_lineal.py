@@ -0,0 +1,54 @@
+"""
+Interpolación sobre el índice de referencia lineal (sql/create_indice_lineal.sql).
+
+Cada elemento del índice guarda la longitud geodésica acumulada en cada vértice y sus coordenadas,
+empaquetadas como float8 big-endian. Ubicar el punto a una distancia dada es una búsqueda binaria
+sobre las longitudes acumuladas y una interpolación dentro del segmento encontrado.
+"""
+import bisect
+import struct
+
+
+def desempaquetar(datos):
+    """Convierte un bytea de float8 big-endian en una tupla de floats"""
+    datos = bytes(datos)
+    return struct.unpack(f">{len(datos) // 8}d", datos)
+
+
+def cargar_indice(longitudes, coordenadas):
+    """
+    Construye el índice de un elemento a partir de las columnas longitudes y coordenadas.
+
+    Returns:
+        Una tupla (longitudes, lons, lats) con las longitudes acumuladas y las coordenadas de cada vértice
+    """
+    valores = desempaquetar(coordenadas)
+    return desempaquetar(longitudes), valores[0::2], valores[1::2]
+
+
+def punto_a_distancia(indice, distancia):
+    """
+    Calcula el punto a una distancia en metros desde el inicio del elemento.
+
+    La distancia se limita a la longitud del elemento. Dentro del segmento el punto se interpola
+    en proporción a la longitud geodésica recorrida.
+
+    Returns:
+        Una tupla (lon, lat, segmento) donde segmento es el índice del vértice inicial del segmento
+    """
+    longitudes, lons, lats = indice
+    if len(longitudes) == 1 or distancia <= 0:
+        return lons[0], lats[0], 0
+    if distancia >= longitudes[-1]:
+        return lons[-1], lats[-1], len(longitudes) - 2
+
+    # Primer vértice cuya longitud acumulada supera la distancia; el segmento termina en él
+    fin = bisect.bisect_right(longitudes, distancia)
+    inicio = fin - 1
+    tramo = longitudes[fin] - longitudes[inicio]
+    fraccion = (distancia - longitudes[inicio]) / tramo if tramo > 0 else 0.0
+    return (
+        lons[inicio] + (lons[fin] - lons[inicio]) * fraccion,
+        lats[inicio] + (lats[fin] - lats[inicio]) * fraccion,
+        inicio
+    )
@@ -7,6 +7,9 @@ from fastapi.openapi.utils import get_openapi
 from fastapi.staticfiles import StaticFiles
 from .routes import cache_routes, logic_routes, write_routes
 from .routes.api_models import ErrorResponse, ErrorCode
+from .cola_escritura import detener_cola
+from .notificaciones import obtener_notificador, detener_notificador
+from . import config
 import traceback
 
 app = FastAPI(
@@ -122,4 +125,18 @@ async def general_exception_handler(request: Request, exc: Exception):
 # Incluir las rutas modulares
 app.include_router(cache_routes.router, prefix="/api")
 app.include_router(logic_routes.router, prefix="/api")
-app.include_router(write_routes.router, prefix="/api")
\ No newline at end of file
+app.include_router(write_routes.router, prefix="/api")
+
+@app.on_event("startup")
+def startup_invalidacion_cache():
+    """Descartar las entradas de caché cuando cambian los datos, también si el cambio se hizo fuera de la API"""
+    if config.NOTIFICACIONES:
+        notificador = obtener_notificador()
+        notificador.agregar_oyente(cache_routes.invalidar_cache)
+        notificador.agregar_oyente(logic_routes.invalidar_cache)
+
+@app.on_event("shutdown")
+def shutdown_tareas_segundo_plano():
+    """Escribe las inserciones pendientes de la cola y cierra la escucha de notificaciones"""
+    detener_cola()
+    detener_notificador()
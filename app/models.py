@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Enum
+from sqlalchemy import Column, Integer, String, Float, DateTime, Boolean, Enum, Computed
 from sqlalchemy.ext.declarative import declarative_base
 from geoalchemy2 import Geometry
 from sqlalchemy.dialects.postgresql import JSONB
@@ -22,24 +22,36 @@ class BaseFeaturesTable:
     updated_by = Column(String)  # Usuario que actualizó por última vez
     estado = Column(Enum(EstadoRegistro), default=EstadoRegistro.PENDIENTE)
     is_initial_load = Column(Boolean, default=False)  # Indica si es parte de la carga inicial
+    hash_origen = Column(String)  # Hash del Feature en el archivo de origen (sincronización de la carga inicial)
+    # Columna generada con el id_texto de las propiedades (sql/create_columnas_generadas.sql)
+    id_texto = Column(String, Computed("propiedades->>'id_texto'", persisted=True))
 
 class CableCorporativo(Base, BaseFeaturesTable):
     __tablename__ = 'cable_corporativo'
     geom = Column(Geometry('LINESTRING', srid=4326))
     distancia_metros = Column(Float)
+    # Los cables creados desde la API guardan la clave como id_text
+    id_texto = Column(String, Computed("COALESCE(propiedades->>'id_texto', propiedades->>'id_text')", persisted=True))
+    nombre = Column(String, Computed("propiedades->>'name'", persisted=True))
+    colocacion = Column(String, Computed("propiedades->>'colocacion'", persisted=True))
+    es_troncal = Column(Boolean, Computed("(propiedades->>'colocacion') LIKE 'Troncal%'", persisted=True))
 
 class Camaras(Base, BaseFeaturesTable):
     __tablename__ = 'camaras'
     geom = Column(Geometry('POINT', srid=4326))
+    nombre = Column(String, Computed("propiedades->>'nombre_esp'", persisted=True))
 
 class Centrales(Base, BaseFeaturesTable):
     __tablename__ = 'centrales'
     geom = Column(Geometry('POINT', srid=4326))
+    nombre = Column(String, Computed("propiedades->>'nombre'", persisted=True))
 
 class Empalmes(Base, BaseFeaturesTable):
     __tablename__ = 'empalmes'
     geom = Column(Geometry('POINT', srid=4326))
+    nombre = Column(String, Computed("propiedades->>'name'", persisted=True))
 
 class Reservas(Base, BaseFeaturesTable):
     __tablename__ = 'reservas'
     geom = Column(Geometry('POINT', srid=4326))
+    nombre = Column(String, Computed("propiedades->>'nombre'", persisted=True))
@@ -0,0 +1,155 @@
+"""
+Escucha de las notificaciones de cambios de la base de datos (LISTEN/NOTIFY).
+
+Cada proceso de la aplicación abre una sola conexión que escucha el canal 'cambios_capas', donde los
+triggers de sql/create_notificaciones.sql publican los cambios confirmados en las capas. Cada
+notificación se reparte a los suscriptores del proceso: las conexiones de /api/eventos (una cola
+asyncio por cliente) y las funciones registradas con agregar_oyente.
+
+Si la conexión se pierde, el hilo se reconecta con espera creciente y avisa a los oyentes con un
+evento de operación 'reconexion', porque los cambios ocurridos mientras tanto no se notificaron.
+"""
+import asyncio
+import json
+import select
+import threading
+import traceback
+
+import psycopg2
+import psycopg2.extensions
+
+from .database import get_connection
+
+CANAL_CAMBIOS = "cambios_capas"
+# Eventos pendientes por cliente; si un cliente no los consume se desconecta
+MAX_EVENTOS_CLIENTE = 1000
+# Espera máxima entre reintentos de conexión (segundos)
+MAX_ESPERA_RECONEXION_S = 60
+
+
+class Notificador:
+    def __init__(self):
+        self._clientes = set()
+        self._oyentes = []
+        self._bloqueo = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    def iniciar(self):
+        self._hilo = threading.Thread(target=self._escuchar, name="notificaciones", daemon=True)
+        self._hilo.start()
+
+    def detener(self, timeout=5):
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(timeout)
+
+    def suscribir(self):
+        """
+        Registra un cliente de eventos en el loop asyncio actual.
+
+        Returns:
+            Una tupla (loop, cola) que identifica al cliente y se pasa a desuscribir. La cola
+            (asyncio.Queue) recibe cada evento como diccionario, o None si el cliente se desconectó
+            por no consumir los eventos a tiempo
+        """
+        cliente = (asyncio.get_running_loop(), asyncio.Queue(maxsize=MAX_EVENTOS_CLIENTE))
+        with self._bloqueo:
+            self._clientes.add(cliente)
+        return cliente
+
+    def desuscribir(self, cliente):
+        with self._bloqueo:
+            self._clientes.discard(cliente)
+
+    def agregar_oyente(self, funcion):
+        """Registra una función que se llama desde el hilo de escucha con cada evento"""
+        with self._bloqueo:
+            self._oyentes.append(funcion)
+
+    def _repartir(self, evento, solo_oyentes=False):
+        with self._bloqueo:
+            clientes = [] if solo_oyentes else list(self._clientes)
+            oyentes = list(self._oyentes)
+
+        for funcion in oyentes:
+            try:
+                funcion(evento)
+            except Exception:
+                # Un oyente que falla no debe impedir que el evento llegue a los demás, pero el error
+                # se registra completo: una caché que no se invalidó sirve datos viejos
+                print(f"Error en el oyente de notificaciones {getattr(funcion, '__qualname__', funcion)}:")
+                traceback.print_exc()
+
+        for cliente in clientes:
+            loop, cola = cliente
+            try:
+                loop.call_soon_threadsafe(self._encolar, cliente, evento)
+            except RuntimeError:
+                # El loop del cliente ya se cerró
+                self.desuscribir(cliente)
+
+    def _encolar(self, cliente, evento):
+        _, cola = cliente
+        try:
+            cola.put_nowait(evento)
+        except asyncio.QueueFull:
+            # Cliente demasiado lento: se le avisa con None y deja de recibir eventos
+            self.desuscribir(cliente)
+            while not cola.empty():
+                cola.get_nowait()
+            cola.put_nowait(None)
+
+    def _escuchar(self):
+        espera = 1
+        while not self._detener.is_set():
+            conn = None
+            try:
+                conn = get_connection()
+                conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CANAL_CAMBIOS}")
+                espera = 1
+                # Lo que cambió mientras no se escuchaba se perdió: los oyentes deben descartar todo
+                self._repartir({"capa": None, "operacion": "reconexion"}, solo_oyentes=True)
+                while not self._detener.is_set():
+                    if select.select([conn], [], [], 1.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        notificacion = conn.notifies.pop(0)
+                        try:
+                            evento = json.loads(notificacion.payload)
+                        except ValueError:
+                            continue
+                        self._repartir(evento)
+            except Exception as e:
+                print(f"Error en la escucha de notificaciones, reintentando en {espera} s: {str(e)}")
+                self._detener.wait(espera)
+                espera = min(espera * 2, MAX_ESPERA_RECONEXION_S)
+            finally:
+                if conn is not None:
+                    conn.close()
+
+
+_notificador = None
+_bloqueo = threading.Lock()
+
+
+def obtener_notificador():
+    """Notificador compartido del proceso; se inicia con el primer uso"""
+    global _notificador
+    with _bloqueo:
+        if _notificador is None:
+            _notificador = Notificador()
+            _notificador.iniciar()
+    return _notificador
+
+
+def detener_notificador():
+    """Cierra la conexión de escucha (al apagar la aplicación)"""
+    global _notificador
+    with _bloqueo:
+        if _notificador is not None:
+            _notificador.detener()
+            _notificador = None
@@ -102,6 +102,32 @@ class ReservaResponse(BaseModel):
             }
         }
 
+# Modelos de respuesta para inserciones por lotes
+class ErrorLoteItem(BaseModel):
+    indice: int = Field(..., description="Posición del elemento en la solicitud (desde 0)")
+    status: int = Field(..., description="Código HTTP equivalente al error del elemento (409, 422, 500...)")
+    message: Any = Field(..., description="Descripción del error")
+
+class InsercionLoteResponse(BaseModel):
+    message: str = Field(..., description="Mensaje de confirmación")
+    insertados: int = Field(..., description="Cantidad de elementos insertados")
+    actualizados: int = Field(0, description="Cantidad de registros existentes actualizados (solo con upsert)")
+    ids: List[Optional[int]] = Field(..., description="ID generado para cada elemento, en el orden de la solicitud (null si el elemento falló)")
+    errores: List[ErrorLoteItem] = Field([], description="Errores por elemento; los demás elementos se insertan igualmente")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "message": "2 de 3 elementos insertados correctamente",
+                "insertados": 2,
+                "actualizados": 0,
+                "ids": [501, None, 502],
+                "errores": [
+                    {"indice": 1, "status": 409, "message": "Ya existe una cámara con id_texto 'CAM-002'"}
+                ]
+            }
+        }
+
 # Punto geográfico usado en varios modelos
 class PuntoGeografico(BaseModel):
     longitud: float = Field(..., description="Longitud en grados decimales (WGS84)")
@@ -191,21 +217,52 @@ class PaginatedResponse(BaseModel):
         }
 
 # Modelos específicos para cada tipo de consulta
-class CamarasConsultaResponse(GeoJSONFeatureCollection):
+class PaginaConsultaResponse(GeoJSONFeatureCollection):
+    siguiente_despues_de_id: Optional[int] = Field(None, description="Si la página está completa, valor de 'despues_de_id' para pedir la siguiente")
+
+class CamarasConsultaResponse(PaginaConsultaResponse):
     pass
 
-class CablesConsultaResponse(GeoJSONFeatureCollection):
+class CablesConsultaResponse(PaginaConsultaResponse):
     pass
 
-class CentralesConsultaResponse(GeoJSONFeatureCollection):
+class CentralesConsultaResponse(PaginaConsultaResponse):
     pass
 
-class EmpalmeConsultaResponse(GeoJSONFeatureCollection):
+class EmpalmeConsultaResponse(PaginaConsultaResponse):
     pass
 
-class ReservaConsultaResponse(GeoJSONFeatureCollection):
+class ReservaConsultaResponse(PaginaConsultaResponse):
     pass
 
+# Feed de cambios de una capa
+class EliminadoItem(BaseModel):
+    id: int = Field(..., description="ID del registro")
+    version: int = Field(..., description="Versión del cambio")
+    motivo: str = Field(..., description="'eliminado' o 'rechazado'")
+
+class CambiosCapaResponse(GeoJSONFeatureCollection):
+    eliminados: List[EliminadoItem] = Field([], description="Registros que el cliente debe quitar de su copia local")
+    cursor: str = Field(..., description="Último cambio incluido ('<xid>:<version>'); se envía como 'desde' en la siguiente solicitud")
+    hay_mas: bool = Field(..., description="Indica si hay más cambios después del cursor")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Point", "coordinates": [-74.0617, 4.6737]},
+                        "properties": {"id": 501, "id_texto": "CAM-501", "estado": "pendiente", "version": 98231}
+                    }
+                ],
+                "eliminados": [{"id": 77, "version": 98240, "motivo": "eliminado"}],
+                "cursor": "7731942:98240",
+                "hay_mas": False
+            }
+        }
+
 # Versiones paginadas de los modelos de consulta
 class CamarasConsultaPaginada(PaginatedResponse):
     data: GeoJSONFeatureCollection
@@ -298,3 +355,67 @@ class LineaEnRutaRedResponse(BaseModel):
                 "distancia_solicitada": 150
             }
         }
+
+# Modelo para la respuesta de ruta entre dos puntos de la red
+class RutaEntrePuntosResponse(BaseModel):
+    status: str = Field(..., description="Estado de la operación ('success' o 'error')")
+    ruta: Optional[Dict[str, Any]] = Field(None, description="GeoJSON Feature con la geometría de la ruta, la distancia total y los cables recorridos")
+    origen: Optional[Dict[str, Any]] = Field(None, description="Vértice de la red al que se ajustó el punto de origen")
+    destino: Optional[Dict[str, Any]] = Field(None, description="Vértice de la red al que se ajustó el punto de destino")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "status": "success",
+                "ruta": {
+                    "type": "Feature",
+                    "geometry": {
+                        "type": "LineString",
+                        "coordinates": [
+                            [-74.0617, 4.6737],
+                            [-74.0618, 4.6738],
+                            [-74.0620, 4.6740]
+                        ]
+                    },
+                    "properties": {
+                        "distancia_metros": 412.8,
+                        "cables": ["CABLE-NORTE-01", "CABLE-NORTE-02"],
+                        "tramos": [
+                            {"nombre_cable": "CABLE-NORTE-01", "distancia_metros": 250.3},
+                            {"nombre_cable": "CABLE-NORTE-02", "distancia_metros": 162.5}
+                        ]
+                    }
+                },
+                "origen": {"vertice": 1021, "lon": -74.0617, "lat": 4.6737, "distancia_a_red": 3.2},
+                "destino": {"vertice": 1088, "lon": -74.0620, "lat": 4.6740, "distancia_a_red": 1.7}
+            }
+        }
+
+class LocalizarFallaOtdrResponse(BaseModel):
+    status: str = Field(..., description="Estado de la operación ('success' o 'error')")
+    type: str = Field("FeatureCollection", description="Tipo de objeto GeoJSON")
+    features: List[Dict[str, Any]] = Field(..., description="Puntos candidatos de corte con las cámaras y empalmes más cercanos")
+    central: Optional[Dict[str, Any]] = Field(None, description="Central de origen y vértice de la red al que se ajusta")
+    distancia: Optional[float] = Field(None, description="Distancia OTDR consultada en metros")
+    
+    class Config:
+        schema_extra = {
+            "example": {
+                "status": "success",
+                "type": "FeatureCollection",
+                "features": [
+                    {
+                        "type": "Feature",
+                        "geometry": {"type": "Point", "coordinates": [-74.0598, 4.6812]},
+                        "properties": {
+                            "arista": 5123,
+                            "nombre_cable": "CABLE-NORTE-01",
+                            "camaras_cercanas": [{"id": 311, "id_texto": "CAM-311", "distancia": 42.7}],
+                            "empalmes_cercanos": [{"id": 88, "id_texto": "EMP-088", "distancia": 120.4}]
+                        }
+                    }
+                ],
+                "central": {"id": 12, "vertice": 1021, "distancia_a_red": 3.2},
+                "distancia": 4250.0
+            }
+        }
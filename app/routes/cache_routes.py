@@ -1,6 +1,16 @@
-from fastapi import APIRouter, Depends, Query, status
-from fastapi.responses import JSONResponse
+import asyncio
+import json
+import os
+import re
+import shutil
+import tempfile
+from enum import Enum
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query, Path, Header, HTTPException, Request, status
+from fastapi.responses import JSONResponse, FileResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from ..auth import authenticate
+from .. import config
 from ..db_access import (
     get_camaras_from_db,
     get_all_camaras_from_db,
@@ -11,43 +21,222 @@ from ..db_access import (
     get_empalmes_from_db,
     get_all_empalmes_from_db,
     get_reservas_from_db,
-    get_all_reservas_from_db
+    get_all_reservas_from_db,
+    get_cambios_db
 )
-import cachetools
-from cachetools import cached
 from .api_models import (
     CamarasConsultaResponse,
     CablesConsultaResponse,
     CentralesConsultaResponse,
     EmpalmeConsultaResponse,
-    ReservaConsultaResponse
+    ReservaConsultaResponse,
+    CambiosCapaResponse
 )
 from .error_models import responses, create_error_response, ErrorCode
+from ..export_geojson import export_to_geojson, FORMATOS_EXPORTACION
+from .write_routes import CapaEscritura
+from ..notificaciones import obtener_notificador
+from ..cache_invalidable import CacheInvalidable
 
 router = APIRouter(tags=["Operaciones de Lectura"])
 
+# Máximo de registros por página en las consultas de capas
+MAX_LIMITE_PAGINA = 5000
+
+# Máximo de claves en ?campos= (jsonb_build_object admite hasta 100 argumentos)
+MAX_CAMPOS = 50
+PATRON_CAMPO = re.compile(r"^[\w\-. ]+$")
+
+# Intervalo de los comentarios que mantienen abiertas las conexiones de eventos (segundos)
+EVENTOS_KEEPALIVE_S = 15
+
 # Crear una caché global para almacenar datos
-cache = cachetools.TTLCache(maxsize=100, ttl=21600)  # 6 horas de TTL
+cache = CacheInvalidable(maxsize=100, ttl=config.CACHE_TTL_S)
+
+# Clave de la caché de cada tabla
+CLAVES_CACHE_TABLAS = {
+    "camaras": "all_camaras_cache",
+    "cable_corporativo": "all_cables_corporativos_cache",
+    "centrales": "all_centrales_cache",
+    "empalmes": "all_empalmes_cache",
+    "reservas": "all_reservas_cache"
+}
+
+# Caché de las capas generadas en FlatGeobuf y GeoParquet: guarda la ruta del archivo, que se
+# elimina cuando la entrada sale de la caché (ver limpiar_archivos_cache)
+cache_archivos = CacheInvalidable(maxsize=50, ttl=config.CACHE_TTL_S)
+# Directorios de los archivos que se guardaron en cache_archivos
+directorios_archivos = set()
+
+def limpiar_archivos_cache():
+    """Elimina los directorios de los archivos que ya no están en cache_archivos (invalidados o vencidos)"""
+    with cache_archivos.bloqueo:
+        vigentes = {os.path.dirname(archivo) for archivo in cache_archivos.cache.values()}
+        for directorio in directorios_archivos - vigentes:
+            shutil.rmtree(directorio, ignore_errors=True)
+        directorios_archivos.intersection_update(vigentes)
 
-@cached(cache, key=lambda *args, **kwargs: "all_camaras_cache")
-def cached_get_all_camaras_from_db():
-    return get_all_camaras_from_db()
+def invalidar_cache(evento):
+    """
+    Descarta la capa cambiada de la caché, con todas sus proyecciones y sus archivos generados
+    (oyente de app/notificaciones.py). Con un evento de reconexión se descarta toda la caché.
+    """
+    if evento.get("capa") is None:
+        cache.invalidar_todo()
+        cache_archivos.invalidar_todo()
+    elif evento["capa"] in CLAVES_CACHE_TABLAS:
+        cache.invalidar(CLAVES_CACHE_TABLAS[evento["capa"]])
+        cache_archivos.invalidar(CLAVES_CACHE_TABLAS[evento["capa"]])
+    limpiar_archivos_cache()
+
+def leer_campos(campos):
+    """
+    Claves pedidas en ?campos= (separadas por coma), sin repetir y ordenadas para que la misma
+    proyección use siempre la misma entrada de la caché.
+    """
+    if campos is None:
+        return None
+    claves = sorted({clave.strip() for clave in campos.split(",") if clave.strip()})
+    if not claves:
+        return None
+    if len(claves) > MAX_CAMPOS:
+        raise HTTPException(status_code=400, detail=f"Se permiten como máximo {MAX_CAMPOS} campos")
+    invalidas = [clave for clave in claves if not PATRON_CAMPO.match(clave)]
+    if invalidas:
+        raise HTTPException(status_code=400, detail=f"Campos no válidos: {', '.join(invalidas)}")
+    return tuple(claves)
 
-@cached(cache, key=lambda *args, **kwargs: "all_cables_corporativos_cache")
-def cached_get_all_cables_corporativos_from_db():
-    return get_all_cables_corporativos_from_db()
+class FormatoCapa(str, Enum):
+    GEOJSON = "geojson"
+    FGB = "fgb"
+    PARQUET = "parquet"
 
-@cached(cache, key=lambda *args, **kwargs: "all_centrales_cache")
-def cached_get_all_centrales_from_db():
-    return get_all_centrales_from_db()
+# Tipos de contenido de los formatos binarios, también aceptados en el header Accept
+TIPOS_FORMATO = {
+    FormatoCapa.FGB: "application/flatgeobuf",
+    FormatoCapa.PARQUET: "application/vnd.apache.parquet"
+}
 
-@cached(cache, key=lambda *args, **kwargs: "all_empalmes_cache")
-def cached_get_all_empalmes_from_db():
-    return get_all_empalmes_from_db()
+# Mismo filtro de estado que las consultas de db_access
+FILTRO_ESTADO = "(estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')"
 
-@cached(cache, key=lambda *args, **kwargs: "all_reservas_cache")
-def cached_get_all_reservas_from_db():
-    return get_all_reservas_from_db()
+# Origen de cada capa en los formatos binarios, el mismo que en GeoJSON: los cables se leen de la
+# tabla agregada (un Feature por cable, con ids, distancia_total y cantidad_tramos), que ya aplica
+# el filtro de estado; las demás capas, de su tabla con el id en las propiedades
+ORIGENES_CAPA_BINARIA = {
+    "cable_corporativo": {
+        "table_name": "cable_corporativo_agregado",
+        "columna_id": "ids[1]",
+        "propiedades_extra": "jsonb_build_object('ids', ids, 'distancia_total', distancia_total, 'cantidad_tramos', cantidad_tramos)"
+    }
+}
+
+def formato_solicitado(formato, accept):
+    """Formato pedido con ?formato= o, si no se indicó, con el header Accept; por defecto GeoJSON"""
+    if formato:
+        return formato
+    for formato_binario, tipo in TIPOS_FORMATO.items():
+        if accept and tipo in accept:
+            return formato_binario
+    return FormatoCapa.GEOJSON
+
+def generar_capa_binaria(tabla, formato, campos=None, sin_propiedades=False):
+    """
+    Genera la capa completa en FlatGeobuf o GeoParquet en un directorio temporal nuevo.
+
+    Los registros se leen con un cursor del servidor y se pasan a ogr2ogr a medida que llegan
+    (ver app/export_geojson.py).
+
+    Returns:
+        Ruta del archivo generado
+    """
+    directorio = tempfile.mkdtemp(prefix="capa_")
+    archivo = os.path.join(directorio, f"{tabla}.{FORMATOS_EXPORTACION[formato.value]['extension']}")
+    origen = ORIGENES_CAPA_BINARIA.get(tabla, {"table_name": tabla, "condicion": FILTRO_ESTADO, "id_en_propiedades": True})
+    try:
+        export_to_geojson(output_file=archivo, formato=formato.value, campos=campos, sin_propiedades=sin_propiedades, **origen)
+    except FileNotFoundError:
+        shutil.rmtree(directorio, ignore_errors=True)
+        raise HTTPException(status_code=500, detail="ogr2ogr (GDAL) no está disponible para generar el formato solicitado")
+    except Exception as e:
+        shutil.rmtree(directorio, ignore_errors=True)
+        raise HTTPException(status_code=500, detail=f"Error generando la capa: {str(e)}")
+    return archivo
+
+def copia_para_envio(archivo):
+    """
+    Enlace (o copia, si no se puede enlazar) de un archivo de la caché en un directorio temporal
+    propio, para que la respuesta no falle si la entrada se invalida mientras se envía.
+    Debe llamarse con el bloqueo de cache_archivos tomado.
+    """
+    directorio = tempfile.mkdtemp(prefix="capa_")
+    copia = os.path.join(directorio, os.path.basename(archivo))
+    try:
+        try:
+            os.link(archivo, copia)
+        except OSError:
+            shutil.copyfile(archivo, copia)
+    except OSError:
+        shutil.rmtree(directorio, ignore_errors=True)
+        raise
+    return copia
+
+def respuesta_capa_binaria(tabla, formato, campos=None, sin_propiedades=False):
+    """
+    Envía la capa completa en FlatGeobuf o GeoParquet como archivo.
+
+    El archivo generado queda en cache_archivos por tabla, formato y proyección hasta que una
+    notificación de cambios en la tabla lo invalida (o vence su tiempo de vida); cada respuesta
+    envía un enlace propio que se elimina después de enviarlo.
+    """
+    clave = (CLAVES_CACHE_TABLAS[tabla], formato.value, campos, sin_propiedades)
+    with cache_archivos.bloqueo:
+        archivo, generacion = cache_archivos.obtener(clave)
+        envio = None
+        if archivo is not None:
+            try:
+                envio = copia_para_envio(archivo)
+            except OSError:
+                # El archivo se eliminó fuera de la aplicación: se vuelve a generar
+                envio = None
+
+    if envio is None:
+        archivo = generar_capa_binaria(tabla, formato, campos, sin_propiedades)
+        with cache_archivos.bloqueo:
+            if cache_archivos.guardar(clave, archivo, generacion):
+                directorios_archivos.add(os.path.dirname(archivo))
+                envio = copia_para_envio(archivo)
+            else:
+                # La tabla cambió mientras se generaba: se envía, pero no se guarda
+                envio = archivo
+        limpiar_archivos_cache()
+
+    return FileResponse(
+        envio,
+        media_type=TIPOS_FORMATO[formato],
+        filename=os.path.basename(envio),
+        background=BackgroundTask(shutil.rmtree, os.path.dirname(envio), ignore_errors=True)
+    )
+
+@cache.cached(key=lambda campos=None, sin_propiedades=False: ("all_camaras_cache", campos, sin_propiedades))
+def cached_get_all_camaras_from_db(campos=None, sin_propiedades=False):
+    return get_all_camaras_from_db(campos, sin_propiedades)
+
+@cache.cached(key=lambda campos=None, sin_propiedades=False: ("all_cables_corporativos_cache", campos, sin_propiedades))
+def cached_get_all_cables_corporativos_from_db(campos=None, sin_propiedades=False):
+    return get_all_cables_corporativos_from_db(campos, sin_propiedades)
+
+@cache.cached(key=lambda campos=None, sin_propiedades=False: ("all_centrales_cache", campos, sin_propiedades))
+def cached_get_all_centrales_from_db(campos=None, sin_propiedades=False):
+    return get_all_centrales_from_db(campos, sin_propiedades)
+
+@cache.cached(key=lambda campos=None, sin_propiedades=False: ("all_empalmes_cache", campos, sin_propiedades))
+def cached_get_all_empalmes_from_db(campos=None, sin_propiedades=False):
+    return get_all_empalmes_from_db(campos, sin_propiedades)
+
+@cache.cached(key=lambda campos=None, sin_propiedades=False: ("all_reservas_cache", campos, sin_propiedades))
+def cached_get_all_reservas_from_db(campos=None, sin_propiedades=False):
+    return get_all_reservas_from_db(campos, sin_propiedades)
 
 @router.get(
     "/camaras",
@@ -83,6 +272,10 @@ def get_camaras(
     lon: float | None = Query(None, description="Longitud del punto central de búsqueda (en grados decimales)"),
     radio_interno: float | None = Query(None, description="Radio interno en metros (excluye elementos más cercanos que esta distancia)"),
     radio_externo: float | None = Query(None, description="Radio externo en metros (límite máximo de búsqueda)"),
+    limite: Optional[int] = Query(None, ge=1, le=MAX_LIMITE_PAGINA, description="Cantidad máxima de registros de la página (100 por defecto sin coordenadas)"),
+    despues_de_id: Optional[int] = Query(None, ge=0, description="Devolver solo los registros con id mayor que este (el 'siguiente_despues_de_id' de la página anterior)"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
     user: str = Depends(authenticate)
 ):
     """
@@ -93,13 +286,21 @@ def get_camaras(
     - **lon**: Longitud del punto central de búsqueda en grados decimales (WGS84)
     - **radio_interno**: Radio interno en metros (excluye elementos más cercanos que esta distancia)
     - **radio_externo**: Radio externo en metros (límite máximo de búsqueda)
+    - **limite**: Cantidad máxima de registros de la página
+    - **despues_de_id**: Devolver solo los registros con id mayor que este
+    - **campos**: Claves de las propiedades a devolver, separadas por coma
+    - **sin_propiedades**: Devolver solo la geometría y el id de cada elemento
     
     Si se proporcionan todos los parámetros, se realiza una búsqueda espacial.
     Si no, se devuelven las primeras 100 cámaras en la base de datos.
+
+    Los resultados se ordenan por id. Si la página está completa, la respuesta incluye
+    **siguiente_despues_de_id** para pedir la siguiente con ?despues_de_id=; cada página se
+    resuelve con el índice de la clave primaria, sin OFFSET.
     
     La respuesta incluye un GeoJSON FeatureCollection con las cámaras encontradas.
     """
-    return JSONResponse(content=get_camaras_from_db(lat, lon, radio_interno, radio_externo))
+    return JSONResponse(content=get_camaras_from_db(lat, lon, radio_interno, radio_externo, limite, despues_de_id, leer_campos(campos), sin_propiedades))
 
 @router.get(
     "/all_camaras",
@@ -127,15 +328,33 @@ def get_camaras(
         }
     }
 )
-def get_all_camaras(user: str = Depends(authenticate)):
+def get_all_camaras(
+    formato: Optional[FormatoCapa] = Query(None, description="Formato de la respuesta: geojson (por defecto), fgb (FlatGeobuf) o parquet (GeoParquet). También se puede pedir con el header Accept"),
+    accept: Optional[str] = Header(None, description="application/flatgeobuf o application/vnd.apache.parquet para los formatos binarios"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
+    user: str = Depends(authenticate)
+):
     """
     Devuelve todas las cámaras registradas en el sistema.
     
     La respuesta es un GeoJSON FeatureCollection que contiene todas las cámaras.
     
     Este endpoint utiliza una caché con un tiempo de vida (TTL) de 6 horas para mejorar el rendimiento.
+    
+    Con **formato**=fgb o **formato**=parquet (o el header Accept correspondiente) la capa se devuelve
+    como archivo FlatGeobuf, con índice espacial para lecturas por rango, o GeoParquet. El archivo
+    generado se guarda en una caché propia por formato y proyección, que se descarta con la caché
+    GeoJSON cuando cambia la capa.
+
+    Con **campos** (claves separadas por coma) se devuelven solo esas propiedades, y con
+    **sin_propiedades**=true solo la geometría y el id. Cada proyección se guarda en la caché por separado.
     """
-    return JSONResponse(content=cached_get_all_camaras_from_db())
+    campos = leer_campos(campos)
+    formato = formato_solicitado(formato, accept)
+    if formato != FormatoCapa.GEOJSON:
+        return respuesta_capa_binaria("camaras", formato, campos, sin_propiedades)
+    return JSONResponse(content=cached_get_all_camaras_from_db(campos, sin_propiedades))
 
 @router.get(
     "/cables",
@@ -148,6 +367,10 @@ def get_cables_corporativos(
     lat: float | None = Query(None, description="Latitud del punto central de búsqueda (en grados decimales)"),
     lon: float | None = Query(None, description="Longitud del punto central de búsqueda (en grados decimales)"),
     radio_externo: float | None = Query(None, description="Radio externo en metros (límite máximo de búsqueda)"),
+    limite: Optional[int] = Query(None, ge=1, le=MAX_LIMITE_PAGINA, description="Cantidad máxima de registros de la página (100 por defecto sin coordenadas)"),
+    despues_de_id: Optional[int] = Query(None, ge=0, description="Devolver solo los registros con id mayor que este (el 'siguiente_despues_de_id' de la página anterior)"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
     user: str = Depends(authenticate)
 ):
     """
@@ -157,11 +380,19 @@ def get_cables_corporativos(
     - **lat**: Latitud del punto central de búsqueda en grados decimales (WGS84)
     - **lon**: Longitud del punto central de búsqueda en grados decimales (WGS84)
     - **radio_externo**: Radio externo en metros (límite máximo de búsqueda)
+    - **limite**: Cantidad máxima de registros de la página
+    - **despues_de_id**: Devolver solo los registros con id mayor que este
+    - **campos**: Claves de las propiedades a devolver, separadas por coma
+    - **sin_propiedades**: Devolver solo la geometría y el id de cada elemento
     
     Si se proporcionan todos los parámetros, se realiza una búsqueda espacial.
     Si no, se devuelven los primeros 100 cables en la base de datos.
+
+    Los resultados se ordenan por id. Si la página está completa, la respuesta incluye
+    **siguiente_despues_de_id** para pedir la siguiente con ?despues_de_id=; cada página se
+    resuelve con el índice de la clave primaria, sin OFFSET.
     """
-    return JSONResponse(content=get_cables_corporativos_from_db(lat, lon, 0, radio_externo))
+    return JSONResponse(content=get_cables_corporativos_from_db(lat, lon, 0, radio_externo, limite, despues_de_id, leer_campos(campos), sin_propiedades))
 
 @router.get(
     "/all_cables",
@@ -170,15 +401,33 @@ def get_cables_corporativos(
     description="Obtiene todos los cables corporativos registrados en la base de datos. Utiliza una caché de 6 horas para mejorar el rendimiento.",
     response_description="GeoJSON FeatureCollection con todos los cables"
 )
-def get_all_cables_corporativos(user: str = Depends(authenticate)):
+def get_all_cables_corporativos(
+    formato: Optional[FormatoCapa] = Query(None, description="Formato de la respuesta: geojson (por defecto), fgb (FlatGeobuf) o parquet (GeoParquet). También se puede pedir con el header Accept"),
+    accept: Optional[str] = Header(None, description="application/flatgeobuf o application/vnd.apache.parquet para los formatos binarios"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
+    user: str = Depends(authenticate)
+):
     """
     Devuelve todos los cables corporativos registrados en el sistema.
     
     La respuesta es un GeoJSON FeatureCollection que contiene todos los cables.
     
     Este endpoint utiliza una caché con un tiempo de vida (TTL) de 6 horas para mejorar el rendimiento.
+    
+    Con **formato**=fgb o **formato**=parquet (o el header Accept correspondiente) la capa se devuelve
+    como archivo FlatGeobuf, con índice espacial para lecturas por rango, o GeoParquet. El archivo
+    generado se guarda en una caché propia por formato y proyección, que se descarta con la caché
+    GeoJSON cuando cambia la capa.
+
+    Con **campos** (claves separadas por coma) se devuelven solo esas propiedades, y con
+    **sin_propiedades**=true solo la geometría y el id. Cada proyección se guarda en la caché por separado.
     """
-    return JSONResponse(content=cached_get_all_cables_corporativos_from_db())
+    campos = leer_campos(campos)
+    formato = formato_solicitado(formato, accept)
+    if formato != FormatoCapa.GEOJSON:
+        return respuesta_capa_binaria("cable_corporativo", formato, campos, sin_propiedades)
+    return JSONResponse(content=cached_get_all_cables_corporativos_from_db(campos, sin_propiedades))
 
 @router.get(
     "/centrales",
@@ -191,6 +440,10 @@ def get_centrales(
     lat: float | None = Query(None, description="Latitud del punto central de búsqueda (en grados decimales)"),
     lon: float | None = Query(None, description="Longitud del punto central de búsqueda (en grados decimales)"),
     radio_externo: float | None = Query(None, description="Radio externo en metros (límite máximo de búsqueda)"),
+    limite: Optional[int] = Query(None, ge=1, le=MAX_LIMITE_PAGINA, description="Cantidad máxima de registros de la página (100 por defecto sin coordenadas)"),
+    despues_de_id: Optional[int] = Query(None, ge=0, description="Devolver solo los registros con id mayor que este (el 'siguiente_despues_de_id' de la página anterior)"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
     user: str = Depends(authenticate)
 ):
     """
@@ -200,11 +453,19 @@ def get_centrales(
     - **lat**: Latitud del punto central de búsqueda en grados decimales (WGS84)
     - **lon**: Longitud del punto central de búsqueda en grados decimales (WGS84)
     - **radio_externo**: Radio externo en metros (límite máximo de búsqueda)
+    - **limite**: Cantidad máxima de registros de la página
+    - **despues_de_id**: Devolver solo los registros con id mayor que este
+    - **campos**: Claves de las propiedades a devolver, separadas por coma
+    - **sin_propiedades**: Devolver solo la geometría y el id de cada elemento
     
     Si se proporcionan todos los parámetros, se realiza una búsqueda espacial.
     Si no, se devuelven las primeras 100 centrales en la base de datos.
+
+    Los resultados se ordenan por id. Si la página está completa, la respuesta incluye
+    **siguiente_despues_de_id** para pedir la siguiente con ?despues_de_id=; cada página se
+    resuelve con el índice de la clave primaria, sin OFFSET.
     """
-    return JSONResponse(content=get_centrales_from_db(lat, lon, 0, radio_externo))
+    return JSONResponse(content=get_centrales_from_db(lat, lon, 0, radio_externo, limite, despues_de_id, leer_campos(campos), sin_propiedades))
 
 @router.get(
     "/all_centrales",
@@ -213,15 +474,33 @@ def get_centrales(
     description="Obtiene todas las centrales registradas en la base de datos. Utiliza una caché de 6 horas para mejorar el rendimiento.",
     response_description="GeoJSON FeatureCollection con todas las centrales"
 )
-def get_all_centrales(user: str = Depends(authenticate)):
+def get_all_centrales(
+    formato: Optional[FormatoCapa] = Query(None, description="Formato de la respuesta: geojson (por defecto), fgb (FlatGeobuf) o parquet (GeoParquet). También se puede pedir con el header Accept"),
+    accept: Optional[str] = Header(None, description="application/flatgeobuf o application/vnd.apache.parquet para los formatos binarios"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
+    user: str = Depends(authenticate)
+):
     """
     Devuelve todas las centrales registradas en el sistema.
     
     La respuesta es un GeoJSON FeatureCollection que contiene todas las centrales.
     
     Este endpoint utiliza una caché con un tiempo de vida (TTL) de 6 horas para mejorar el rendimiento.
+    
+    Con **formato**=fgb o **formato**=parquet (o el header Accept correspondiente) la capa se devuelve
+    como archivo FlatGeobuf, con índice espacial para lecturas por rango, o GeoParquet. El archivo
+    generado se guarda en una caché propia por formato y proyección, que se descarta con la caché
+    GeoJSON cuando cambia la capa.
+
+    Con **campos** (claves separadas por coma) se devuelven solo esas propiedades, y con
+    **sin_propiedades**=true solo la geometría y el id. Cada proyección se guarda en la caché por separado.
     """
-    return JSONResponse(content=cached_get_all_centrales_from_db())
+    campos = leer_campos(campos)
+    formato = formato_solicitado(formato, accept)
+    if formato != FormatoCapa.GEOJSON:
+        return respuesta_capa_binaria("centrales", formato, campos, sin_propiedades)
+    return JSONResponse(content=cached_get_all_centrales_from_db(campos, sin_propiedades))
 
 @router.get(
     "/empalmes",
@@ -235,6 +514,10 @@ def get_empalmes(
     lon: float | None = Query(None, description="Longitud del punto central de búsqueda (en grados decimales)"),
     radio_interno: float | None = Query(None, description="Radio interno en metros (excluye elementos más cercanos que esta distancia)"),
     radio_externo: float | None = Query(None, description="Radio externo en metros (límite máximo de búsqueda)"),
+    limite: Optional[int] = Query(None, ge=1, le=MAX_LIMITE_PAGINA, description="Cantidad máxima de registros de la página (100 por defecto sin coordenadas)"),
+    despues_de_id: Optional[int] = Query(None, ge=0, description="Devolver solo los registros con id mayor que este (el 'siguiente_despues_de_id' de la página anterior)"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
     user: str = Depends(authenticate)
 ):
     """
@@ -245,11 +528,19 @@ def get_empalmes(
     - **lon**: Longitud del punto central de búsqueda en grados decimales (WGS84)
     - **radio_interno**: Radio interno en metros (excluye elementos más cercanos que esta distancia)
     - **radio_externo**: Radio externo en metros (límite máximo de búsqueda)
+    - **limite**: Cantidad máxima de registros de la página
+    - **despues_de_id**: Devolver solo los registros con id mayor que este
+    - **campos**: Claves de las propiedades a devolver, separadas por coma
+    - **sin_propiedades**: Devolver solo la geometría y el id de cada elemento
     
     Si se proporcionan todos los parámetros, se realiza una búsqueda espacial.
     Si no, se devuelven los primeros 100 empalmes en la base de datos.
+
+    Los resultados se ordenan por id. Si la página está completa, la respuesta incluye
+    **siguiente_despues_de_id** para pedir la siguiente con ?despues_de_id=; cada página se
+    resuelve con el índice de la clave primaria, sin OFFSET.
     """
-    return JSONResponse(content=get_empalmes_from_db(lat, lon, radio_interno, radio_externo))
+    return JSONResponse(content=get_empalmes_from_db(lat, lon, radio_interno, radio_externo, limite, despues_de_id, leer_campos(campos), sin_propiedades))
 
 @router.get(
     "/all_empalmes",
@@ -258,15 +549,33 @@ def get_empalmes(
     description="Obtiene todos los empalmes registrados en la base de datos. Utiliza una caché de 6 horas para mejorar el rendimiento.",
     response_description="GeoJSON FeatureCollection con todos los empalmes"
 )
-def get_all_empalmes(user: str = Depends(authenticate)):
+def get_all_empalmes(
+    formato: Optional[FormatoCapa] = Query(None, description="Formato de la respuesta: geojson (por defecto), fgb (FlatGeobuf) o parquet (GeoParquet). También se puede pedir con el header Accept"),
+    accept: Optional[str] = Header(None, description="application/flatgeobuf o application/vnd.apache.parquet para los formatos binarios"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
+    user: str = Depends(authenticate)
+):
     """
     Devuelve todos los empalmes registrados en el sistema.
     
     La respuesta es un GeoJSON FeatureCollection que contiene todos los empalmes.
     
     Este endpoint utiliza una caché con un tiempo de vida (TTL) de 6 horas para mejorar el rendimiento.
+    
+    Con **formato**=fgb o **formato**=parquet (o el header Accept correspondiente) la capa se devuelve
+    como archivo FlatGeobuf, con índice espacial para lecturas por rango, o GeoParquet. El archivo
+    generado se guarda en una caché propia por formato y proyección, que se descarta con la caché
+    GeoJSON cuando cambia la capa.
+
+    Con **campos** (claves separadas por coma) se devuelven solo esas propiedades, y con
+    **sin_propiedades**=true solo la geometría y el id. Cada proyección se guarda en la caché por separado.
     """
-    return JSONResponse(content=cached_get_all_empalmes_from_db())
+    campos = leer_campos(campos)
+    formato = formato_solicitado(formato, accept)
+    if formato != FormatoCapa.GEOJSON:
+        return respuesta_capa_binaria("empalmes", formato, campos, sin_propiedades)
+    return JSONResponse(content=cached_get_all_empalmes_from_db(campos, sin_propiedades))
 
 @router.get(
     "/reservas",
@@ -280,6 +589,10 @@ def get_reservas(
     lon: float | None = Query(None, description="Longitud del punto central de búsqueda (en grados decimales)"),
     radio_interno: float | None = Query(None, description="Radio interno en metros (excluye elementos más cercanos que esta distancia)"),
     radio_externo: float | None = Query(None, description="Radio externo en metros (límite máximo de búsqueda)"),
+    limite: Optional[int] = Query(None, ge=1, le=MAX_LIMITE_PAGINA, description="Cantidad máxima de registros de la página (100 por defecto sin coordenadas)"),
+    despues_de_id: Optional[int] = Query(None, ge=0, description="Devolver solo los registros con id mayor que este (el 'siguiente_despues_de_id' de la página anterior)"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
     user: str = Depends(authenticate)
 ):
     """
@@ -290,11 +603,19 @@ def get_reservas(
     - **lon**: Longitud del punto central de búsqueda en grados decimales (WGS84)
     - **radio_interno**: Radio interno en metros (excluye elementos más cercanos que esta distancia)
     - **radio_externo**: Radio externo en metros (límite máximo de búsqueda)
+    - **limite**: Cantidad máxima de registros de la página
+    - **despues_de_id**: Devolver solo los registros con id mayor que este
+    - **campos**: Claves de las propiedades a devolver, separadas por coma
+    - **sin_propiedades**: Devolver solo la geometría y el id de cada elemento
     
     Si se proporcionan todos los parámetros, se realiza una búsqueda espacial.
     Si no, se devuelven las primeras 100 reservas en la base de datos.
+
+    Los resultados se ordenan por id. Si la página está completa, la respuesta incluye
+    **siguiente_despues_de_id** para pedir la siguiente con ?despues_de_id=; cada página se
+    resuelve con el índice de la clave primaria, sin OFFSET.
     """
-    return JSONResponse(content=get_reservas_from_db(lat, lon, radio_interno, radio_externo))
+    return JSONResponse(content=get_reservas_from_db(lat, lon, radio_interno, radio_externo, limite, despues_de_id, leer_campos(campos), sin_propiedades))
 
 @router.get(
     "/all_reservas",
@@ -303,12 +624,126 @@ def get_reservas(
     description="Obtiene todas las reservas registradas en la base de datos. Utiliza una caché de 6 horas para mejorar el rendimiento.",
     response_description="GeoJSON FeatureCollection con todas las reservas"
 )
-def get_all_reservas(user: str = Depends(authenticate)):
+def get_all_reservas(
+    formato: Optional[FormatoCapa] = Query(None, description="Formato de la respuesta: geojson (por defecto), fgb (FlatGeobuf) o parquet (GeoParquet). También se puede pedir con el header Accept"),
+    accept: Optional[str] = Header(None, description="application/flatgeobuf o application/vnd.apache.parquet para los formatos binarios"),
+    campos: Optional[str] = Query(None, description="Claves de las propiedades a devolver, separadas por coma (por ejemplo nombre,id_texto)"),
+    sin_propiedades: bool = Query(False, description="Devolver solo la geometría y el id de cada elemento"),
+    user: str = Depends(authenticate)
+):
     """
     Devuelve todas las reservas registradas en el sistema.
     
     La respuesta es un GeoJSON FeatureCollection que contiene todas las reservas.
     
     Este endpoint utiliza una caché con un tiempo de vida (TTL) de 6 horas para mejorar el rendimiento.
+    
+    Con **formato**=fgb o **formato**=parquet (o el header Accept correspondiente) la capa se devuelve
+    como archivo FlatGeobuf, con índice espacial para lecturas por rango, o GeoParquet. El archivo
+    generado se guarda en una caché propia por formato y proyección, que se descarta con la caché
+    GeoJSON cuando cambia la capa.
+
+    Con **campos** (claves separadas por coma) se devuelven solo esas propiedades, y con
+    **sin_propiedades**=true solo la geometría y el id. Cada proyección se guarda en la caché por separado.
     """
-    return JSONResponse(content=cached_get_all_reservas_from_db())
+    campos = leer_campos(campos)
+    formato = formato_solicitado(formato, accept)
+    if formato != FormatoCapa.GEOJSON:
+        return respuesta_capa_binaria("reservas", formato, campos, sin_propiedades)
+    return JSONResponse(content=cached_get_all_reservas_from_db(campos, sin_propiedades))
+
+@router.get(
+    "/{capa}/cambios",
+    response_model=CambiosCapaResponse,
+    summary="Consultar los cambios de una capa",
+    description="Devuelve los registros de una capa insertados, actualizados, rechazados o eliminados después de un cursor, para que los clientes actualicen su copia local sin volver a descargar la capa completa.",
+    response_description="GeoJSON FeatureCollection con los registros cambiados, las marcas de eliminación y el cursor siguiente",
+    responses={
+        status.HTTP_400_BAD_REQUEST: {"description": "Cursor no válido"},
+        status.HTTP_401_UNAUTHORIZED: responses[status.HTTP_401_UNAUTHORIZED],
+        status.HTTP_500_INTERNAL_SERVER_ERROR: responses[status.HTTP_500_INTERNAL_SERVER_ERROR]
+    }
+)
+def get_cambios_capa(
+    capa: CapaEscritura = Path(..., description="Capa consultada"),
+    desde: str = Query("0", description="Cursor: el 'cursor' de la respuesta anterior (0 para empezar desde el principio)"),
+    limite: int = Query(1000, description="Cantidad máxima de cambios por página", ge=1, le=10000),
+    user: str = Depends(authenticate)
+):
+    """
+    Devuelve los cambios de una capa en el orden en que se confirmaron.
+    
+    Cada inserción o actualización de un registro le asigna una nueva **version** (común a todas las capas),
+    y cada eliminación deja una marca con su propia versión (ver sql/create_cambios.sql). Los cambios de
+    transacciones todavía abiertas se entregan cuando se confirman, siempre después del cursor: el
+    cursor solo avanza y ningún cambio queda atrás.
+    
+    - **features**: Registros insertados o actualizados, con su estado actual y su versión en las propiedades
+    - **eliminados**: Registros eliminados o rechazados, que el cliente debe quitar de su copia local
+    - **cursor**: Último cambio incluido; se envía como **desde** en la siguiente solicitud
+    - **hay_mas**: Si es true, hay más cambios y se puede pedir la página siguiente de inmediato
+    
+    Un cliente recorre el feed desde 0 una vez (la capa completa), guarda el cursor y luego solo pide los cambios posteriores.
+    """
+    try:
+        return JSONResponse(content=get_cambios_db(capa.value, desde, limite))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error consultando los cambios: {str(e)}")
+
+@router.get(
+    "/eventos",
+    summary="Recibir los cambios de las capas en tiempo real",
+    description="Mantiene una conexión abierta (Server-Sent Events) por la que se envía un evento cada vez que se confirma un cambio en las capas, para que los mapas se actualicen sin consultar periódicamente.",
+    response_description="Flujo text/event-stream con un evento 'cambio' por notificación"
+)
+async def get_eventos(
+    request: Request,
+    capas: Optional[List[CapaEscritura]] = Query(None, description="Capas de interés; por defecto, todas"),
+    user: str = Depends(authenticate)
+):
+    """
+    Envía los cambios de las capas a medida que se confirman en la base de datos (Server-Sent Events).
+    
+    Cada evento tiene el nombre **cambio** y un JSON con:
+    - **capa** y **operacion** ('insert', 'update' o 'delete')
+    - **cantidad**: registros afectados por la sentencia
+    - **elementos**: id, estado, versión y, en las capas puntuales, la geometría de cada registro
+      (en los cables, su caja envolvente **bbox**: [lon_min, lat_min, lon_max, lat_max]).
+      Solo se incluye en los cambios pequeños; en los masivos el cliente debe recargar la capa
+      o pedir /api/{capa}/cambios
+    
+    Las notificaciones se generan con los triggers de sql/create_notificaciones.sql, por lo que también
+    llegan los cambios hechos fuera de la API. Cada proceso usa una sola conexión de escucha para todos los clientes.
+    
+    Si el cliente no consume los eventos a tiempo, recibe un evento **desconectado** y se cierra la conexión.
+    """
+    filtro = {capa.value for capa in capas} if capas else None
+    notificador = obtener_notificador()
+    cliente = notificador.suscribir()
+    _, cola = cliente
+
+    async def generar():
+        try:
+            yield ": conectado\n\n"
+            while not await request.is_disconnected():
+                try:
+                    evento = await asyncio.wait_for(cola.get(), timeout=EVENTOS_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if evento is None:
+                    yield "event: desconectado\ndata: {}\n\n"
+                    break
+                if filtro and evento.get("capa") not in filtro:
+                    continue
+                yield f"event: cambio\ndata: {json.dumps(evento)}\n\n"
+        finally:
+            notificador.desuscribir(cliente)
+
+    return StreamingResponse(
+        generar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -1,20 +1,163 @@
 import json
-from fastapi import APIRouter, Depends, HTTPException, Query, status
-from fastapi.responses import JSONResponse
+import math
+from enum import Enum
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel, Field, validator
+from typing import List
 
 from app.database import get_connection
 from ..auth import authenticate
-from ..db_access import get_camaras_en_falla_db, get_cables_cercanos_from_db
+from .. import config
+from ..db_access import (
+    get_camaras_en_falla_db,
+    get_cables_cercanos_from_db,
+    get_nodos_alcanzables_lote_db,
+    get_vertices_cercanos_red_db,
+    get_ruta_entre_vertices_db,
+    iterar_matriz_distancias_red,
+    get_candidatos_falla_otdr_db,
+    get_indice_lineal_db,
+    get_cobertura_red_db,
+    get_cobertura_centrales_db,
+    get_distancias_cobertura_centrales_db
+)
+from ..indice_lineal import cargar_indice, punto_a_distancia
+from ..cache_invalidable import CacheInvalidable
 import geojson
 from .api_models import (
     CamarasEnFallaResponse,
     CablesConsultaResponse,
-    LineaEnRutaRedResponse
+    LineaEnRutaRedResponse,
+    RutaEntrePuntosResponse,
+    LocalizarFallaOtdrResponse,
+    CentralesConsultaResponse
 )
 from .error_models import responses, create_error_response, ErrorCode
 
 router = APIRouter(tags=["Operaciones Lógicas"])
 
+# Cantidad máxima de orígenes aceptados en una sola solicitud por lotes
+MAX_ORIGENES_LOTE = 200
+# Cantidad máxima de puntos por lado en una matriz de distancias
+MAX_PUNTOS_MATRIZ = 500
+
+class PuntoRed(BaseModel):
+    lon: float = Field(..., description="Longitud del punto (en grados decimales)")
+    lat: float = Field(..., description="Latitud del punto (en grados decimales)")
+
+class MatrizDistanciasRed(BaseModel):
+    origenes: List[PuntoRed] = Field(..., description="Puntos de origen (filas de la matriz)")
+    destinos: List[PuntoRed] = Field(..., description="Puntos de destino (columnas de la matriz)")
+    solo_componente_principal: bool = Field(False, description="Si es True, ajusta todos los puntos a la componente principal (la de mayor longitud) de la red")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "origenes": [
+                    {"lon": -74.05338, "lat": 4.67473},
+                    {"lon": -74.04557, "lat": 4.75003}
+                ],
+                "destinos": [
+                    {"lon": -74.0617, "lat": 4.6737},
+                    {"lon": -74.0917, "lat": 4.6647},
+                    {"lon": -74.0816, "lat": 4.6147}
+                ]
+            }
+        }
+
+    @validator('origenes', 'destinos')
+    def validate_puntos(cls, v):
+        if not v:
+            raise ValueError('Se requiere al menos un punto')
+        if len(v) > MAX_PUNTOS_MATRIZ:
+            raise ValueError(f'Se permiten como máximo {MAX_PUNTOS_MATRIZ} puntos por lista')
+        return v
+
+# Caché de rutas entre vértices de la red (la topología solo cambia al recrear la tabla red)
+cache_rutas = CacheInvalidable(maxsize=1000, ttl=config.CACHE_TTL_S)
+
+@cache_rutas.cached(key=lambda origen, destino: (origen, destino))
+def cached_get_ruta_entre_vertices_db(origen, destino):
+    return get_ruta_entre_vertices_db(origen, destino)
+
+# Las coberturas se calculan y se guardan en caché por tramos de distancia de este tamaño (metros)
+COBERTURA_PASO_M = 100
+
+class MetodoCobertura(str, Enum):
+    BUFFER = "buffer"
+    CONCAVO = "concavo"
+
+# Caché de coberturas por vértice de la red, tramo de distancia y método
+cache_coberturas = CacheInvalidable(maxsize=500, ttl=config.CACHE_TTL_S)
+
+@cache_coberturas.cached(key=lambda vertice, distancia, metodo: (vertice, distancia, metodo))
+def cached_get_cobertura_red_db(vertice, distancia, metodo):
+    return get_cobertura_red_db(vertice, distancia, metodo)
+
+# Caché de índices de referencia lineal ya desempaquetados, por capa y elemento
+cache_indices_lineales = CacheInvalidable(maxsize=5000, ttl=config.CACHE_TTL_S)
+
+@cache_indices_lineales.cached(key=lambda capa, elemento_id: (capa, elemento_id))
+def cached_get_indice_lineal(capa, elemento_id):
+    fila = get_indice_lineal_db(capa, elemento_id)
+    if fila is None:
+        return None
+    longitud_total, longitudes, coordenadas = fila
+    return longitud_total, cargar_indice(longitudes, coordenadas)
+
+def invalidar_cache(evento):
+    """
+    Descarta de las cachés lo que depende de los datos cambiados (oyente de app/notificaciones.py):
+    las rutas y coberturas cuando se recrea la red, y los índices lineales de los cables o aristas
+    modificados (de toda la capa si la notificación no trae los ids). Con un evento de reconexión
+    se descartan todas.
+    """
+    capa = evento.get("capa")
+    if capa is None:
+        cache_rutas.invalidar_todo()
+        cache_coberturas.invalidar_todo()
+        cache_indices_lineales.invalidar_todo()
+        return
+    if capa == "red":
+        cache_rutas.invalidar_todo()
+        cache_coberturas.invalidar_todo()
+    if capa in ("red", "cable_corporativo"):
+        if evento.get("elementos") is not None:
+            claves = [(capa, elemento["id"]) for elemento in evento["elementos"]]
+            cache_indices_lineales.invalidar(capa, claves)
+        else:
+            cache_indices_lineales.invalidar(capa)
+
+class OrigenRed(BaseModel):
+    lon: float = Field(..., description="Longitud del punto de inicio (en grados decimales)")
+    lat: float = Field(..., description="Latitud del punto de inicio (en grados decimales)")
+    distancia: float = Field(..., gt=0, description="Distancia a recorrer en metros por la red")
+
+class NodosAlcanzablesLote(BaseModel):
+    origenes: List[OrigenRed] = Field(..., description="Lista de puntos de inicio con su distancia a recorrer")
+    margen_factor: float = Field(0.999, description="Margen de error como factor decimal (por defecto 0.999)")
+    solo_componente_principal: bool = Field(False, description="Si es True, ajusta los orígenes a la componente principal (la de mayor longitud) de la red")
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "origenes": [
+                    {"lon": -74.145085, "lat": 4.668443, "distancia": 2650},
+                    {"lon": -74.126022, "lat": 4.57189, "distancia": 1200}
+                ],
+                "margen_factor": 0.999
+            }
+        }
+
+    @validator('origenes')
+    def validate_origenes(cls, v):
+        if not v:
+            raise ValueError('Se requiere al menos un origen')
+        if len(v) > MAX_ORIGENES_LOTE:
+            raise ValueError(f'Se permiten como máximo {MAX_ORIGENES_LOTE} orígenes por solicitud')
+        return v
+
 @router.get(
     "/camaras_en_falla",
     response_model=CamarasEnFallaResponse,
@@ -135,6 +278,7 @@ def get_linea_en_ruta_red_endpoint(
     lat: float = Query(..., description="Latitud del punto de entrada (en grados decimales)"),
     distancia: float = Query(..., description="Distancia a recorrer en metros por la red"),
     incluir_linea: bool = Query(True, description="Si es True, devuelve la línea geometry junto con los puntos"),
+    solo_componente_principal: bool = Query(False, description="Si es True, ajusta el punto al vértice más cercano de la componente principal (la de mayor longitud) de la red"),
     user: str = Depends(authenticate)
 ):
     """
@@ -150,6 +294,7 @@ def get_linea_en_ruta_red_endpoint(
     - **lat**: Latitud del punto de entrada en grados decimales (WGS84)
     - **distancia**: Distancia a recorrer en metros por la red
     - **incluir_linea**: Si es True (predeterminado), incluye la geometría de la línea en la respuesta
+    - **solo_componente_principal**: Si es True, ajusta el punto a la componente principal de la red
     
     La respuesta incluye:
     - **status**: Estado de la operación ('success' o 'error')
@@ -159,13 +304,14 @@ def get_linea_en_ruta_red_endpoint(
     
     Es útil para planificación de tendido de cables y análisis de cobertura de red.
     """
-    result = get_linea_en_ruta_red(lon, lat, distancia, incluir_linea)
+    result = get_linea_en_ruta_red(lon, lat, distancia, incluir_linea, solo_componente_principal)
     if result["status"] == "error":
         raise HTTPException(status_code=404, detail=result["message"])
     return JSONResponse(content=result)
 
 
-def get_linea_en_ruta_red(lon: float, lat: float, distancia_m: float, incluir_linea: bool = True):
+def get_linea_en_ruta_red(lon: float, lat: float, distancia_m: float, incluir_linea: bool = True,
+                          solo_componente_principal: bool = False):
     """
     Obtiene una línea que representa la ruta en la red de cables desde un punto 
     hasta una distancia específica, y los puntos a esa distancia.
@@ -175,6 +321,7 @@ def get_linea_en_ruta_red(lon: float, lat: float, distancia_m: float, incluir_li
         lat: Latitud del punto de inicio
         distancia_m: Distancia en metros a recorrer por la red de cables
         incluir_linea: Si debe incluir la geometría de la línea en la respuesta
+        solo_componente_principal: Si debe ajustar el punto a la componente principal de la red
     
     Returns:
         Un diccionario con la línea de la ruta (opcional) y los puntos a la distancia especificada
@@ -185,15 +332,18 @@ def get_linea_en_ruta_red(lon: float, lat: float, distancia_m: float, incluir_li
                 cur.execute("""
                     SELECT 
                         ST_AsGeoJSON(linea) as linea_geojson,
-                        ST_AsGeoJSON(punto) as punto_geojson
-                    FROM fn_linea_en_ruta_red(%s, %s, %s, %s)
-                """, (lon, lat, distancia_m, incluir_linea))
-                rows = cur.fetchall()
-                if not rows or all(r[0] is None and r[1] is None for r in rows):
+                        ST_AsGeoJSON(puntos) as puntos_geojson
+                    FROM fn_linea_en_ruta_red_v2(%s, %s, %s, %s, %s)
+                """, (lon, lat, distancia_m, incluir_linea, solo_componente_principal))
+                row = cur.fetchone()
+                if not row or (row[0] is None and row[1] is None):
                     return {"status": "error", "message": "No se pudo calcular la ruta en la red de cables"}
-                # Si hay varias filas, la línea será la misma en todas (si incluir_linea=True)
-                linea_geojson = json.loads(rows[0][0]) if rows[0][0] else None
-                puntos_geojson = [json.loads(r[1]) for r in rows if r[1]]
+                # La línea llega una sola vez y los puntos agrupados en un MULTIPOINT
+                linea_geojson = json.loads(row[0]) if row[0] else None
+                puntos_geojson = [
+                    {"type": "Point", "coordinates": coordenadas}
+                    for coordenadas in json.loads(row[1])["coordinates"]
+                ] if row[1] else []
                 return {
                     "status": "success",
                     "linea": {
@@ -227,19 +377,23 @@ def get_nodos_alcanzables_en_ruta_red(
     lat: float = Query(..., description="Latitud del punto de inicio (en grados decimales)"),
     distancia: float = Query(..., description="Distancia a recorrer en metros por la red"),
     margen_factor: float = Query(0.999, description="Margen de error como factor decimal (por defecto 0.999)"),
+    solo_componente_principal: bool = Query(False, description="Si es True, ajusta el punto al vértice más cercano de la componente principal (la de mayor longitud) de la red"),
     user: str = Depends(authenticate)
 ):
     """
     Devuelve todos los nodos alcanzables desde un punto inicial a una distancia específica sobre la red,
     e indica cuál(es) es(son) el(los) más cercano(s) a la distancia solicitada y el nombre del cable.
+
+    Si la componente de la red a la que se ajusta el punto tiene menos cable que la distancia solicitada,
+    la respuesta es inmediata (no hay nodos alcanzables) y no se ejecuta la búsqueda sobre la red.
     """
     try:
         with get_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute("""
                     SELECT ST_AsGeoJSON(geom) as geom_geojson, distancia_acumulada, es_mas_cercano, nombre_cable
-                    FROM fn_nodos_alcanzables_en_ruta_red(%s, %s, %s, %s)
-                """, (lon, lat, distancia, margen_factor))
+                    FROM fn_nodos_alcanzables_en_ruta_red(%s, %s, %s, %s, %s)
+                """, (lon, lat, distancia, margen_factor, solo_componente_principal))
                 rows = cur.fetchall()
                 if not rows:
                     return JSONResponse(content={"status": "error", "message": "No se encontraron nodos alcanzables para la distancia dada"}, status_code=404)
@@ -262,4 +416,334 @@ def get_nodos_alcanzables_en_ruta_red(
                     "margen_factor": margen_factor
                 })
     except Exception as e:
-        return JSONResponse(content={"status": "error", "message": f"Error consultando nodos alcanzables: {str(e)}"}, status_code=500)
\ No newline at end of file
+        return JSONResponse(content={"status": "error", "message": f"Error consultando nodos alcanzables: {str(e)}"}, status_code=500)
+
+@router.post(
+    "/nodos_alcanzables_en_ruta_red/lote",
+    summary="Nodos alcanzables en la red para varios orígenes",
+    description="Versión por lotes de /nodos_alcanzables_en_ruta_red: recibe una lista de puntos de inicio con su distancia y devuelve los nodos alcanzables de cada uno, calculados en una sola consulta a la red.",
+    response_description="Lista de resultados por origen, en el mismo orden de la solicitud, con los nodos alcanzables de cada uno."
+)
+def post_nodos_alcanzables_en_ruta_red_lote(
+    solicitud: NodosAlcanzablesLote = Body(..., description="Orígenes y margen de error"),
+    user: str = Depends(authenticate)
+):
+    """
+    Devuelve los nodos alcanzables desde varios puntos de inicio, cada uno con su propia distancia.
+
+    Pensado para análisis de cortes sobre muchas centrales o cámaras a la vez: las aristas de la red
+    se cargan una sola vez por lote y todos los orígenes se resuelven con una única búsqueda multi-origen,
+    en lugar de llamar a /nodos_alcanzables_en_ruta_red una vez por punto.
+
+    Cada elemento de **resultados** contiene:
+    - **origen**: El punto de inicio y la distancia solicitada
+    - **status**: 'success' si se encontraron nodos, 'error' en caso contrario
+    - **features**: Nodos alcanzables con distancia acumulada, indicador de más cercano y nombre del cable
+    """
+    try:
+        resultados = get_nodos_alcanzables_lote_db(
+            solicitud.origenes, solicitud.margen_factor, solicitud.solo_componente_principal
+        )
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "message": f"Error consultando nodos alcanzables: {str(e)}"}, status_code=500)
+    return JSONResponse(content={
+        "status": "success",
+        "resultados": resultados,
+        "margen_factor": solicitud.margen_factor
+    })
+
+
+@router.get(
+    "/ruta_entre_puntos",
+    response_model=RutaEntrePuntosResponse,
+    summary="Ruta más corta entre dos puntos de la red",
+    description="Calcula la ruta más corta sobre la red de cables entre dos puntos, devolviendo la geometría, los metros de fibra y los cables recorridos.",
+    response_description="GeoJSON Feature con la ruta, su longitud total en metros y los tramos por cable"
+)
+def get_ruta_entre_puntos(
+    lon_origen: float = Query(..., description="Longitud del punto de origen (en grados decimales)"),
+    lat_origen: float = Query(..., description="Latitud del punto de origen (en grados decimales)"),
+    lon_destino: float = Query(..., description="Longitud del punto de destino (en grados decimales)"),
+    lat_destino: float = Query(..., description="Latitud del punto de destino (en grados decimales)"),
+    solo_componente_principal: bool = Query(False, description="Si es True, ajusta ambos puntos al vértice más cercano de la componente principal (la de mayor longitud) de la red"),
+    user: str = Depends(authenticate)
+):
+    """
+    Calcula la ruta más corta por la red de cables entre dos puntos (por ejemplo, una central y un empalme).
+    
+    Ambos puntos se ajustan en una sola consulta al vértice más cercano de la red. La ruta se calcula con
+    búsqueda bidireccional (pgr_bdDijkstra), restringida primero al entorno de los dos vértices, y se
+    guarda en caché por par de vértices.
+    
+    Parámetros:
+    - **lon_origen**, **lat_origen**: Punto de origen en grados decimales (WGS84)
+    - **lon_destino**, **lat_destino**: Punto de destino en grados decimales (WGS84)
+    - **solo_componente_principal**: Si es True, ajusta ambos puntos a la componente principal de la red
+    
+    Si los puntos quedan en componentes desconectadas de la red, la respuesta es inmediata (404) sin buscar la ruta.
+    
+    La respuesta incluye:
+    - **ruta**: GeoJSON Feature con la geometría de la ruta y en sus propiedades la distancia total
+      (**distancia_metros**), los nombres de los cables recorridos (**cables**) y los metros por cable (**tramos**)
+    - **origen** / **destino**: Vértices de la red a los que se ajustaron los puntos y su distancia a la red
+    """
+    origen, destino = get_vertices_cercanos_red_db(
+        [(lon_origen, lat_origen), (lon_destino, lat_destino)], solo_componente_principal
+    )
+    if origen is None or destino is None:
+        raise HTTPException(status_code=404, detail="No se pudieron ajustar los puntos a la red de cables")
+    if origen["componente"] is not None and origen["componente"] != destino["componente"]:
+        raise HTTPException(status_code=404, detail="No se pudo calcular la ruta: los puntos están en componentes desconectadas de la red de cables")
+    ruta = cached_get_ruta_entre_vertices_db(origen["vertice"], destino["vertice"])
+    if ruta is None:
+        raise HTTPException(status_code=404, detail="No se pudo calcular la ruta entre los puntos en la red de cables")
+    cables = []
+    for tramo in ruta["tramos"]:
+        if tramo["nombre_cable"] not in cables:
+            cables.append(tramo["nombre_cable"])
+    return JSONResponse(content={
+        "status": "success",
+        "ruta": {
+            "type": "Feature",
+            "geometry": ruta["geometry"],
+            "properties": {
+                "distancia_metros": ruta["distancia_metros"],
+                "cables": cables,
+                "tramos": ruta["tramos"]
+            }
+        },
+        "origen": origen,
+        "destino": destino
+    })
+
+
+@router.post(
+    "/matriz_distancias_red",
+    summary="Matriz de distancias por la red",
+    description="Calcula las distancias por la red de cables desde cada punto de origen hasta cada punto de destino. La respuesta se transmite en formato NDJSON, una fila de la matriz por línea, a medida que se calcula.",
+    response_description="Flujo NDJSON: una primera línea con los destinos ajustados a la red y luego una línea por origen con sus distancias"
+)
+def post_matriz_distancias_red(
+    solicitud: MatrizDistanciasRed = Body(..., description="Puntos de origen y de destino"),
+    user: str = Depends(authenticate)
+):
+    """
+    Calcula la matriz de distancias por la red de cables entre dos conjuntos de puntos
+    (por ejemplo, todas las centrales contra una lista de sitios candidatos).
+    
+    Todos los puntos se ajustan en una sola consulta a los vértices de la red y las distancias se
+    calculan por bloques de orígenes con pgr_dijkstraCost (muchos a muchos), cargando solo las aristas
+    de la componente de la red de cada bloque; los pares en componentes desconectadas se devuelven sin
+    conexión sin calcularlos. Para matrices grandes los bloques se calculan en paralelo.
+    
+    La respuesta es NDJSON (`application/x-ndjson`):
+    - La primera línea tiene **tipo** = 'destinos' con los vértices a los que se ajustó cada destino
+    - Cada línea siguiente tiene **tipo** = 'fila', el índice del **origen** en la solicitud, su
+      **vertice** y la lista **distancias** en metros, en el orden de los destinos (null si no hay conexión)
+    
+    Las filas se envían a medida que se completan, por lo que pueden llegar en un orden distinto al de la solicitud.
+    """
+    origenes = [(p.lon, p.lat) for p in solicitud.origenes]
+    destinos = [(p.lon, p.lat) for p in solicitud.destinos]
+
+    def generar():
+        try:
+            for fila in iterar_matriz_distancias_red(origenes, destinos, solicitud.solo_componente_principal):
+                yield json.dumps(fila) + "\n"
+        except Exception as e:
+            yield json.dumps({"tipo": "error", "message": f"Error calculando la matriz de distancias: {str(e)}"}) + "\n"
+
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
+
+
+@router.get(
+    "/localizar_falla_otdr",
+    response_model=LocalizarFallaOtdrResponse,
+    summary="Localizar un corte de fibra desde una central",
+    description="Devuelve los posibles puntos de corte a la distancia medida con OTDR desde una central, interpolados sobre las aristas de la red en las que se alcanza esa distancia, con las cámaras y empalmes más cercanos a cada uno.",
+    response_description="GeoJSON FeatureCollection con los puntos candidatos de corte"
+)
+def get_localizar_falla_otdr(
+    central_id: int = Query(..., description="ID de la central (tabla centrales) desde la que se hizo la medición"),
+    distancia: float = Query(..., gt=0, description="Distancia medida con OTDR en metros"),
+    n_cercanos: int = Query(3, ge=1, le=20, description="Cantidad de cámaras y de empalmes cercanos a devolver por candidato"),
+    user: str = Depends(authenticate)
+):
+    """
+    Localiza un corte de fibra a partir de la distancia medida con OTDR desde una central.
+    
+    Usa los árboles de caminos mínimos precalculados desde cada central (sql/create_arboles_centrales.sql),
+    por lo que no ejecuta una búsqueda sobre la red en cada solicitud. Cada candidato es el punto exacto,
+    interpolado sobre la arista, en el que el camino más corto desde la central alcanza la distancia medida;
+    se revisan también las aristas que cierran ciclos de la red, no solo las del árbol. Si la red se
+    recreó o la central se movió desde el último cálculo, su árbol se recalcula en la solicitud.
+    
+    Parámetros:
+    - **central_id**: ID de la central
+    - **distancia**: Distancia OTDR en metros (los árboles se precalculan hasta 60 km)
+    - **n_cercanos**: Cantidad de cámaras y empalmes cercanos por candidato
+    
+    La respuesta incluye:
+    - **features**: Un punto por candidato con la arista y el cable en que se encuentra, y las listas
+      **camaras_cercanas** y **empalmes_cercanos** (id, id_texto y distancia en metros)
+    - **central**: Vértice de la red al que se ajusta la central y su distancia a la red
+    """
+    try:
+        resultado = get_candidatos_falla_otdr_db(central_id, distancia, n_cercanos)
+    except Exception as e:
+        return JSONResponse(content={"status": "error", "message": f"Error localizando la falla: {str(e)}"}, status_code=500)
+    if resultado is None:
+        raise HTTPException(status_code=404, detail=f"No se encontró la central {central_id} o no se pudo ajustar a la red de cables")
+
+    features = [
+        geojson.Feature(
+            geometry=candidato["geometry"],
+            properties={
+                "arista": candidato["arista"],
+                "nombre_cable": candidato["nombre_cable"],
+                "camaras_cercanas": candidato["camaras_cercanas"],
+                "empalmes_cercanos": candidato["empalmes_cercanos"]
+            }
+        )
+        for candidato in resultado["candidatos"]
+    ]
+    return JSONResponse(content={
+        "status": "success",
+        "type": "FeatureCollection",
+        "features": features,
+        "central": {
+            "id": central_id,
+            "vertice": resultado["vertice"],
+            "distancia_a_red": resultado["distancia_a_red"]
+        },
+        "distancia": distancia
+    })
+
+
+@router.get(
+    "/cables/{cable_id}/punto_a_distancia",
+    summary="Punto a una distancia a lo largo de un cable",
+    description="Devuelve el punto ubicado a una distancia dada, medida sobre el cable desde su inicio (o desde su final), usando el índice de referencia lineal con longitudes geodésicas.",
+    response_description="GeoJSON Feature con el punto y la distancia efectivamente aplicada"
+)
+def get_punto_a_distancia_cable(
+    cable_id: int,
+    distancia: float = Query(..., ge=0, description="Distancia en metros a lo largo del cable"),
+    desde_final: bool = Query(False, description="Si es True, la distancia se mide desde el final del cable"),
+    user: str = Depends(authenticate)
+):
+    """
+    Calcula el punto a una distancia dada a lo largo de un cable corporativo.
+    
+    Las longitudes geodésicas acumuladas de cada cable se precalculan en la tabla indice_lineal
+    (sql/create_indice_lineal.sql), por lo que la consulta es una búsqueda binaria y una interpolación,
+    sin medir la geometría de nuevo. Si la distancia supera la longitud del cable se devuelve su extremo.
+    
+    Parámetros:
+    - **cable_id**: ID del cable en la tabla cable_corporativo
+    - **distancia**: Distancia en metros a lo largo del cable
+    - **desde_final**: Medir la distancia desde el final del cable en lugar del inicio
+    """
+    indice = cached_get_indice_lineal("cable_corporativo", cable_id)
+    if indice is None:
+        raise HTTPException(status_code=404, detail=f"No se encontró el cable {cable_id}")
+    longitud_total, indice = indice
+
+    distancia_aplicada = min(distancia, longitud_total)
+    if desde_final:
+        distancia_aplicada = longitud_total - distancia_aplicada
+    lon, lat, segmento = punto_a_distancia(indice, distancia_aplicada)
+    return JSONResponse(content={
+        "status": "success",
+        "punto": geojson.Feature(
+            geometry=geojson.Point((lon, lat)),
+            properties={
+                "cable_id": cable_id,
+                "distancia": distancia_aplicada,
+                "segmento": segmento,
+                "longitud_cable": longitud_total
+            }
+        )
+    })
+
+
+@router.get(
+    "/cobertura_red",
+    summary="Cobertura de la red desde un punto",
+    description="Devuelve el polígono del área alcanzable con una distancia de fibra dada desde un punto, a partir de las aristas de la red alcanzadas.",
+    response_description="GeoJSON Feature con el polígono de cobertura"
+)
+def get_cobertura_red(
+    lon: float = Query(..., description="Longitud del punto de origen (en grados decimales)"),
+    lat: float = Query(..., description="Latitud del punto de origen (en grados decimales)"),
+    distancia: float = Query(..., gt=0, description="Metros de fibra a recorrer desde el origen"),
+    metodo: MetodoCobertura = Query(MetodoCobertura.BUFFER, description="'buffer' (aristas alcanzadas con un buffer de 50 m) o 'concavo' (envolvente cóncava)"),
+    solo_componente_principal: bool = Query(False, description="Si es True, ajusta el punto a la componente principal (la de mayor longitud) de la red"),
+    user: str = Depends(authenticate)
+):
+    """
+    Calcula el área alcanzable con una distancia de fibra desde un punto (por ejemplo, una central).
+    
+    El punto se ajusta al vértice más cercano de la red y la distancia se redondea hacia arriba al
+    siguiente múltiplo de 100 m; el resultado se guarda en caché por vértice, tramo de distancia y método.
+    
+    Parámetros:
+    - **lon**, **lat**: Punto de origen en grados decimales (WGS84)
+    - **distancia**: Metros de fibra
+    - **metodo**: 'buffer' o 'concavo'
+    - **solo_componente_principal**: Ajustar el punto a la componente principal de la red
+    
+    Para las coberturas estándar de todas las centrales, usar /cobertura_centrales.
+    """
+    (vertice,) = get_vertices_cercanos_red_db([(lon, lat)], solo_componente_principal)
+    if vertice is None:
+        raise HTTPException(status_code=404, detail="No se pudo ajustar el punto a la red de cables")
+
+    distancia_tramo = math.ceil(distancia / COBERTURA_PASO_M) * COBERTURA_PASO_M
+    cobertura = cached_get_cobertura_red_db(vertice["vertice"], distancia_tramo, metodo.value)
+    if cobertura is None:
+        raise HTTPException(status_code=404, detail="No se alcanzó ninguna arista de la red desde el punto")
+    return JSONResponse(content={
+        "status": "success",
+        "cobertura": geojson.Feature(
+            geometry=cobertura["geometry"],
+            properties={
+                "distancia": distancia_tramo,
+                "metodo": metodo.value,
+                "area_km2": cobertura["area_km2"]
+            }
+        ),
+        "origen": vertice
+    })
+
+
+@router.get(
+    "/cobertura_centrales",
+    response_model=CentralesConsultaResponse,
+    summary="Coberturas precalculadas de las centrales",
+    description="Devuelve los polígonos de cobertura precalculados de las centrales para una de las distancias estándar.",
+    response_description="GeoJSON FeatureCollection con un polígono por central"
+)
+def get_cobertura_centrales(
+    distancia: float = Query(..., gt=0, description="Distancia estándar en metros (por defecto se precalculan 1000, 2000, 5000 y 10000)"),
+    metodo: MetodoCobertura = Query(MetodoCobertura.BUFFER, description="'buffer' o 'concavo'"),
+    central_id: int = Query(None, description="ID de una central (opcional; por defecto todas)"),
+    user: str = Depends(authenticate)
+):
+    """
+    Devuelve las coberturas de las centrales precalculadas por fn_actualizar_cobertura_centrales
+    (sql/fn_cobertura_red.sql), sin recorrer la red en la solicitud. Las calculadas sobre una topología
+    anterior de la red, o antes de mover una central, no se devuelven hasta volver a calcularlas.
+    
+    Parámetros:
+    - **distancia**: Una de las distancias precalculadas
+    - **metodo**: 'buffer' o 'concavo'
+    - **central_id**: Limitar el resultado a una central
+    """
+    distancias = get_distancias_cobertura_centrales_db(metodo.value)
+    if distancia not in distancias:
+        raise HTTPException(
+            status_code=404,
+            detail=f"No hay coberturas precalculadas para {distancia} m con el método '{metodo.value}'. Distancias disponibles: {distancias}. Si la red se recreó, se recalculan con SELECT fn_actualizar_cobertura_centrales()"
+        )
+    return JSONResponse(content=get_cobertura_centrales_db(distancia, metodo.value, central_id))
@@ -1,15 +1,27 @@
-from fastapi import APIRouter, Depends, Query, Body, Path, HTTPException, status, Header, Request
-from pydantic import BaseModel, Field, validator
+import json
+import os
+import shutil
+import tempfile
+from enum import Enum
+from fastapi import APIRouter, Depends, Query, Body, Path, HTTPException, status, Header, Request, UploadFile, File
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError, validator
 from typing import Optional, Union, List, Dict, Any
 from ..auth import authenticate
 from ..db_access import (insertar_camara_db, insertar_cable_corporativo_db, 
-                         insertar_central_db, insertar_empalme_db, insertar_reserva_db)
+                         insertar_central_db, insertar_empalme_db, insertar_reserva_db,
+                         insertar_lote_db)
 from .api_models import (CamaraResponse, CableResponse, CentralResponse, 
-                          EmpalmeResponse, ReservaResponse, PuntoGeografico)
+                          EmpalmeResponse, ReservaResponse, PuntoGeografico,
+                          InsercionLoteResponse)
 from .error_models import responses, create_error_response, ErrorCode
+from ..importar_geojson import importar_geojson, TAMANO_LOTE
 
 router = APIRouter(tags=["Operaciones de Escritura"])
 
+# Cantidad máxima de elementos aceptados en una sola inserción por lotes
+MAX_ELEMENTOS_LOTE = 5000
+
 class Camara(BaseModel):
     # En una nueva versión de la API, se pueden agregar campos para recibir las fotos
     type: Optional[str] = Field(None, description="Tipo de cámara (ej. 'Subterránea', 'Aérea', 'Pedestal')")
@@ -247,6 +259,7 @@ class Reserva(BaseModel):
 def insertar_camara(
     camara: Camara = Body(..., description="Datos de la nueva cámara"),
     request: Request = None,
+    upsert: bool = Query(False, description="Si es True y ya existe un registro con el mismo id_texto, lo actualiza en lugar de devolver 409"),
     auth_user: str = Depends(authenticate),
     user_header: Optional[str] = Header(None, description="Usuario para trazabilidad (opcional)")
 ):
@@ -262,14 +275,17 @@ def insertar_camara(
     
     Posibles códigos de error:
     - 401: Credenciales de autenticación no válidas
+    - 409: Ya existe una cámara con el mismo id_texto (solo si upsert es False)
     - 422: Datos de entrada inválidos (ej. coordenadas fuera de rango)
     - 500: Error interno al procesar la solicitud
     
     El estado inicial de la cámara será 'pendiente'.
+    Si ya existe un registro con el mismo id_texto se devuelve 409, salvo con **upsert**=true,
+    que actualiza el registro existente (conserva su id) y lo deja de nuevo en estado 'pendiente'.
     """
     # Usar el usuario del header si está disponible, de lo contrario usar el usuario autenticado
     username = user_header if user_header else auth_user
-    return insertar_camara_db(camara, username=username)
+    return insertar_camara_db(camara, username=username, upsert=upsert)
 
 @router.post(
     "/cable_corporativo", 
@@ -350,6 +366,7 @@ def insertar_cable_corporativo(
 def insertar_central(
     central: Central = Body(..., description="Datos de la nueva central"),
     request: Request = None,
+    upsert: bool = Query(False, description="Si es True y ya existe un registro con el mismo id_texto, lo actualiza en lugar de devolver 409"),
     auth_user: str = Depends(authenticate),
     user_header: Optional[str] = Header(None, description="Usuario para trazabilidad (opcional)")
 ):
@@ -363,10 +380,12 @@ def insertar_central(
     con el nombre del usuario especificado en el header 'user-header' o el autenticado.
     
     El estado inicial de la central será 'pendiente'.
+    Si ya existe un registro con el mismo id_texto se devuelve 409, salvo con **upsert**=true,
+    que actualiza el registro existente (conserva su id) y lo deja de nuevo en estado 'pendiente'.
     """
     # Usar el usuario del header si está disponible, de lo contrario usar el usuario autenticado
     username = user_header if user_header else auth_user
-    return insertar_central_db(central, username=username)
+    return insertar_central_db(central, username=username, upsert=upsert)
 
 @router.post(
     "/empalmes", 
@@ -383,6 +402,7 @@ def insertar_central(
 def insertar_empalme(
     empalme: Empalme = Body(..., description="Datos del nuevo empalme"),
     request: Request = None,
+    upsert: bool = Query(False, description="Si es True y ya existe un registro con el mismo id_texto, lo actualiza en lugar de devolver 409"),
     auth_user: str = Depends(authenticate),
     user_header: Optional[str] = Header(None, description="Usuario para trazabilidad (opcional)")
 ):
@@ -396,10 +416,12 @@ def insertar_empalme(
     con el nombre del usuario especificado en el header 'user-header' o el autenticado.
     
     El estado inicial del empalme será 'pendiente'.
+    Si ya existe un registro con el mismo id_texto se devuelve 409, salvo con **upsert**=true,
+    que actualiza el registro existente (conserva su id) y lo deja de nuevo en estado 'pendiente'.
     """
     # Usar el usuario del header si está disponible, de lo contrario usar el usuario autenticado
     username = user_header if user_header else auth_user
-    return insertar_empalme_db(empalme, username=username)
+    return insertar_empalme_db(empalme, username=username, upsert=upsert)
 
 @router.post(
     "/reservas", 
@@ -416,6 +438,7 @@ def insertar_empalme(
 def insertar_reserva(
     reserva: Reserva = Body(..., description="Datos de la nueva reserva"),
     request: Request = None,
+    upsert: bool = Query(False, description="Si es True y ya existe un registro con el mismo id_texto, lo actualiza en lugar de devolver 409"),
     auth_user: str = Depends(authenticate),
     user_header: Optional[str] = Header(None, description="Usuario para trazabilidad (opcional)")
 ):
@@ -429,7 +452,204 @@ def insertar_reserva(
     con el nombre del usuario especificado en el header 'user-header' o el autenticado.
     
     El estado inicial de la reserva será 'pendiente'.
+    Si ya existe un registro con el mismo id_texto se devuelve 409, salvo con **upsert**=true,
+    que actualiza el registro existente (conserva su id) y lo deja de nuevo en estado 'pendiente'.
+    """
+    # Usar el usuario del header si está disponible, de lo contrario usar el usuario autenticado
+    username = user_header if user_header else auth_user
+    return insertar_reserva_db(reserva, username=username, upsert=upsert)
+
+class CapaEscritura(str, Enum):
+    CAMARAS = "camaras"
+    CABLE_CORPORATIVO = "cable_corporativo"
+    CENTRALES = "centrales"
+    EMPALMES = "empalmes"
+    RESERVAS = "reservas"
+
+# Modelo de validación de cada capa para las inserciones por lotes
+MODELOS_ESCRITURA = {
+    CapaEscritura.CAMARAS: Camara,
+    CapaEscritura.CABLE_CORPORATIVO: CableCorporativo,
+    CapaEscritura.CENTRALES: Central,
+    CapaEscritura.EMPALMES: Empalme,
+    CapaEscritura.RESERVAS: Reserva
+}
+
+def feature_a_elemento(feature):
+    """
+    Convierte un GeoJSON Feature en los campos de los modelos de escritura: las propiedades tal cual,
+    un Point en longitud/latitud y un LineString en la lista de puntos
+    """
+    elemento = dict(feature.get("properties") or {})
+    geometria = feature.get("geometry") or {}
+    coordenadas = geometria.get("coordinates")
+    if geometria.get("type") == "Point" and coordenadas:
+        elemento.setdefault("longitud", coordenadas[0])
+        elemento.setdefault("latitud", coordenadas[1])
+    elif geometria.get("type") == "LineString" and coordenadas:
+        elemento.setdefault("puntos", [{"longitud": c[0], "latitud": c[1]} for c in coordenadas])
+    return elemento
+
+@router.post(
+    "/{capa}/bulk",
+    response_model=InsercionLoteResponse,
+    summary="Insertar elementos por lotes",
+    description="Inserta varios elementos de una capa en una sola transacción. Acepta una lista de objetos con los mismos campos que la inserción individual, o un GeoJSON FeatureCollection.",
+    response_description="IDs generados en el orden de la solicitud y errores por elemento",
+    responses={
+        status.HTTP_401_UNAUTHORIZED: responses[status.HTTP_401_UNAUTHORIZED],
+        status.HTTP_500_INTERNAL_SERVER_ERROR: responses[status.HTTP_500_INTERNAL_SERVER_ERROR]
+    }
+)
+def insertar_lote(
+    capa: CapaEscritura = Path(..., description="Capa en la que se insertan los elementos"),
+    datos: Union[List[Dict[str, Any]], Dict[str, Any]] = Body(..., description="Lista de elementos o GeoJSON FeatureCollection"),
+    upsert: bool = Query(False, description="Si es True, los elementos cuyo id_texto ya existe actualizan el registro existente"),
+    auth_user: str = Depends(authenticate),
+    user_header: Optional[str] = Header(None, description="Usuario para trazabilidad (opcional)")
+):
+    """
+    Inserta varios elementos de una capa (por ejemplo, un levantamiento completo de cámaras) en una sola solicitud.
+    
+    Cada elemento se valida con el mismo modelo que la inserción individual. Los elementos válidos se
+    insertan en una sola transacción con una sentencia de varias filas; los errores de un elemento
+    (validación, id_texto duplicado, geometría inválida) se devuelven en **errores** sin cancelar el resto.
+    
+    En un FeatureCollection las propiedades de cada Feature se usan como campos del elemento, y la
+    geometría Point o LineString reemplaza a longitud/latitud o a la lista de puntos.
+    
+    El estado inicial de todos los elementos será 'pendiente'. Con **upsert**=true los elementos cuyo
+    id_texto ya existe actualizan el registro existente en lugar de devolver un error 409
+    (no aplica a cable_corporativo, que no tiene id_texto único).
+    
+    Posibles códigos de error:
+    - 400: Cuerpo vacío, demasiados elementos o GeoJSON que no es un FeatureCollection
+    - 401: Credenciales de autenticación no válidas
+    - 500: Error interno al procesar la solicitud
+    """
+    if isinstance(datos, dict):
+        if datos.get("type") != "FeatureCollection":
+            raise HTTPException(status_code=400, detail="Se esperaba una lista de elementos o un GeoJSON FeatureCollection")
+        elementos = datos.get("features") or []
+    else:
+        elementos = datos
+
+    if not elementos:
+        raise HTTPException(status_code=400, detail="Se requiere al menos un elemento")
+    if len(elementos) > MAX_ELEMENTOS_LOTE:
+        raise HTTPException(status_code=400, detail=f"Se permiten como máximo {MAX_ELEMENTOS_LOTE} elementos por solicitud")
+
+    modelo = MODELOS_ESCRITURA[capa]
+    validos = []
+    errores = []
+    for indice, elemento in enumerate(elementos):
+        if isinstance(elemento, dict) and elemento.get("type") == "Feature":
+            elemento = feature_a_elemento(elemento)
+        try:
+            validos.append((indice, modelo(**elemento)))
+        except (ValidationError, TypeError) as e:
+            detalle = [
+                {"loc": list(error["loc"]), "msg": error["msg"]} for error in e.errors()
+            ] if isinstance(e, ValidationError) else str(e)
+            errores.append({"indice": indice, "status": 422, "message": detalle})
+
+    # Usar el usuario del header si está disponible, de lo contrario usar el usuario autenticado
+    username = user_header if user_header else auth_user
+    try:
+        ids, actualizados, errores_db = insertar_lote_db(capa.value, validos, username=username, upsert=upsert)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    errores = sorted(errores + errores_db, key=lambda error: error["indice"])
+    return {
+        "message": f"{len(ids)} de {len(elementos)} elementos insertados o actualizados correctamente",
+        "insertados": len(ids) - len(actualizados),
+        "actualizados": len(actualizados),
+        "ids": [ids.get(indice) for indice in range(len(elementos))],
+        "errores": errores
+    }
+
+@router.post(
+    "/{capa}/importar",
+    summary="Importar un archivo GeoJSON",
+    description="Importa un GeoJSON FeatureCollection completo a una capa, leyéndolo por partes y escribiéndolo por lotes con COPY. La respuesta se transmite en formato NDJSON con el avance de la importación.",
+    response_description="Flujo NDJSON: una línea por lote escrito y una línea final con el resumen",
+    responses={
+        status.HTTP_401_UNAUTHORIZED: responses[status.HTTP_401_UNAUTHORIZED],
+        status.HTTP_500_INTERNAL_SERVER_ERROR: responses[status.HTTP_500_INTERNAL_SERVER_ERROR]
+    }
+)
+def importar_archivo_geojson(
+    capa: CapaEscritura = Path(..., description="Capa en la que se importan los elementos"),
+    archivo: UploadFile = File(..., description="Archivo GeoJSON (FeatureCollection)"),
+    srid: Optional[int] = Query(None, description="SRID de las coordenadas del archivo. Por defecto se usa el 'crs' del archivo o, si no tiene, 4326", gt=0),
+    tamano_lote: int = Query(TAMANO_LOTE, description="Features escritos en cada lote", ge=1, le=50000),
+    auth_user: str = Depends(authenticate),
+    user_header: Optional[str] = Header(None, description="Usuario para trazabilidad (opcional)")
+):
+    """
+    Importa un archivo GeoJSON grande (por ejemplo, un levantamiento completo exportado de un SIG)
+    sin cargarlo completo en memoria.
+    
+    El archivo se lee por partes y cada Feature se procesa apenas se completa. Los Features se envían
+    por lotes con COPY y cada lote se inserta y se confirma con una sola sentencia, que reproyecta las
+    geometrías a EPSG:4326 en la base de datos (por ejemplo, desde EPSG:3116 como en los archivos de data/).
+    Los nombres de las propiedades se pasan a minúsculas, como en la carga inicial.
+    
+    Los elementos importados quedan en estado 'pendiente'. Los Features sin geometría y los que tienen un
+    id_texto que ya existe se omiten. Los cables MULTILINESTRING se importan como un registro por parte.
+    
+    La respuesta es NDJSON (`application/x-ndjson`):
+    - Una primera línea con **tipo** = 'inicio', la tabla y el SRID de origen, cuando la cabecera es válida
+    - Una línea con **tipo** = 'progreso' por cada lote confirmado, con los Features **leidos** y los registros **insertados**
+    - Una línea final con **tipo** = 'fin' y el resumen, o **tipo** = 'error' si la importación se interrumpe
+      (los lotes ya confirmados se conservan), por ejemplo por un Feature mal formado o de más de 64 MB
+    
+    Posibles códigos de error:
+    - 400: El archivo no es un GeoJSON FeatureCollection
+    - 401: Credenciales de autenticación no válidas
+    - 500: Error interno al procesar la solicitud
     """
     # Usar el usuario del header si está disponible, de lo contrario usar el usuario autenticado
     username = user_header if user_header else auth_user
-    return insertar_reserva_db(reserva, username=username)
+
+    # Copiar el archivo recibido a un temporal propio, que sigue disponible mientras se transmite la respuesta
+    temporal = tempfile.NamedTemporaryFile(suffix=".geojson", delete=False)
+    try:
+        with temporal:
+            shutil.copyfileobj(archivo.file, temporal)
+        entrada = open(temporal.name, "rb")
+    except Exception as e:
+        os.unlink(temporal.name)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def cerrar():
+        entrada.close()
+        os.unlink(temporal.name)
+
+    avance = importar_geojson(entrada, capa.value, username, srid, tamano_lote)
+    try:
+        # El primer avance ('inicio') solo lee la cabecera del archivo: un archivo que no es un
+        # FeatureCollection se rechaza con 400 antes de empezar a responder y de escribir registros
+        primero = next(avance)
+    except ValueError as e:
+        cerrar()
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        cerrar()
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def generar():
+        try:
+            yield json.dumps(primero) + "\n"
+            for linea in avance:
+                yield json.dumps(linea) + "\n"
+        except Exception as e:
+            yield json.dumps({"tipo": "error", "message": f"Error importando el archivo: {str(e)}"}) + "\n"
+        finally:
+            avance.close()
+            cerrar()
+
+    return StreamingResponse(generar(), media_type="application/x-ndjson")
@@ -59,7 +59,7 @@ def insertar_cable_prueba():
                     %s, 
                     %s, 
                     'pendiente',
-                    ST_Length(ST_Transform(ST_GeomFromText(%s, 4326), 3857))::float
+                    ST_Length(ST_GeomFromText(%s, 4326)::geography)::float
                 )
                 RETURNING id
                 """,
@@ -55,10 +55,25 @@ def ejecutar_scripts_sql():
         
         # Lista de scripts SQL en el orden especificado
         sql_scripts = [
+            'sql/create_columnas_generadas.sql',
             'sql/create_table_red.sql',
+            'sql/create_red_componentes.sql',
+            'sql/create_indice_lineal.sql',
             'sql/create_fn_punto_en_ruta_red.sql',
+            'sql/create_fn_linea_en_ruta_red_v2.sql',
             'sql/create_get_nearest_cable.sql',
-            'sql/get_cables_cercanos.sql'
+            'sql/get_cables_cercanos.sql',
+            'sql/fn_nodos_alcanzables_en_ruta_red.sql',
+            'sql/fn_nodos_alcanzables_lote.sql',
+            'sql/fn_ruta_entre_puntos.sql',
+            'sql/create_arboles_centrales.sql',
+            'sql/fn_cobertura_red.sql',
+            'sql/create_indices_id_texto.sql',
+            'sql/create_hash_origen.sql',
+            'sql/create_trigger_updated_at.sql',
+            'sql/create_cambios.sql',
+            'sql/create_notificaciones.sql',
+            'sql/create_cable_corporativo_agregado.sql'
         ]
         
         for script_path in sql_scripts:
@@ -0,0 +1,209 @@
+-- Árboles de caminos mínimos precalculados desde cada central sobre la red de cables, para localizar
+-- cortes de fibra a partir de una distancia medida con OTDR sin ejecutar una búsqueda por solicitud.
+-- Ejecutar después de sql/create_table_red.sql, sql/create_red_componentes.sql y sql/create_indice_lineal.sql.
+-- Cada raíz guarda la versión de la topología (fn_version_red) y la geometría de la central con la que
+-- se calculó: fn_localizar_falla_otdr no usa árboles desactualizados, y app/db_access.py recalcula el
+-- de una central cuando hace falta. fn_actualizar_arboles_centrales() recalcula todos.
+-- Requiere pgRouting >= 3.6 (columna start_vid en el resultado multi-origen de pgr_drivingDistance)
+
+-- Vértice de la red al que se ajusta cada central
+CREATE TABLE IF NOT EXISTS red_raices_centrales (
+    central_id integer PRIMARY KEY,
+    nodo bigint NOT NULL,
+    distancia_a_red double precision NOT NULL,
+    version_red text,
+    geom_central geometry
+);
+
+-- Bases creadas antes de guardar la versión: sus árboles quedan desactualizados y se recalculan
+ALTER TABLE red_raices_centrales ADD COLUMN IF NOT EXISTS version_red text;
+ALTER TABLE red_raices_centrales ADD COLUMN IF NOT EXISTS geom_central geometry;
+
+-- Indica si el árbol de una central se calculó sobre la topología actual y con su geometría actual
+CREATE OR REPLACE FUNCTION fn_arbol_central_vigente(p_central_id integer)
+RETURNS boolean
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE((
+        SELECT rc.version_red = fn_version_red() AND ST_OrderingEquals(rc.geom_central, c.geom)
+        FROM red_raices_centrales rc
+        JOIN centrales c ON c.id = rc.central_id
+        WHERE rc.central_id = p_central_id
+    ), false);
+$$;
+
+-- Un registro por nodo alcanzable desde cada central: la arista del árbol por la que se llega al nodo,
+-- la distancia acumulada en el nodo y la distancia acumulada en el otro extremo de esa arista
+CREATE TABLE IF NOT EXISTS red_arboles_centrales (
+    central_id integer NOT NULL,
+    nodo bigint NOT NULL,
+    arista bigint,
+    distancia_padre double precision,
+    distancia_acumulada double precision NOT NULL,
+    PRIMARY KEY (central_id, nodo)
+);
+
+CREATE INDEX IF NOT EXISTS red_arboles_centrales_distancia_idx
+    ON red_arboles_centrales (central_id, distancia_acumulada);
+
+-- Recalcula los árboles de las centrales indicadas (todas si centrales_ids es NULL) con una sola
+-- llamada multi-origen a pgr_drivingDistance, hasta distancia_max metros (alcance típico de un OTDR)
+CREATE OR REPLACE FUNCTION fn_actualizar_arboles_centrales(
+    centrales_ids integer[] DEFAULT NULL,
+    distancia_max double precision DEFAULT 60000
+)
+RETURNS integer AS
+$$
+DECLARE
+    n_filas integer;
+BEGIN
+    -- Los cálculos de una misma central se esperan entre sí (en orden, para no bloquearse mutuamente)
+    -- y el cálculo completo espera a los parciales en curso, y viceversa
+    IF centrales_ids IS NULL THEN
+        LOCK TABLE red_raices_centrales IN SHARE ROW EXCLUSIVE MODE;
+    ELSE
+        PERFORM pg_advisory_xact_lock(hashtext('red_arboles_centrales'), i.id)
+        FROM (SELECT DISTINCT unnest(centrales_ids) AS id ORDER BY 1) i;
+    END IF;
+
+    DELETE FROM red_arboles_centrales a
+    WHERE centrales_ids IS NULL OR a.central_id = ANY(centrales_ids);
+    DELETE FROM red_raices_centrales rc
+    WHERE centrales_ids IS NULL OR rc.central_id = ANY(centrales_ids);
+
+    INSERT INTO red_raices_centrales (central_id, nodo, distancia_a_red, version_red, geom_central)
+    SELECT c.id, v.id, ST_Distance(c.geom::geography, v.the_geom::geography), fn_version_red(), c.geom
+    FROM centrales c
+    CROSS JOIN LATERAL (
+        SELECT rv.id, rv.the_geom
+        FROM red_vertices_pgr rv
+        ORDER BY rv.the_geom <-> c.geom
+        LIMIT 1
+    ) AS v
+    WHERE (centrales_ids IS NULL OR c.id = ANY(centrales_ids))
+      AND c.estado IS DISTINCT FROM 'rechazado';
+
+    INSERT INTO red_arboles_centrales (central_id, nodo, arista, distancia_padre, distancia_acumulada)
+    SELECT rc.central_id, dd.node, r.id, dd.agg_cost - r.cost, dd.agg_cost
+    FROM pgr_drivingDistance(
+        'SELECT id, source, target, cost, reverse_cost FROM red',
+        (
+            SELECT array_agg(DISTINCT rc2.nodo)
+            FROM red_raices_centrales rc2
+            WHERE centrales_ids IS NULL OR rc2.central_id = ANY(centrales_ids)
+        ),
+        distancia_max,
+        directed := false,
+        equicost := false
+    ) AS dd
+    JOIN red_raices_centrales rc ON rc.nodo = dd.start_vid
+    LEFT JOIN red r ON r.id = dd.edge
+    WHERE centrales_ids IS NULL OR rc.central_id = ANY(centrales_ids);
+
+    GET DIAGNOSTICS n_filas = ROW_COUNT;
+    ANALYZE red_arboles_centrales;
+    RETURN n_filas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Candidatos de ubicación de un corte a distancia_m metros de la central, con las cámaras y los
+-- empalmes más cercanos a cada candidato. Se revisan todas las aristas con algún extremo en el árbol,
+-- no solo las del árbol: en una arista que cierra un ciclo, cada punto se alcanza por el extremo que
+-- da el camino más corto, así que se entra por un extremo si distancia_m está entre su distancia y
+-- la distancia más el largo de la arista, y no supera la mitad de la suma de ambas distancias más el
+-- largo (el punto donde se igualan los dos caminos). Si el árbol de la central no corresponde a la
+-- topología actual no se devuelve ningún candidato.
+CREATE OR REPLACE FUNCTION fn_localizar_falla_otdr(
+    p_central_id integer,
+    distancia_m double precision,
+    n_cercanos integer DEFAULT 3
+)
+RETURNS TABLE (
+    geom geometry,
+    arista bigint,
+    nombre_cable text,
+    camaras jsonb,
+    empalmes jsonb
+) AS
+$$
+    WITH distancias AS (
+        SELECT a.nodo, a.distancia_acumulada
+        FROM red_arboles_centrales a
+        WHERE a.central_id = p_central_id
+          AND fn_arbol_central_vigente(p_central_id)
+    ),
+    entradas AS (
+        -- Entrada por el extremo source: el punto está a distancia_m - d_entrada del inicio de la arista
+        SELECT r.id, r.geom, r.nombre_cable, r.cost, true AS desde_source,
+               ds.distancia_acumulada AS d_entrada, dt.distancia_acumulada AS d_salida
+        FROM distancias ds
+        JOIN red r ON r.source = ds.nodo
+        LEFT JOIN distancias dt ON dt.nodo = r.target
+        WHERE ds.distancia_acumulada < distancia_m
+        UNION ALL
+        -- Entrada por el extremo target: se recorre la arista desde su final
+        SELECT r.id, r.geom, r.nombre_cable, r.cost, false,
+               dt.distancia_acumulada, ds.distancia_acumulada
+        FROM distancias dt
+        JOIN red r ON r.target = dt.nodo
+        LEFT JOIN distancias ds ON ds.nodo = r.source
+        WHERE dt.distancia_acumulada < distancia_m
+    ),
+    cruces AS (
+        SELECT
+            e.id AS arista,
+            e.nombre_cable,
+            -- El costo de la arista es geodésico: el punto se ubica con fn_fraccion_geodesica
+            -- (sql/create_indice_lineal.sql), contando desde el final si se entra por target
+            ST_LineInterpolatePoint(e.geom, fn_fraccion_geodesica(
+                e.geom,
+                CASE WHEN e.desde_source THEN distancia_m - e.d_entrada ELSE e.cost - (distancia_m - e.d_entrada) END
+            )) AS punto
+        FROM entradas e
+        WHERE distancia_m <= e.d_entrada + e.cost
+          -- El otro extremo fuera del árbol está más allá del alcance calculado
+          AND (
+              e.d_salida IS NULL
+              OR 2 * distancia_m < e.d_entrada + e.d_salida + e.cost
+              -- Empate: el punto es el otro extremo, al que se llega por esta arista, o el punto medio
+              -- de un ciclo, que se cuenta solo con la entrada por source
+              OR (
+                  2 * distancia_m = e.d_entrada + e.d_salida + e.cost
+                  AND (e.desde_source OR e.d_salida >= e.d_entrada + e.cost)
+              )
+          )
+    )
+    SELECT
+        cr.punto,
+        cr.arista,
+        cr.nombre_cable,
+        (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                'id', c.id, 'id_texto', c.id_texto, 'distancia', c.distancia
+            ) ORDER BY c.distancia), '[]'::jsonb)
+            FROM (
+                SELECT c2.id, c2.id_texto,
+                       ST_Distance(c2.geom::geography, cr.punto::geography) AS distancia
+                FROM camaras c2
+                ORDER BY c2.geom <-> cr.punto
+                LIMIT n_cercanos
+            ) AS c
+        ) AS camaras,
+        (
+            SELECT COALESCE(jsonb_agg(jsonb_build_object(
+                'id', e.id, 'id_texto', e.id_texto, 'distancia', e.distancia
+            ) ORDER BY e.distancia), '[]'::jsonb)
+            FROM (
+                SELECT e2.id, e2.id_texto,
+                       ST_Distance(e2.geom::geography, cr.punto::geography) AS distancia
+                FROM empalmes e2
+                ORDER BY e2.geom <-> cr.punto
+                LIMIT n_cercanos
+            ) AS e
+        ) AS empalmes
+    FROM cruces cr
+    ORDER BY cr.arista;
+$$ LANGUAGE sql STABLE;
+
+SELECT fn_actualizar_arboles_centrales();
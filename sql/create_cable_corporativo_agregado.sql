@@ -0,0 +1,128 @@
+-- Capa de cables agregada: una fila por cable lógico (los tramos de cable_corporativo con las mismas
+-- propiedades), con la geometría reunida, los ids de los tramos, la distancia total y la cantidad de
+-- tramos. /api/all_cables la lee directamente en lugar de agrupar toda la tabla por el JSONB completo.
+--
+-- Se mantiene con triggers por sentencia sobre cable_corporativo: cada sentencia recalcula solo los
+-- cables cuyas propiedades aparecen en los registros insertados, actualizados o eliminados. Las filas
+-- se identifican por el md5 de las propiedades, con un índice de expresión para encontrar los tramos.
+-- fn_refrescar_cable_corporativo_agregado() reconstruye la tabla completa (se ejecuta al final de este
+-- script, por ejemplo después de la carga inicial).
+
+CREATE OR REPLACE FUNCTION fn_clave_cable_agregado(propiedades jsonb)
+RETURNS text
+LANGUAGE sql
+IMMUTABLE
+AS $$
+    SELECT md5(COALESCE(propiedades::text, ''));
+$$;
+
+CREATE TABLE IF NOT EXISTS cable_corporativo_agregado (
+    clave text PRIMARY KEY,
+    propiedades jsonb,
+    geom geometry,
+    ids integer[] NOT NULL,
+    distancia_total double precision,
+    cantidad_tramos integer NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS cable_corporativo_clave_agregado_idx
+    ON cable_corporativo (fn_clave_cable_agregado(propiedades));
+
+CREATE OR REPLACE FUNCTION fn_recalcular_cable_agregado(claves text[])
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Las transacciones que recalculan el mismo cable se esperan entre sí (en orden, para no
+    -- bloquearse mutuamente); la consulta siguiente ya ve los tramos que confirmó la anterior
+    PERFORM pg_advisory_xact_lock(hashtext('cable_corporativo_agregado'), hashtext(c.clave))
+    FROM (SELECT DISTINCT unnest(claves) AS clave ORDER BY 1) c;
+
+    DELETE FROM cable_corporativo_agregado WHERE clave = ANY(claves);
+
+    INSERT INTO cable_corporativo_agregado (clave, propiedades, geom, ids, distancia_total, cantidad_tramos)
+    SELECT
+        fn_clave_cable_agregado(propiedades),
+        propiedades,
+        ST_Collect(geom),
+        array_agg(id ORDER BY id),
+        SUM(distancia_metros),
+        COUNT(*)
+    FROM cable_corporativo
+    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+    AND fn_clave_cable_agregado(propiedades) = ANY(claves)
+    GROUP BY fn_clave_cable_agregado(propiedades), propiedades;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_refrescar_cable_corporativo_agregado()
+RETURNS void
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Los triggers esperan a que termine la reconstrucción
+    LOCK TABLE cable_corporativo_agregado IN EXCLUSIVE MODE;
+
+    DELETE FROM cable_corporativo_agregado;
+
+    INSERT INTO cable_corporativo_agregado (clave, propiedades, geom, ids, distancia_total, cantidad_tramos)
+    SELECT
+        fn_clave_cable_agregado(propiedades),
+        propiedades,
+        ST_Collect(geom),
+        array_agg(id ORDER BY id),
+        SUM(distancia_metros),
+        COUNT(*)
+    FROM cable_corporativo
+    WHERE (estado != 'pendiente' OR estado IS NULL OR estado != 'rechazado')
+    GROUP BY fn_clave_cable_agregado(propiedades), propiedades;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION fn_mantener_cable_agregado()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    claves text[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT fn_clave_cable_agregado(n.propiedades)) INTO claves FROM nuevos n;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT fn_clave_cable_agregado(v.propiedades)) INTO claves FROM viejos v;
+    ELSE
+        -- Un tramo actualizado puede salir de un cable y entrar en otro: se recalculan ambos
+        SELECT array_agg(DISTINCT c.clave) INTO claves
+        FROM (
+            SELECT fn_clave_cable_agregado(v.propiedades) AS clave FROM viejos v
+            UNION
+            SELECT fn_clave_cable_agregado(n.propiedades) FROM nuevos n
+        ) c;
+    END IF;
+
+    IF claves IS NOT NULL THEN
+        PERFORM fn_recalcular_cable_agregado(claves);
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS cable_corporativo_agregado_insert ON cable_corporativo;
+CREATE TRIGGER cable_corporativo_agregado_insert
+    AFTER INSERT ON cable_corporativo
+    REFERENCING NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_mantener_cable_agregado();
+
+DROP TRIGGER IF EXISTS cable_corporativo_agregado_update ON cable_corporativo;
+CREATE TRIGGER cable_corporativo_agregado_update
+    AFTER UPDATE ON cable_corporativo
+    REFERENCING OLD TABLE AS viejos NEW TABLE AS nuevos
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_mantener_cable_agregado();
+
+DROP TRIGGER IF EXISTS cable_corporativo_agregado_delete ON cable_corporativo;
+CREATE TRIGGER cable_corporativo_agregado_delete
+    AFTER DELETE ON cable_corporativo
+    REFERENCING OLD TABLE AS viejos
+    FOR EACH STATEMENT EXECUTE FUNCTION fn_mantener_cable_agregado();
+
+SELECT fn_refrescar_cable_corporativo_agregado();
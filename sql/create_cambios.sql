@@ -0,0 +1,83 @@
+-- Feed de cambios por capa para /api/{capa}/cambios.
+-- Cada inserción o actualización toma un número de versión de una secuencia común a todas las capas
+-- (columna version) y guarda la transacción que la escribió (version_xid); cada eliminación deja una
+-- marca en cambios_eliminados con las mismas dos columnas.
+--
+-- Las versiones se toman al escribir pero las transacciones se confirman en otro orden, así que un
+-- cursor por version podría saltarse un cambio confirmado tarde. El feed se ordena por
+-- (version_xid, version) y solo entrega los cambios de transacciones anteriores a la más antigua en
+-- curso (pg_snapshot_xmin): toda transacción que todavía no se confirmó tiene un xid mayor, de modo
+-- que sus cambios siempre quedan después del cursor.
+--
+-- Al agregar las columnas, los registros existentes reciben una versión cada uno y el xid de este script.
+
+CREATE SEQUENCE IF NOT EXISTS cambios_version_seq;
+
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT nextval('cambios_version_seq');
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS version_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE camaras ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT nextval('cambios_version_seq');
+ALTER TABLE camaras ADD COLUMN IF NOT EXISTS version_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE centrales ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT nextval('cambios_version_seq');
+ALTER TABLE centrales ADD COLUMN IF NOT EXISTS version_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE empalmes ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT nextval('cambios_version_seq');
+ALTER TABLE empalmes ADD COLUMN IF NOT EXISTS version_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS version bigint NOT NULL DEFAULT nextval('cambios_version_seq');
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS version_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+CREATE TABLE IF NOT EXISTS cambios_eliminados (
+    version bigint PRIMARY KEY DEFAULT nextval('cambios_version_seq'),
+    version_xid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+    capa text NOT NULL,
+    elemento_id integer NOT NULL,
+    eliminado_at timestamptz NOT NULL DEFAULT now()
+);
+
+ALTER TABLE cambios_eliminados ADD COLUMN IF NOT EXISTS version_xid xid8 NOT NULL DEFAULT pg_current_xact_id();
+
+DROP INDEX IF EXISTS cambios_eliminados_capa_version_idx;
+CREATE INDEX IF NOT EXISTS cambios_eliminados_capa_xid_version_idx ON cambios_eliminados (capa, version_xid, version);
+
+-- Nueva versión en cada actualización
+CREATE OR REPLACE FUNCTION fn_registrar_version()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.version := nextval('cambios_version_seq');
+    NEW.version_xid := pg_current_xact_id();
+    RETURN NEW;
+END;
+$$;
+
+-- Marca de eliminación
+CREATE OR REPLACE FUNCTION fn_registrar_eliminado()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO cambios_eliminados (capa, elemento_id) VALUES (TG_TABLE_NAME, OLD.id);
+    RETURN OLD;
+END;
+$$;
+
+DO $$
+DECLARE
+    tabla text;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['cable_corporativo', 'camaras', 'centrales', 'empalmes', 'reservas'] LOOP
+        EXECUTE format('DROP INDEX IF EXISTS %I', tabla || '_version_idx');
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (version_xid, version)', tabla || '_xid_version_idx', tabla);
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tabla || '_version', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE UPDATE ON %I FOR EACH ROW EXECUTE FUNCTION fn_registrar_version()',
+            tabla || '_version', tabla
+        );
+
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tabla || '_eliminado', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I FOR EACH ROW EXECUTE FUNCTION fn_registrar_eliminado()',
+            tabla || '_eliminado', tabla
+        );
+    END LOOP;
+END $$;
@@ -0,0 +1,60 @@
+-- Columnas generadas (STORED) con los atributos de propiedades que se usan en filtros, para que las
+-- consultas los lean como columnas con índice en lugar de extraerlos del JSONB en cada registro:
+--   id_texto y nombre en todas las capas (el nombre está en 'name', 'nombre' o 'nombre_esp' según la capa;
+--   los cables creados desde la API guardan el id_texto como 'id_text'),
+--   colocacion y es_troncal en cable_corporativo (filtro de troncales de get_cables_cercanos).
+-- PostgreSQL las recalcula al insertar o actualizar propiedades; no se escriben desde la aplicación.
+-- En las tablas creadas por app/db_init.py ya existen, este script las agrega a las bases creadas antes
+-- (agregar una columna STORED reescribe la tabla).
+
+-- Las bases donde id_texto de los cables se creó solo con 'id_texto' la recrean con ambas claves
+DO $$
+BEGIN
+    IF EXISTS (
+        SELECT 1
+        FROM pg_attribute a
+        JOIN pg_attrdef d ON d.adrelid = a.attrelid AND d.adnum = a.attnum
+        WHERE a.attrelid = 'cable_corporativo'::regclass AND a.attname = 'id_texto'
+        AND pg_get_expr(d.adbin, d.adrelid) NOT LIKE '%id_text''%'
+    ) THEN
+        ALTER TABLE cable_corporativo DROP COLUMN id_texto;
+    END IF;
+END $$;
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS id_texto text
+    GENERATED ALWAYS AS (COALESCE(propiedades->>'id_texto', propiedades->>'id_text')) STORED;
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS nombre text GENERATED ALWAYS AS (propiedades->>'name') STORED;
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS colocacion text GENERATED ALWAYS AS (propiedades->>'colocacion') STORED;
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS es_troncal boolean GENERATED ALWAYS AS ((propiedades->>'colocacion') LIKE 'Troncal%') STORED;
+
+ALTER TABLE camaras ADD COLUMN IF NOT EXISTS id_texto text GENERATED ALWAYS AS (propiedades->>'id_texto') STORED;
+ALTER TABLE camaras ADD COLUMN IF NOT EXISTS nombre text GENERATED ALWAYS AS (propiedades->>'nombre_esp') STORED;
+
+ALTER TABLE centrales ADD COLUMN IF NOT EXISTS id_texto text GENERATED ALWAYS AS (propiedades->>'id_texto') STORED;
+ALTER TABLE centrales ADD COLUMN IF NOT EXISTS nombre text GENERATED ALWAYS AS (propiedades->>'nombre') STORED;
+
+ALTER TABLE empalmes ADD COLUMN IF NOT EXISTS id_texto text GENERATED ALWAYS AS (propiedades->>'id_texto') STORED;
+ALTER TABLE empalmes ADD COLUMN IF NOT EXISTS nombre text GENERATED ALWAYS AS (propiedades->>'name') STORED;
+
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS id_texto text GENERATED ALWAYS AS (propiedades->>'id_texto') STORED;
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS nombre text GENERATED ALWAYS AS (propiedades->>'nombre') STORED;
+
+-- Los índices únicos de id_texto de las capas puntuales están en sql/create_indices_id_texto.sql
+CREATE INDEX IF NOT EXISTS cable_corporativo_id_texto_idx ON cable_corporativo (id_texto);
+CREATE INDEX IF NOT EXISTS cable_corporativo_nombre_idx ON cable_corporativo (nombre);
+CREATE INDEX IF NOT EXISTS cable_corporativo_colocacion_idx ON cable_corporativo (colocacion);
+CREATE INDEX IF NOT EXISTS camaras_nombre_idx ON camaras (nombre);
+CREATE INDEX IF NOT EXISTS centrales_nombre_idx ON centrales (nombre);
+CREATE INDEX IF NOT EXISTS empalmes_nombre_idx ON empalmes (nombre);
+CREATE INDEX IF NOT EXISTS reservas_nombre_idx ON reservas (nombre);
+
+-- Índice espacial parcial de los cables que no son troncales: la búsqueda por defecto de
+-- get_cables_cercanos (sin troncales) solo recorre estos cables
+CREATE INDEX IF NOT EXISTS cable_corporativo_no_troncal_geog_idx
+    ON cable_corporativo USING gist ((geom::geography))
+    WHERE NOT es_troncal;
+
+ANALYZE cable_corporativo;
+ANALYZE camaras;
+ANALYZE centrales;
+ANALYZE empalmes;
+ANALYZE reservas;
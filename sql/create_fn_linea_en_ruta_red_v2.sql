@@ -0,0 +1,116 @@
+-- Nueva versión de fn_linea_en_ruta_red: devuelve una sola fila con la línea de la ruta (una vez)
+-- y todos los puntos agrupados en un MULTIPOINT, generados en una sola consulta con generate_series
+-- en lugar de un bucle que repite la línea completa en cada fila.
+-- Recibe: lon, lat, distancia_m, incluir_linea, solo_componente_principal
+-- Devuelve: linea (NULL si incluir_linea es false), puntos (MULTIPOINT a intervalos de distancia_m,
+--           más el punto final de la línea si la longitud no es múltiplo exacto de distancia_m)
+-- Las distancias son geodésicas y los puntos se ubican con fn_fraccion_geodesica
+-- (sql/create_indice_lineal.sql), en la misma medida que la longitud total.
+-- Solo carga las aristas de la componente del nodo de inicio (sql/create_red_componentes.sql); con
+-- solo_componente_principal el punto se ajusta a la componente de mayor longitud.
+
+DROP FUNCTION IF EXISTS fn_linea_en_ruta_red_v2(
+    lon double precision,
+    lat double precision,
+    distancia_m double precision,
+    incluir_linea boolean
+);
+CREATE OR REPLACE FUNCTION fn_linea_en_ruta_red_v2(
+    lon double precision,
+    lat double precision,
+    distancia_m double precision,
+    incluir_linea boolean DEFAULT true,
+    solo_componente_principal boolean DEFAULT false
+)
+RETURNS TABLE (
+    linea geometry,
+    puntos geometry
+) AS
+$$
+DECLARE
+    nodo_inicio bigint;
+    componente_inicio bigint;
+    sql_aristas text;
+    linea_resultado geometry;
+    linea_final geometry;
+    longitud_total double precision;
+    n_puntos integer;
+BEGIN
+    SELECT v.id, v.componente
+    INTO nodo_inicio, componente_inicio
+    FROM red_vertices_pgr v
+    WHERE NOT solo_componente_principal OR v.componente = fn_componente_principal_red()
+    ORDER BY v.the_geom <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)
+    LIMIT 1;
+
+    IF nodo_inicio IS NULL THEN
+        RETURN;
+    END IF;
+
+    IF componente_inicio IS NULL THEN
+        sql_aristas := 'SELECT id, source, target, cost, reverse_cost FROM red';
+    ELSE
+        sql_aristas := format(
+            'SELECT id, source, target, cost, reverse_cost FROM red WHERE componente = %s',
+            componente_inicio
+        );
+    END IF;
+
+    -- Obtener la línea completa de la ruta
+    WITH subred AS (
+        SELECT *
+        FROM pgr_drivingDistance(
+            sql_aristas,
+            nodo_inicio,
+            distancia_m,
+            directed := false
+        )
+    )
+    SELECT ST_LineMerge(ST_Union(r.geom)) AS geom
+    INTO linea_resultado
+    FROM subred s
+    JOIN red r ON s.edge = r.id;
+
+    -- Si no se encontró ninguna ruta, no devolver filas
+    IF linea_resultado IS NULL THEN
+        RETURN;
+    END IF;
+
+    -- Si sigue siendo MULTILINESTRING, extraer el primer componente y volver a hacer LineMerge
+    IF GeometryType(linea_resultado) = 'MULTILINESTRING' THEN
+        linea_final := ST_LineMerge(ST_GeometryN(linea_resultado, 1));
+    ELSE
+        linea_final := linea_resultado;
+    END IF;
+
+    -- Validar que sea un LINESTRING
+    IF linea_final IS NULL OR GeometryType(linea_final) != 'LINESTRING' THEN
+        RETURN;
+    END IF;
+
+    -- Calcular la longitud total de la línea (geodésica, en metros, como el costo de las aristas)
+    longitud_total := ST_Length(linea_final::geography);
+    IF longitud_total IS NULL OR longitud_total = 0 THEN
+        RETURN;
+    END IF;
+
+    -- Calcular el número de puntos a devolver
+    n_puntos := GREATEST(1, floor(longitud_total / distancia_m)::integer);
+
+    -- Una sola fila: la línea y todos los puntos, generados de forma conjunta
+    RETURN QUERY
+    SELECT
+        CASE WHEN incluir_linea THEN linea_final ELSE NULL END AS linea,
+        ST_Collect(p.punto ORDER BY p.orden) AS puntos
+    FROM (
+        SELECT
+            i AS orden,
+            ST_LineInterpolatePoint(linea_final, fn_fraccion_geodesica(linea_final, i * distancia_m)) AS punto
+        FROM generate_series(1, n_puntos) AS i
+        UNION ALL
+        -- Si la distancia no es múltiplo exacto, agregar el último punto de la línea
+        SELECT n_puntos + 1, ST_EndPoint(linea_final)
+        WHERE (n_puntos * distancia_m) < longitud_total
+    ) AS p;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,10 @@
+-- Columna hash_origen para la sincronización de la carga inicial (python -m app.db_init --sync).
+-- Guarda el hash del Feature en el archivo GeoJSON de origen; en las tablas creadas por app/db_init.py
+-- ya existe, este script la agrega a las bases creadas antes.
+-- Los registros sin hash se actualizan una vez en la primera sincronización.
+
+ALTER TABLE cable_corporativo ADD COLUMN IF NOT EXISTS hash_origen text;
+ALTER TABLE camaras ADD COLUMN IF NOT EXISTS hash_origen text;
+ALTER TABLE centrales ADD COLUMN IF NOT EXISTS hash_origen text;
+ALTER TABLE empalmes ADD COLUMN IF NOT EXISTS hash_origen text;
+ALTER TABLE reservas ADD COLUMN IF NOT EXISTS hash_origen text;
@@ -0,0 +1,133 @@
+-- Índice de referencia lineal: para cada arista de red y cada cable de cable_corporativo guarda la
+-- longitud geodésica acumulada en cada vértice, de modo que "punto a d metros a lo largo del cable"
+-- se resuelve con una búsqueda binaria y una sola interpolación (app/indice_lineal.py), sin volver
+-- a medir la geometría en cada consulta.
+-- Ejecutar después de sql/create_table_red.sql (los ids de red cambian al recrear la topología: ese
+-- script descarta el índice de red, que se vuelve a calcular por elemento al consultarlo) y antes de
+-- los scripts que usan fn_fraccion_geodesica.
+-- Los arreglos se guardan como bytea de float8 big-endian (float8send), 8 bytes por valor.
+
+CREATE TABLE IF NOT EXISTS indice_lineal (
+    capa text NOT NULL,
+    elemento_id bigint NOT NULL,
+    n_vertices integer NOT NULL,
+    longitud_total double precision NOT NULL,
+    longitudes bytea NOT NULL,   -- longitud acumulada en metros en cada vértice (la primera es 0)
+    coordenadas bytea NOT NULL,  -- lon, lat de cada vértice, intercalados
+    PRIMARY KEY (capa, elemento_id)
+);
+
+-- Longitudes acumuladas y coordenadas empaquetadas de una geometría lineal
+CREATE OR REPLACE FUNCTION fn_indice_lineal_geom(g geometry)
+RETURNS TABLE (
+    n_vertices integer,
+    longitud_total double precision,
+    longitudes bytea,
+    coordenadas bytea
+) AS
+$$
+    SELECT
+        COUNT(*)::integer,
+        MAX(p.acumulada),
+        string_agg(float8send(p.acumulada), ''::bytea ORDER BY p.orden),
+        string_agg(float8send(ST_X(p.geom)) || float8send(ST_Y(p.geom)), ''::bytea ORDER BY p.orden)
+    FROM (
+        SELECT s.orden, s.geom, COALESCE(SUM(s.tramo) OVER (ORDER BY s.orden), 0) AS acumulada
+        FROM (
+            SELECT
+                d.path AS orden,
+                d.geom,
+                ST_Distance(LAG(d.geom) OVER (ORDER BY d.path)::geography, d.geom::geography) AS tramo
+            FROM ST_DumpPoints(g) AS d
+        ) AS s
+    ) AS p;
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Fracción de la longitud plana de una línea en la que se encuentra el punto a distancia_m metros
+-- geodésicos desde su inicio, para usar con ST_LineInterpolatePoint y ST_LineSubstring. Mide cada
+-- segmento igual que fn_indice_lineal_geom (y el costo de las aristas de red) e interpola dentro del
+-- segmento en proporción a la longitud geodésica recorrida, como app/indice_lineal.py; dividir la
+-- distancia geodésica por la longitud total daría un punto desplazado en las líneas largas.
+-- La distancia se limita a la longitud de la línea.
+CREATE OR REPLACE FUNCTION fn_fraccion_geodesica(g geometry, distancia_m double precision)
+RETURNS double precision AS
+$$
+    SELECT COALESCE((
+        SELECT LEAST(1.0, GREATEST(0.0,
+            (a.plana_inicio + a.plana * COALESCE((distancia_m - a.geodesica_inicio) / NULLIF(a.geodesica, 0), 0.0))
+            / NULLIF(ST_Length(g), 0)
+        ))
+        FROM (
+            SELECT
+                s.orden,
+                s.plana,
+                s.geodesica,
+                SUM(s.plana) OVER w - s.plana AS plana_inicio,
+                SUM(s.geodesica) OVER w - s.geodesica AS geodesica_inicio
+            FROM (
+                SELECT
+                    d.path AS orden,
+                    ST_Distance(LAG(d.geom) OVER (ORDER BY d.path), d.geom) AS plana,
+                    ST_Distance(LAG(d.geom) OVER (ORDER BY d.path)::geography, d.geom::geography) AS geodesica
+                FROM ST_DumpPoints(g) AS d
+            ) AS s
+            WHERE s.plana IS NOT NULL
+            WINDOW w AS (ORDER BY s.orden)
+        ) AS a
+        WHERE a.geodesica_inicio <= distancia_m
+        ORDER BY a.orden DESC
+        LIMIT 1
+    ), 0.0);
+$$ LANGUAGE sql IMMUTABLE;
+
+-- Recalcula el índice de una capa ('red' o 'cable_corporativo'), o de ambas si p_capa es NULL
+CREATE OR REPLACE FUNCTION fn_actualizar_indice_lineal(p_capa text DEFAULT NULL)
+RETURNS integer AS
+$$
+DECLARE
+    n_filas integer := 0;
+    n_capa integer;
+BEGIN
+    IF p_capa IS NULL OR p_capa = 'red' THEN
+        DELETE FROM indice_lineal WHERE capa = 'red';
+        INSERT INTO indice_lineal (capa, elemento_id, n_vertices, longitud_total, longitudes, coordenadas)
+        SELECT 'red', r.id, i.n_vertices, i.longitud_total, i.longitudes, i.coordenadas
+        FROM red r
+        CROSS JOIN LATERAL fn_indice_lineal_geom(r.geom) AS i;
+        GET DIAGNOSTICS n_capa = ROW_COUNT;
+        n_filas := n_filas + n_capa;
+    END IF;
+
+    IF p_capa IS NULL OR p_capa = 'cable_corporativo' THEN
+        DELETE FROM indice_lineal WHERE capa = 'cable_corporativo';
+        INSERT INTO indice_lineal (capa, elemento_id, n_vertices, longitud_total, longitudes, coordenadas)
+        SELECT 'cable_corporativo', c.id, i.n_vertices, i.longitud_total, i.longitudes, i.coordenadas
+        FROM cable_corporativo c
+        CROSS JOIN LATERAL fn_indice_lineal_geom(c.geom) AS i
+        WHERE ST_NPoints(c.geom) >= 2;
+        GET DIAGNOSTICS n_capa = ROW_COUNT;
+        n_filas := n_filas + n_capa;
+    END IF;
+
+    ANALYZE indice_lineal;
+    RETURN n_filas;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Descarta el índice de un cable cuando cambia su geometría o se elimina; se vuelve a calcular
+-- en la siguiente consulta (app/db_access.py, get_indice_lineal_db)
+CREATE OR REPLACE FUNCTION fn_descartar_indice_lineal_cable()
+RETURNS trigger AS
+$$
+BEGIN
+    DELETE FROM indice_lineal WHERE capa = 'cable_corporativo' AND elemento_id = OLD.id;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS cable_corporativo_indice_lineal ON cable_corporativo;
+CREATE TRIGGER cable_corporativo_indice_lineal
+AFTER UPDATE OF geom OR DELETE ON cable_corporativo
+FOR EACH ROW EXECUTE FUNCTION fn_descartar_indice_lineal_cable();
+
+SELECT fn_actualizar_indice_lineal();
@@ -0,0 +1,28 @@
+-- Índices únicos sobre la columna generada id_texto (sql/create_columnas_generadas.sql) de las capas puntuales.
+-- Respaldan la verificación de duplicados de las inserciones (ON CONFLICT en app/db_access.py), que
+-- antes recorría la tabla completa con un SELECT y no era segura con inserciones concurrentes.
+-- Los registros sin id_texto (NULL) no entran en conflicto entre sí.
+-- cable_corporativo no se incluye: usa la clave id_text y la carga inicial tiene varias partes por cable.
+--
+-- En las bases donde estos índices se crearon sobre la expresión propiedades->>'id_texto', se
+-- reemplazan por el índice sobre la columna.
+--
+-- Si la creación falla por duplicados existentes, se pueden listar con:
+--   SELECT id_texto, array_agg(id) FROM camaras
+--   WHERE id_texto IS NOT NULL GROUP BY 1 HAVING COUNT(*) > 1;
+
+DO $$
+DECLARE
+    tabla text;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['camaras', 'empalmes', 'centrales', 'reservas'] LOOP
+        IF EXISTS (
+            SELECT 1 FROM pg_indexes
+            WHERE schemaname = current_schema() AND indexname = tabla || '_id_texto_key'
+            AND indexdef LIKE '%propiedades%'
+        ) THEN
+            EXECUTE format('DROP INDEX %I', tabla || '_id_texto_key');
+        END IF;
+        EXECUTE format('CREATE UNIQUE INDEX IF NOT EXISTS %I ON %I (id_texto)', tabla || '_id_texto_key', tabla);
+    END LOOP;
+END $$;
@@ -0,0 +1,87 @@
+-- Notificaciones de cambios en las capas por el canal 'cambios_capas' (pg_notify), que la aplicación
+-- escucha con una sola conexión por proceso (app/notificaciones.py) para enviar eventos a los mapas
+-- conectados a /api/eventos.
+--
+-- Los triggers son por sentencia y usan tablas de transición: una sentencia que toca pocos registros
+-- envía los ids, el estado, la versión y, en las capas puntuales, la geometría de cada uno (en los
+-- cables, la caja que los envuelve, para que los mapas sepan si el cambio cae en su zona); una
+-- sentencia masiva (carga inicial, sincronización, SQL manual) envía solo la capa y la cantidad, para
+-- no saturar el canal. Las notificaciones se entregan al confirmar la transacción.
+
+CREATE OR REPLACE FUNCTION fn_notificar_cambios()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    max_elementos CONSTANT integer := 20;
+    cantidad integer;
+    elementos jsonb;
+    mensaje text;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        SELECT COUNT(*) INTO cantidad FROM viejos;
+        IF cantidad <= max_elementos THEN
+            SELECT jsonb_agg(jsonb_build_object('id', v.id)) INTO elementos FROM viejos v;
+        END IF;
+    ELSE
+        SELECT COUNT(*) INTO cantidad FROM nuevos;
+        IF cantidad <= max_elementos THEN
+            SELECT jsonb_agg(
+                jsonb_build_object('id', n.id, 'estado', n.estado, 'version', n.version)
+                || CASE WHEN GeometryType(n.geom) = 'POINT'
+                        THEN jsonb_build_object('geometry', ST_AsGeoJSON(n.geom, 7)::jsonb)
+                        WHEN n.geom IS NOT NULL
+                        THEN jsonb_build_object('bbox', jsonb_build_array(
+                            round(ST_XMin(n.geom)::numeric, 7), round(ST_YMin(n.geom)::numeric, 7),
+                            round(ST_XMax(n.geom)::numeric, 7), round(ST_YMax(n.geom)::numeric, 7)
+                        ))
+                        ELSE '{}'::jsonb END
+            ) INTO elementos
+            FROM nuevos n;
+        END IF;
+    END IF;
+
+    IF cantidad = 0 THEN
+        RETURN NULL;
+    END IF;
+
+    mensaje := jsonb_build_object(
+        'capa', TG_TABLE_NAME,
+        'operacion', lower(TG_OP),
+        'cantidad', cantidad,
+        'elementos', elementos
+    )::text;
+    -- pg_notify admite hasta 8000 bytes
+    IF octet_length(mensaje) > 7900 THEN
+        mensaje := jsonb_build_object('capa', TG_TABLE_NAME, 'operacion', lower(TG_OP), 'cantidad', cantidad)::text;
+    END IF;
+    PERFORM pg_notify('cambios_capas', mensaje);
+    RETURN NULL;
+END;
+$$;
+
+DO $$
+DECLARE
+    tabla text;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['cable_corporativo', 'camaras', 'centrales', 'empalmes', 'reservas'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tabla || '_notificar_insert', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER INSERT ON %I REFERENCING NEW TABLE AS nuevos
+             FOR EACH STATEMENT EXECUTE FUNCTION fn_notificar_cambios()',
+            tabla || '_notificar_insert', tabla
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tabla || '_notificar_update', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER UPDATE ON %I REFERENCING NEW TABLE AS nuevos
+             FOR EACH STATEMENT EXECUTE FUNCTION fn_notificar_cambios()',
+            tabla || '_notificar_update', tabla
+        );
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tabla || '_notificar_delete', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER %I AFTER DELETE ON %I REFERENCING OLD TABLE AS viejos
+             FOR EACH STATEMENT EXECUTE FUNCTION fn_notificar_cambios()',
+            tabla || '_notificar_delete', tabla
+        );
+    END LOOP;
+END $$;
@@ -0,0 +1,58 @@
+-- Componentes conexas de la red de cables, precalculadas junto con la topología.
+-- Ejecutar después de sql/create_table_red.sql (cada vez que se recrea la topología).
+-- Agrega la columna componente a red_vertices_pgr y a red, y la tabla red_componentes con la
+-- longitud total de cada componente. Las funciones de ruteo usan esta información para descartar
+-- de inmediato las solicitudes imposibles y para cargar solo las aristas de la componente del origen.
+
+ALTER TABLE red_vertices_pgr ADD COLUMN IF NOT EXISTS componente bigint;
+ALTER TABLE red ADD COLUMN IF NOT EXISTS componente bigint;
+
+CREATE TABLE IF NOT EXISTS red_componentes (
+    componente bigint PRIMARY KEY,
+    longitud_total double precision NOT NULL,
+    n_aristas integer NOT NULL,
+    n_vertices integer NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS red_vertices_pgr_componente_idx ON red_vertices_pgr (componente);
+CREATE INDEX IF NOT EXISTS red_componente_idx ON red (componente);
+CREATE INDEX IF NOT EXISTS red_componentes_longitud_idx ON red_componentes (longitud_total DESC);
+
+CREATE OR REPLACE FUNCTION fn_actualizar_componentes_red()
+RETURNS void AS
+$$
+BEGIN
+    UPDATE red_vertices_pgr v
+    SET componente = c.component
+    FROM pgr_connectedComponents('SELECT id, source, target, cost, reverse_cost FROM red') AS c
+    WHERE v.id = c.node;
+
+    UPDATE red r
+    SET componente = v.componente
+    FROM red_vertices_pgr v
+    WHERE r.source = v.id;
+
+    TRUNCATE red_componentes;
+    INSERT INTO red_componentes (componente, longitud_total, n_aristas, n_vertices)
+    SELECT
+        r.componente,
+        SUM(r.cost),
+        COUNT(*),
+        (SELECT COUNT(*) FROM red_vertices_pgr v WHERE v.componente = r.componente)
+    FROM red r
+    WHERE r.componente IS NOT NULL
+    GROUP BY r.componente;
+
+    ANALYZE red_vertices_pgr;
+    ANALYZE red;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Componente principal (la de mayor longitud total de cable)
+CREATE OR REPLACE FUNCTION fn_componente_principal_red()
+RETURNS bigint AS
+$$
+    SELECT componente FROM red_componentes ORDER BY longitud_total DESC LIMIT 1;
+$$ LANGUAGE sql STABLE;
+
+SELECT fn_actualizar_componentes_red();
@@ -7,7 +7,7 @@ SELECT
     geom,
     ST_Length(geom::geography) AS cost,
     ST_Length(geom::geography) AS reverse_cost,
-    propiedades ->> 'name' AS nombre_cable
+    nombre AS nombre_cable
 FROM cable_corporativo
 WHERE ST_NPoints(geom) >= 2;
 
@@ -16,3 +16,33 @@ ALTER TABLE red ADD COLUMN IF NOT EXISTS target integer;
 
 -- No agregues source y target manualmente; los crea pgr_createTopology
 SELECT pgr_createTopology('red', 0.0001, 'geom', 'id');
+
+-- Versión de la topología: los ids de red (row_number) y de red_vertices_pgr cambian cada vez que se
+-- ejecuta este script, y las tablas recreadas reciben un oid nuevo. Las tablas derivadas guardan esta
+-- versión con cada registro y descartan los calculados sobre una topología anterior.
+CREATE OR REPLACE FUNCTION fn_version_red()
+RETURNS text
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT 'red'::regclass::oid::text || ':' || 'red_vertices_pgr'::regclass::oid::text;
+$$;
+
+-- El índice de referencia lineal de las aristas anteriores ya no corresponde a los nuevos ids: se
+-- descarta y cada arista se vuelve a indexar al consultarla (sql/create_indice_lineal.sql)
+DO $$
+BEGIN
+    IF to_regclass('indice_lineal') IS NOT NULL THEN
+        DELETE FROM indice_lineal WHERE capa = 'red';
+    END IF;
+END $$;
+
+-- Avisar a la aplicación que la red cambió, para que descarte las rutas y coberturas en caché
+SELECT pg_notify('cambios_capas', '{"capa": "red", "operacion": "recrear"}');
+
+-- Después de recrear la topología, las tablas derivadas quedan desactualizadas (se detecta con
+-- fn_version_red y las consultas no las usan hasta recalcularlas).
+-- Recalcular las componentes conexas: sql/create_red_componentes.sql
+-- y los árboles de caminos mínimos de las centrales: sql/create_arboles_centrales.sql
+-- y, si se prefiere no indexar por demanda, el índice de referencia lineal: SELECT fn_actualizar_indice_lineal('red');
+-- y las coberturas de las centrales: SELECT fn_actualizar_cobertura_centrales();
@@ -0,0 +1,28 @@
+-- Mantiene updated_at en cada UPDATE de las capas, también en las actualizaciones hechas con SQL
+-- directo (el onupdate de app/models.py solo aplica a las actualizaciones hechas con SQLAlchemy).
+-- Las exportaciones incrementales (python -m app.export_geojson --incremental) dependen de esta columna.
+
+CREATE OR REPLACE FUNCTION fn_actualizar_updated_at()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.updated_at := now();
+    RETURN NEW;
+END;
+$$;
+
+DO $$
+DECLARE
+    tabla text;
+BEGIN
+    FOREACH tabla IN ARRAY ARRAY['cable_corporativo', 'camaras', 'centrales', 'empalmes', 'reservas'] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS %I ON %I', tabla || '_updated_at', tabla);
+        EXECUTE format(
+            'CREATE TRIGGER %I BEFORE UPDATE ON %I FOR EACH ROW EXECUTE FUNCTION fn_actualizar_updated_at()',
+            tabla || '_updated_at', tabla
+        );
+        -- Índice para filtrar los registros modificados desde la última exportación
+        EXECUTE format('CREATE INDEX IF NOT EXISTS %I ON %I (updated_at)', tabla || '_updated_at_idx', tabla);
+    END LOOP;
+END $$;
@@ -0,0 +1,141 @@
+-- Polígonos de cobertura de la red de cables: área alcanzable con N metros de fibra desde un vértice.
+-- Ejecutar después de sql/create_red_componentes.sql, sql/create_indice_lineal.sql y sql/create_arboles_centrales.sql.
+-- Métodos:
+--   'buffer'  -> unión de las aristas alcanzadas con un buffer geodésico de buffer_m metros
+--   'concavo' -> envolvente cóncava de las aristas alcanzadas
+-- Las coberturas de las distancias estándar de cada central se precalculan en red_cobertura_centrales,
+-- con la versión de la topología (fn_version_red) y la geometría de la central con que se calcularon:
+-- las consultas de app/db_access.py solo devuelven las que siguen vigentes.
+
+CREATE OR REPLACE FUNCTION fn_cobertura_red(
+    nodo bigint,
+    distancia_m double precision,
+    metodo text DEFAULT 'buffer',
+    buffer_m double precision DEFAULT 50
+)
+RETURNS geometry AS
+$$
+DECLARE
+    componente_nodo bigint;
+    sql_aristas text;
+    aristas geometry;
+BEGIN
+    SELECT v.componente INTO componente_nodo FROM red_vertices_pgr v WHERE v.id = nodo;
+
+    IF componente_nodo IS NULL THEN
+        sql_aristas := 'SELECT id, source, target, cost, reverse_cost FROM red';
+    ELSE
+        sql_aristas := format(
+            'SELECT id, source, target, cost, reverse_cost FROM red WHERE componente = %s',
+            componente_nodo
+        );
+    END IF;
+
+    -- Partes alcanzadas de cada arista: desde cada extremo alcanzado se avanza lo que queda de la
+    -- distancia; si los dos tramos se tocan la arista entra completa, si no se recortan con
+    -- ST_LineSubstring (las distancias son geodésicas, ver fn_fraccion_geodesica)
+    WITH alcanzados AS (
+        SELECT dd.node, dd.agg_cost
+        FROM pgr_drivingDistance(sql_aristas, nodo, distancia_m, directed := false) AS dd
+    ),
+    tocadas AS (
+        SELECT r.id FROM red r JOIN alcanzados a ON a.node = r.source
+        UNION
+        SELECT r.id FROM red r JOIN alcanzados a ON a.node = r.target
+    ),
+    tramos AS (
+        SELECT
+            r.geom,
+            r.cost,
+            distancia_m - s.agg_cost AS hasta_desde_source,
+            r.cost - (distancia_m - t.agg_cost) AS desde_hacia_target,
+            COALESCE(distancia_m - s.agg_cost >= r.cost - (distancia_m - t.agg_cost), false) AS completa
+        FROM tocadas x
+        JOIN red r ON r.id = x.id
+        LEFT JOIN alcanzados s ON s.node = r.source
+        LEFT JOIN alcanzados t ON t.node = r.target
+    )
+    SELECT ST_Collect(p.geom)
+    INTO aristas
+    FROM tramos tr
+    CROSS JOIN LATERAL (
+        SELECT tr.geom AS geom
+        WHERE tr.completa
+        UNION ALL
+        SELECT ST_LineSubstring(tr.geom, 0, fn_fraccion_geodesica(tr.geom, tr.hasta_desde_source))
+        WHERE NOT tr.completa AND tr.hasta_desde_source > 0
+        UNION ALL
+        SELECT ST_LineSubstring(tr.geom, fn_fraccion_geodesica(tr.geom, tr.desde_hacia_target), 1)
+        WHERE NOT tr.completa AND tr.desde_hacia_target < tr.cost
+    ) AS p;
+
+    IF aristas IS NULL THEN
+        RETURN NULL;
+    END IF;
+
+    IF metodo = 'concavo' THEN
+        RETURN ST_ConcaveHull(aristas, 0.8);
+    END IF;
+    RETURN ST_Buffer(aristas::geography, buffer_m)::geometry;
+END;
+$$ LANGUAGE plpgsql STABLE;
+
+CREATE TABLE IF NOT EXISTS red_cobertura_centrales (
+    central_id integer NOT NULL,
+    distancia_m double precision NOT NULL,
+    metodo text NOT NULL,
+    geom geometry(Geometry, 4326),
+    area_km2 double precision,
+    version_red text,
+    geom_central geometry,
+    PRIMARY KEY (central_id, distancia_m, metodo)
+);
+
+-- Bases creadas antes de guardar la versión: sus coberturas quedan desactualizadas hasta recalcularlas
+ALTER TABLE red_cobertura_centrales ADD COLUMN IF NOT EXISTS version_red text;
+ALTER TABLE red_cobertura_centrales ADD COLUMN IF NOT EXISTS geom_central geometry;
+
+-- Precalcula las coberturas de todas las centrales para las distancias indicadas, reutilizando el
+-- vértice de la red al que ya se ajustó cada central (red_raices_centrales). Antes se recalculan
+-- las raíces de las centrales nuevas, movidas o calculadas sobre otra topología.
+CREATE OR REPLACE FUNCTION fn_actualizar_cobertura_centrales(
+    distancias double precision[] DEFAULT ARRAY[1000, 2000, 5000, 10000]::double precision[],
+    metodo text DEFAULT 'buffer'
+)
+RETURNS integer AS
+$$
+DECLARE
+    n_filas integer;
+    desactualizadas integer[];
+BEGIN
+    SELECT array_agg(c.id) INTO desactualizadas
+    FROM centrales c
+    WHERE c.estado IS DISTINCT FROM 'rechazado'
+      AND NOT fn_arbol_central_vigente(c.id);
+    IF desactualizadas IS NOT NULL THEN
+        PERFORM fn_actualizar_arboles_centrales(desactualizadas);
+    END IF;
+
+    DELETE FROM red_cobertura_centrales c WHERE c.metodo = fn_actualizar_cobertura_centrales.metodo;
+
+    INSERT INTO red_cobertura_centrales (central_id, distancia_m, metodo, geom, area_km2, version_red, geom_central)
+    SELECT
+        rc.central_id,
+        d.distancia_m,
+        fn_actualizar_cobertura_centrales.metodo,
+        cob.geom,
+        ST_Area(cob.geom::geography) / 1000000.0,
+        rc.version_red,
+        rc.geom_central
+    FROM red_raices_centrales rc
+    CROSS JOIN unnest(distancias) AS d(distancia_m)
+    CROSS JOIN LATERAL (
+        SELECT fn_cobertura_red(rc.nodo, d.distancia_m, fn_actualizar_cobertura_centrales.metodo) AS geom
+    ) AS cob;
+
+    GET DIAGNOSTICS n_filas = ROW_COUNT;
+    RETURN n_filas;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT fn_actualizar_cobertura_centrales();
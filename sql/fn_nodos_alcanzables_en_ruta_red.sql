@@ -8,11 +8,22 @@ DROP FUNCTION IF EXISTS fn_nodos_alcanzables_en_ruta_red(
     lat double precision,
     distancia_m double precision
 );
+DROP FUNCTION IF EXISTS fn_nodos_alcanzables_en_ruta_red(
+    lon double precision,
+    lat double precision,
+    distancia_m double precision,
+    margen_factor double precision
+);
+-- Usa las componentes de sql/create_red_componentes.sql: si la componente del nodo de origen tiene menos
+-- cable que la distancia pedida no devuelve filas sin ejecutar la búsqueda, y en caso contrario solo carga
+-- las aristas de esa componente. Con solo_componente_principal el punto se ajusta al vértice más cercano
+-- de la componente de mayor longitud.
 CREATE OR REPLACE FUNCTION fn_nodos_alcanzables_en_ruta_red(
     lon double precision,
     lat double precision,
     distancia_m double precision,
-    margen_factor double precision DEFAULT 0.999
+    margen_factor double precision DEFAULT 0.999,
+    solo_componente_principal boolean DEFAULT false
 )
 RETURNS TABLE (
     geom geometry,
@@ -21,15 +32,36 @@ RETURNS TABLE (
     nombre_cable text
 ) AS
 $$
+DECLARE
+    nodo_origen bigint;
+    componente_origen bigint;
+    longitud_componente double precision;
+    sql_aristas text;
 BEGIN
+    SELECT v.id, v.componente, c.longitud_total
+    INTO nodo_origen, componente_origen, longitud_componente
+    FROM red_vertices_pgr v
+    LEFT JOIN red_componentes c ON c.componente = v.componente
+    WHERE NOT solo_componente_principal OR v.componente = fn_componente_principal_red()
+    ORDER BY v.the_geom <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)
+    LIMIT 1;
+
+    -- Ningún nodo puede estar más lejos por la red que el total de cable de su componente
+    IF nodo_origen IS NULL OR longitud_componente < (distancia_m * margen_factor) THEN
+        RETURN;
+    END IF;
+
+    IF componente_origen IS NULL THEN
+        sql_aristas := 'SELECT id, source, target, cost, reverse_cost, nombre_cable FROM red';
+    ELSE
+        sql_aristas := format(
+            'SELECT id, source, target, cost, reverse_cost, nombre_cable FROM red WHERE componente = %s',
+            componente_origen
+        );
+    END IF;
+
     RETURN QUERY
-    WITH origen AS (
-        SELECT id AS node_id
-        FROM red_vertices_pgr
-        ORDER BY the_geom <-> ST_SetSRID(ST_MakePoint(lon, lat), 4326)
-        LIMIT 1
-    ),
-    alcance AS (
+    WITH alcance AS (
         SELECT 
             dd.node AS node_id,
             v.the_geom AS geom,
@@ -37,8 +69,8 @@ BEGIN
             r.nombre_cable
         FROM 
             pgr_drivingdistance(
-                'SELECT id, source, target, cost, reverse_cost, nombre_cable FROM red'::text,
-                CAST((SELECT node_id FROM origen) AS integer),
+                sql_aristas,
+                CAST(nodo_origen AS integer),
                 distancia_m + (distancia_m * (1-margen_factor)),  -- margen de error parametrizable
                 false
             ) AS dd
@@ -0,0 +1,94 @@
+-- Versión por lotes de fn_nodos_alcanzables_en_ruta_red: calcula los nodos alcanzables desde varios
+-- puntos de inicio con una sola llamada a pgr_drivingDistance, de modo que las aristas de red se
+-- cargan una vez por lote y no una vez por origen.
+-- Recibe: arreglos paralelos lons, lats, distancias (una posición por origen) y margen_factor
+-- Devuelve: origen (posición 1..n en los arreglos), geom, distancia_acumulada, es_mas_cercano, nombre_cable
+-- Requiere pgRouting >= 3.6 (columna start_vid en el resultado multi-origen de pgr_drivingDistance)
+-- Usa las componentes de sql/create_red_componentes.sql: los orígenes cuya componente tiene menos cable
+-- que la distancia pedida se descartan sin buscar, y solo se cargan las aristas de las componentes
+-- de los orígenes restantes.
+
+DROP FUNCTION IF EXISTS fn_nodos_alcanzables_en_ruta_red_lote(
+    lons double precision[],
+    lats double precision[],
+    distancias double precision[],
+    margen_factor double precision
+);
+CREATE OR REPLACE FUNCTION fn_nodos_alcanzables_en_ruta_red_lote(
+    lons double precision[],
+    lats double precision[],
+    distancias double precision[],
+    margen_factor double precision DEFAULT 0.999,
+    solo_componente_principal boolean DEFAULT false
+)
+RETURNS TABLE (
+    origen integer,
+    geom geometry,
+    distancia_acumulada double precision,
+    es_mas_cercano integer,
+    nombre_cable text
+) AS
+$$
+    WITH entrada AS (
+        SELECT e.ord::integer AS origen, e.lon, e.lat, e.distancia_m
+        FROM unnest(lons, lats, distancias) WITH ORDINALITY AS e(lon, lat, distancia_m, ord)
+    ),
+    origenes AS (
+        SELECT entrada.origen, entrada.distancia_m, v.id AS node_id, v.componente
+        FROM entrada
+        CROSS JOIN LATERAL (
+            SELECT rv.id, rv.componente
+            FROM red_vertices_pgr rv
+            WHERE NOT solo_componente_principal OR rv.componente = fn_componente_principal_red()
+            ORDER BY rv.the_geom <-> ST_SetSRID(ST_MakePoint(entrada.lon, entrada.lat), 4326)
+            LIMIT 1
+        ) AS v
+        LEFT JOIN red_componentes c ON c.componente = v.componente
+        -- Ningún nodo puede estar más lejos por la red que el total de cable de su componente
+        WHERE c.longitud_total IS NULL OR c.longitud_total >= (entrada.distancia_m * margen_factor)
+    ),
+    alcance AS (
+        SELECT
+            dd.start_vid AS node_origen,
+            v.the_geom AS geom,
+            dd.agg_cost AS distancia_acumulada,
+            r.nombre_cable
+        FROM
+            pgr_drivingDistance(
+                (SELECT CASE
+                    WHEN bool_or(origenes.componente IS NULL)
+                    THEN 'SELECT id, source, target, cost, reverse_cost FROM red'
+                    ELSE format(
+                        'SELECT id, source, target, cost, reverse_cost FROM red WHERE componente = ANY(%L::bigint[])',
+                        array_agg(DISTINCT origenes.componente)
+                    )
+                 END FROM origenes),
+                (SELECT array_agg(DISTINCT origenes.node_id) FROM origenes),
+                -- la distancia máxima del lote, con el mismo margen de error que la versión individual
+                (SELECT MAX(origenes.distancia_m + (origenes.distancia_m * (1 - margen_factor))) FROM origenes),
+                directed := false,
+                equicost := false
+            ) AS dd
+        JOIN red r ON dd.edge = r.id
+        JOIN red_vertices_pgr AS v ON dd.node = v.id
+    ),
+    por_origen AS (
+        SELECT o.origen, o.distancia_m, a.geom, a.distancia_acumulada, a.nombre_cable
+        FROM origenes o
+        JOIN alcance a ON a.node_origen = o.node_id
+        WHERE a.distancia_acumulada >= (o.distancia_m * margen_factor)
+          AND a.distancia_acumulada <= o.distancia_m + (o.distancia_m * (1 - margen_factor))
+    )
+    SELECT
+        p.origen,
+        p.geom,
+        p.distancia_acumulada,
+        CASE
+            WHEN ABS(p.distancia_acumulada - p.distancia_m)
+                 = MIN(ABS(p.distancia_acumulada - p.distancia_m)) OVER (PARTITION BY p.origen)
+            THEN 1 ELSE 0
+        END AS es_mas_cercano,
+        p.nombre_cable
+    FROM por_origen p
+    ORDER BY p.origen, p.distancia_acumulada;
+$$ LANGUAGE sql STABLE;
@@ -0,0 +1,95 @@
+-- Ruta más corta entre dos vértices de la red de cables (tabla red / red_vertices_pgr).
+-- Usa búsqueda bidireccional (pgr_bdDijkstra) y limita primero las aristas a la caja que envuelve
+-- ambos vértices más un margen, lo que evita cargar toda la red en el caso habitual. Una ruta que
+-- sale de la caja recorre al menos dos veces el margen (ida hasta el borde y vuelta), de modo que la
+-- ruta dentro de la caja solo es la más corta si cuesta menos que eso; si no, o si no hay ruta dentro
+-- de la caja, se repite la búsqueda sobre la red completa. El margen crece con la distancia en línea
+-- recta entre los vértices (la ruta nunca es más corta que ella), de modo que en las rutas largas la
+-- caja alcanza para aceptar rutas de hasta el doble de esa distancia y la segunda búsqueda queda
+-- para los desvíos excepcionales.
+-- Recibe: origen, destino (ids de red_vertices_pgr), margen_m (margen mínimo de la caja en metros)
+-- Devuelve: una fila por arista recorrida, en orden, con su geometría, costo y nombre del cable
+
+CREATE OR REPLACE FUNCTION fn_ruta_entre_vertices(
+    origen bigint,
+    destino bigint,
+    margen_m double precision DEFAULT 2000
+)
+RETURNS TABLE (
+    seq integer,
+    edge bigint,
+    geom geometry,
+    costo double precision,
+    costo_acumulado double precision,
+    nombre_cable text
+) AS
+$$
+DECLARE
+    caja geometry;
+    sql_aristas text;
+    distancia_recta double precision;
+    latitud_max double precision;
+    margen double precision;
+    secuencias integer[];
+    aristas bigint[];
+    costos double precision[];
+    acumulados double precision[];
+    costo_total double precision;
+BEGIN
+    SELECT ST_Envelope(ST_Collect(v.the_geom)), MAX(abs(ST_Y(v.the_geom)))
+    INTO caja, latitud_max
+    FROM red_vertices_pgr v
+    WHERE v.id IN (origen, destino);
+
+    SELECT ST_Distance(o.the_geom::geography, d.the_geom::geography)
+    INTO distancia_recta
+    FROM red_vertices_pgr o, red_vertices_pgr d
+    WHERE o.id = origen AND d.id = destino;
+
+    IF caja IS NOT NULL THEN
+        margen := GREATEST(margen_m, distancia_recta);
+        -- Caja ampliada con el margen: un grado de latitud mide al menos 110574 m y uno de longitud
+        -- 111320 m por el coseno de la latitud, que se toma en el extremo más alejado del ecuador
+        caja := ST_Expand(
+            caja,
+            margen / (111320.0 * GREATEST(cos(radians(LEAST(latitud_max + margen / 110574.0, 89.0))), 0.01)),
+            margen / 110574.0
+        );
+    END IF;
+
+    IF caja IS NOT NULL THEN
+        sql_aristas := format(
+            'SELECT id, source, target, cost, reverse_cost FROM red WHERE geom && ST_MakeEnvelope(%s, %s, %s, %s, 4326)',
+            ST_XMin(caja), ST_YMin(caja), ST_XMax(caja), ST_YMax(caja)
+        );
+
+        -- La última fila (edge = -1) tiene en agg_cost el costo total de la ruta
+        SELECT array_agg(d.seq ORDER BY d.seq), array_agg(d.edge ORDER BY d.seq),
+               array_agg(d.cost ORDER BY d.seq), array_agg(d.agg_cost ORDER BY d.seq),
+               MAX(d.agg_cost)
+        INTO secuencias, aristas, costos, acumulados, costo_total
+        FROM pgr_bdDijkstra(sql_aristas, origen, destino, directed := false) AS d;
+
+        IF costo_total IS NOT NULL AND costo_total <= 2 * margen THEN
+            RETURN QUERY
+            SELECT u.seq, u.edge, r.geom, u.cost, u.agg_cost, r.nombre_cable
+            FROM unnest(secuencias, aristas, costos, acumulados) AS u(seq, edge, cost, agg_cost)
+            JOIN red r ON u.edge = r.id
+            ORDER BY u.seq;
+            RETURN;
+        END IF;
+    END IF;
+
+    -- La ruta puede salir de la caja (o los vértices no existen): buscar sobre la red completa
+    RETURN QUERY
+    SELECT d.seq, d.edge, r.geom, d.cost, d.agg_cost, r.nombre_cable
+    FROM pgr_bdDijkstra(
+        'SELECT id, source, target, cost, reverse_cost FROM red',
+        origen,
+        destino,
+        directed := false
+    ) AS d
+    JOIN red r ON d.edge = r.id
+    ORDER BY d.seq;
+END;
+$$ LANGUAGE plpgsql;
@@ -1,3 +1,5 @@
+-- Los filtros usan las columnas generadas es_troncal y nombre (sql/create_columnas_generadas.sql)
+
 -- Función base: solo filtra por distancia y troncales
 CREATE OR REPLACE FUNCTION get_cables_cercanos_simple(
     IN p_lon DOUBLE PRECISION,
@@ -39,7 +41,7 @@ BEGIN
     FROM 
         cable_corporativo cc
     WHERE
-        (p_incluir_troncales OR cc.propiedades ->> 'colocacion' NOT LIKE 'Troncal%')
+        (p_incluir_troncales OR NOT cc.es_troncal)
         AND ST_DWithin(
             cc.geom::geography,
             ST_SetSRID(ST_MakePoint(p_lon, p_lat), 4326)::geography,
@@ -97,7 +99,7 @@ BEGIN
     FROM 
         cable_corporativo cc
     WHERE
-        (p_incluir_troncales OR cc.propiedades ->> 'colocacion' NOT LIKE 'Troncal%')
+        (p_incluir_troncales OR NOT cc.es_troncal)
         AND ST_DWithin(
             cc.geom::geography,
             ST_SetSRID(ST_MakePoint(p_lon, p_lat), 4326)::geography,
@@ -105,8 +107,8 @@ BEGIN
         )
         AND (
             p_nombre_cable IS NULL
-            OR (p_busqueda_exacta = TRUE AND cc.propiedades ->> 'name' = p_nombre_cable)
-            OR (p_busqueda_exacta = FALSE AND cc.propiedades ->> 'name' ILIKE '%' || p_nombre_cable || '%')
+            OR (p_busqueda_exacta = TRUE AND cc.nombre = p_nombre_cable)
+            OR (p_busqueda_exacta = FALSE AND cc.nombre ILIKE '%' || p_nombre_cable || '%')
         )
     ORDER BY
         ST_Distance(
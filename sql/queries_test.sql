@@ -43,6 +43,7 @@ SELECT current_user, session_user;
 
 
 SELECT linea, punto FROM fn_linea_en_ruta_red(-74.145085, 4.668443, 2000, false);
+SELECT linea, ST_NumGeometries(puntos) FROM fn_linea_en_ruta_red_v2(-74.145085, 4.668443, 2000, true);
 SELECT * FROM fn_nodos_alcanzables_en_ruta_red(-74.145085, 4.668443, 2650);
 
 select * from get_cables_cercanos(-74.145085, 4.668443, 2000, 100, false, null, null);
\ No newline at end of file